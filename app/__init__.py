@@ -5,6 +5,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_mail import Mail
 from flask_apscheduler import APScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from dotenv import load_dotenv
 
 # Built-in Python Import
@@ -43,6 +44,13 @@ Bootstrap(app)
 db.init_app(app)
 bcrypt.init_app(app)
 mail.init_app(app)
+
+# Keep scheduled jobs (e.g., exam closing timers) in the app's database, so they survive restarts.
+# Jobs that should have run while the app was down still run once on startup.
+with app.app_context():
+    app.config['SCHEDULER_JOBSTORES'] = {'default': SQLAlchemyJobStore(engine=db.engine)}
+app.config['SCHEDULER_JOB_DEFAULTS'] = {'coalesce': True, 'misfire_grace_time': None}
+
 scheduler.init_app(app)
 
 # Error handlers
@@ -63,6 +71,10 @@ from .view_result.view_exams import exam_viewBp
 from .exam_create import exam_createBp
 from app.manual_grading.grading_ui import gradingUiBp
 from app.manual_grading.manual_grading import manualGradingBp
+from app.database import init_sqlite_profile
+
+# WAL journaling and tuned pragmas for every connection of the SQLAlchemy engine
+init_sqlite_profile()
 
 
 
@@ -0,0 +1,233 @@
+"""
+Shared SQLite Connection Layer
+
+Raw `sqlite3` access for the modules that don't go through the SQLAlchemy models
+(exam authoring, results, manual grading).
+
+- Connections open the same database file as SQLAlchemy (SQLALCHEMY_DATABASE_URI)
+- Connections are pooled and reused across requests, pragmas are applied once per connection
+- A checked out connection belongs to one thread until `close()` returns it to the pool
+- Connections a request forgets to close are returned when its app context ends
+- Checkouts are counted and timed per request, see `pool_stats`
+- `begin_immediate` starts a transaction holding the write lock, for read-then-write changes
+
+SQLite profile:
+With SQLITE_PROFILE=production (the default), both these connections and the
+SQLAlchemy engine use WAL journaling, so readers don't block on writers, plus a
+busy timeout and larger page cache/memory map. Commits that still hit SQLITE_BUSY
+are retried with a short backoff (`PooledConnection.commit`, `retry_on_busy`).
+"""
+
+# Third-party imports
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+# Built-in Python imports
+from functools import wraps
+import sqlite3
+import threading
+import time
+import os
+
+# Local Imports
+from app import app, db
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
+DB_SLOW_CHECKOUT = float(os.getenv('DB_SLOW_CHECKOUT', 1.0))
+
+SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'production')
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+SQLITE_BUSY_RETRIES = int(os.getenv('SQLITE_BUSY_RETRIES', 3))
+
+# Pragmas of the production profile, applied once to every new connection
+PRODUCTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT};",
+    "PRAGMA mmap_size = 268435456;",  # 256 MB
+    "PRAGMA cache_size = -32000;",    # 32 MB
+)
+
+_idle = {}
+_lock = threading.Lock()
+_stats = {"connects": 0, "checkouts": 0, "returns": 0, "discarded": 0, "hold_time": 0.0, "max_hold_time": 0.0}
+
+
+class PooledConnection:
+    """
+    A pooled `sqlite3.Connection`.
+    - Behaves like the wrapped connection
+    - `close()` rolls back anything uncommitted and returns it to the pool instead of closing it
+    """
+
+    def __init__(self, path, conn):
+        self._path = path
+        self._conn = conn
+        self._checked_out_at = None
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        # A commit that failed with SQLITE_BUSY keeps its transaction open, so it can simply be repeated
+        _retry_on_busy(self._conn.commit)
+
+    def _checkout(self):
+        self._checked_out_at = time.perf_counter()
+        return self
+
+    def close(self):
+        if self._checked_out_at is None:
+            return
+
+        held = time.perf_counter() - self._checked_out_at
+        self._checked_out_at = None
+
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+        with _lock:
+            _stats["returns"] += 1
+            _stats["hold_time"] += held
+            _stats["max_hold_time"] = max(_stats["max_hold_time"], held)
+
+            idle = _idle.setdefault(self._path, [])
+            if len(idle) < DB_POOL_SIZE:
+                idle.append(self)
+                pooled = True
+            else:
+                _stats["discarded"] += 1
+                pooled = False
+
+        if not pooled:
+            self._conn.close()
+
+        if held > DB_SLOW_CHECKOUT:
+            print(f"[DB] Connection held for {held:.3f}s")
+
+
+def database_path():
+    """Returns the path of the SQLite database file SQLAlchemy is configured with."""
+    return db.engine.url.database
+
+
+def apply_sqlite_profile(conn):
+    """Applies the configured SQLite profile's pragmas to a new DB-API connection."""
+    if SQLITE_PROFILE != "production":
+        return
+
+    cursor = conn.cursor()
+    for pragma in PRODUCTION_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def init_sqlite_profile():
+    """Makes the SQLAlchemy engine apply the SQLite profile to each connection it opens."""
+    with app.app_context():
+        event.listen(db.engine, "connect", lambda dbapi_conn, record: apply_sqlite_profile(dbapi_conn))
+
+
+def is_busy_error(error):
+    """Whether the error is SQLite reporting a locked/busy database."""
+    if isinstance(error, OperationalError):
+        error = error.orig
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def _retry_on_busy(func, *args, on_retry=None, **kwargs):
+    for attempt in range(SQLITE_BUSY_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except (sqlite3.OperationalError, OperationalError) as e:
+            if attempt == SQLITE_BUSY_RETRIES or not is_busy_error(e):
+                raise
+
+            print(f"[DB] Database busy, retrying {func.__name__} ({attempt + 1}/{SQLITE_BUSY_RETRIES})")
+            if on_retry:
+                on_retry()
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def retry_on_busy(func):
+    """
+    Decorator for functions that write through the SQLAlchemy session and commit.
+    - If SQLite reports the database as busy, the session is rolled back and the whole function runs again
+    - The function must be safe to run more than once
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return _retry_on_busy(func, *args, on_retry=db.session.rollback, **kwargs)
+
+    return wrapper
+
+
+def begin_immediate(conn):
+    """
+    Starts a transaction on a `get_db()` connection that takes the write lock up front,
+    so nothing can change between its reads and writes (no-op inside a transaction).
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT / 1000)
+    conn.row_factory = sqlite3.Row
+
+    # Applied once, for the whole lifetime of the connection
+    conn.execute("PRAGMA foreign_keys = ON;")
+    apply_sqlite_profile(conn)
+
+    with _lock:
+        _stats["connects"] += 1
+    return PooledConnection(path, conn)
+
+
+def get_db():
+    """Checks out a connection with Row factory for dict-like access. Call `close()` to return it."""
+    path = database_path()
+
+    with _lock:
+        idle = _idle.get(path)
+        pooled = idle.pop() if idle else None
+        _stats["checkouts"] += 1
+
+    conn = (pooled or _connect(path))._checkout()
+
+    # Remember the checkout, so it can be returned when the request ends
+    if has_app_context():
+        g.setdefault("db_connections", []).append(conn)
+
+    return conn
+
+
+def row_to_dict(row):
+    """Convert SQLite Row object to dictionary."""
+    return {k: row[k] for k in row.keys()}
+
+
+def pool_stats():
+    """Returns a snapshot of the pool's counters."""
+    with _lock:
+        stats = dict(_stats)
+        stats["idle"] = sum(len(idle) for idle in _idle.values())
+    return stats
+
+
+@app.teardown_appcontext
+def return_connections(exception=None):
+    """Returns the connections checked out during the app context and logs slow or leaky requests."""
+    connections = g.pop("db_connections", [])
+    leaked = [conn for conn in connections if conn._checked_out_at is not None]
+
+    for conn in leaked:
+        conn.close()
+
+    if leaked:
+        print(f"[DB] {len(leaked)} of {len(connections)} connections were not closed by the request, returned them to the pool")
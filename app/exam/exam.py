@@ -1,4 +1,3 @@
-import sqlite3
 import json
 from datetime import datetime
 from flask_login import login_required
@@ -14,6 +13,11 @@ from flask import (
 )
 
 from .form import ExamCreateForm
+from app import app
+from app.database import get_db, row_to_dict
+from app.exam_cache import bump_exam_version
+from app.exam_stats import record_submissions
+from app.scheduler import schedule_exam_close
 
 
 # Blueprint
@@ -25,20 +29,6 @@ examBp = Blueprint(
 )
 
 
-# -----------------------------
-# DB Helper
-# -----------------------------
-def get_db():
-    conn = sqlite3.connect("oesDB.db")
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
-
-
-def row_to_dict(row):
-    return {k: row[k] for k in row.keys()}
-
-
 # -----------------------------
 # Helper Functions
 # -----------------------------
@@ -81,6 +71,65 @@ def _normalize_security_settings(security_settings):
     return json.dumps([])
 
 
+def _refresh_exam_totals(cur, exam_id=None):
+    """Recompute the stored total_points and question_count of one exam (all if None)."""
+    sql = """
+        UPDATE exams
+        SET total_points = (SELECT COALESCE(SUM(points), 0) FROM questions q WHERE q.exam_id = exams.exam_id),
+            question_count = (SELECT COUNT(*) FROM questions q WHERE q.exam_id = exams.exam_id)
+    """
+    if exam_id is None:
+        cur.execute(sql)
+    else:
+        cur.execute(sql + " WHERE exam_id = ?", (exam_id,))
+    return cur.rowcount
+
+
+def _refresh_submission_totals(cur, submission_ids):
+    """
+    Recompute the total_score of the handed-in submissions among these from their answers.
+    A changed total is a grading change, so it increments the submission's version.
+    """
+    if not submission_ids:
+        return
+
+    placeholders = ", ".join("?" for _ in submission_ids)
+    cur.execute(
+        f"""
+        UPDATE submissions
+        SET total_score = totals.total,
+            version = version + (total_score IS NOT totals.total),
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT s.submission_id, (
+                SELECT COALESCE(SUM(COALESCE(final_points, manual_points, auto_points, 0)), 0)
+                FROM submission_answers sa
+                WHERE sa.submission_id = s.submission_id
+            ) AS total
+            FROM submissions s
+            WHERE s.submission_id IN ({placeholders}) AND s.status != 'IN_PROGRESS'
+        ) AS totals
+        WHERE submissions.submission_id = totals.submission_id
+        """,
+        submission_ids,
+    )
+
+
+# -----------------------------
+# Repair Exam Totals (CLI)
+# -----------------------------
+@app.cli.command("repair-exam-totals")
+def repair_exam_totals():
+    """Recompute total_points and question_count of every exam."""
+    conn = get_db()
+    cur = conn.cursor()
+    repaired = _refresh_exam_totals(cur)
+    conn.commit()
+    conn.close()
+
+    print(f"[Exams] Recomputed totals of {repaired} exams")
+
+
 # -----------------------------
 # Create Exam (Internal Logic)
 # -----------------------------
@@ -151,6 +200,9 @@ def _create_exam_in_db(course_code, instructor_email, title, opens_at, closes_at
     conn.commit()
     conn.close()
 
+    # Stored times are truncated to the minute, the timer must match them
+    schedule_exam_close(exam_id, closes_dt.replace(second=0, microsecond=0))
+
     return True, {"exam_id": exam_id}, 201
 
 
@@ -312,8 +364,10 @@ def add_question_ui(exam_id):
                 1 if opt["is_correct"] else 0
             ))
 
+        _refresh_exam_totals(cur, exam_id)
         conn.commit()
         conn.close()
+        bump_exam_version(exam_id)
 
         flash("Question added!", "success")
         return redirect(url_for("examBp.edit_exam_ui", exam_id=exam_id))
@@ -524,6 +578,7 @@ def set_availability_ui(exam_id):
 
         conn.commit()
         conn.close()
+        schedule_exam_close(exam_id, closes_dt.replace(second=0, microsecond=0))
 
         flash("Availability updated!", "success")
         return redirect(url_for("examBp.edit_exam_ui", exam_id=exam_id))
@@ -568,6 +623,7 @@ def reorder_questions(exam_id):
 
     conn.commit()
     conn.close()
+    bump_exam_version(exam_id)
 
     return jsonify(message="Order updated"), 200
 
@@ -629,8 +685,11 @@ def edit_question_ui(question_id):
                     VALUES (?, ?, ?)
                 """, (question_id, txt, 1 if is_correct else 0))
 
+        _refresh_exam_totals(cur2, exam_id)
         conn2.commit()
         conn2.close()
+        conn.close()
+        bump_exam_version(exam_id)
 
         flash("Question updated!", "success")
         return redirect(url_for("examBp.edit_exam_ui", exam_id=exam_id))
@@ -659,11 +718,23 @@ def delete_question_ui(question_id):
 
     exam_id = row["exam_id"]
 
+    cur.execute("SELECT submission_id FROM submission_answers WHERE question_id = ?", (question_id,))
+    answered_ids = [r["submission_id"] for r in cur.fetchall()]
+
+    # Answers to the question go with it, so they're no longer summed into scores
+    cur.execute("DELETE FROM submission_answers WHERE question_id = ?", (question_id,))
     cur.execute("DELETE FROM options WHERE question_id = ?", (question_id,))
     cur.execute("DELETE FROM questions WHERE question_id = ?", (question_id,))
+    cur.execute("DELETE FROM question_stats WHERE question_id = ?", (question_id,))
+    _refresh_exam_totals(cur, exam_id)
+
+    # Scores already handed in lose the question's points, in the totals and in the exam statistics
+    _refresh_submission_totals(cur, answered_ids)
+    record_submissions(conn, answered_ids)
 
     conn.commit()
     conn.close()
+    bump_exam_version(exam_id)
 
     flash("Question deleted", "success")
     return redirect(url_for("examBp.edit_exam_ui", exam_id=exam_id))
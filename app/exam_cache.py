@@ -0,0 +1,82 @@
+"""
+Exam Content Cache
+
+Process-local, LRU-bounded caches for data derived from an exam's questions and
+options (answer keys, papers, ...).
+
+Every exam has a content version stamp that starts at 0 when the process starts.
+The exam authoring routes bump it whenever they change questions or options, and
+cached entries built for an older version are rebuilt on their next lookup.
+
+Note: stamps live in process memory, so they are only valid while the app runs
+as a single process (which is how `run.py` starts it).
+"""
+
+# Built-in Python imports
+from collections import OrderedDict
+import threading
+import os
+
+EXAM_CACHE_SIZE = int(os.getenv('EXAM_CACHE_SIZE', 128))
+
+_versions = {}
+_versions_lock = threading.Lock()
+_caches = []
+
+
+def get_exam_version(exam_id):
+    """Returns the current content version of an exam."""
+    return _versions.get(exam_id, 0)
+
+
+def bump_exam_version(exam_id):
+    """Marks every cached entry of the exam as outdated."""
+    with _versions_lock:
+        _versions[exam_id] = _versions.get(exam_id, 0) + 1
+        return _versions[exam_id]
+
+
+class ExamCache:
+    """
+    LRU-bounded mapping of (exam_id, *extra key parts) to a cached value.
+    - Entries remember the exam version they were built for
+    - Outdated entries are rebuilt with the given loader on lookup
+    """
+
+    def __init__(self, maxsize=EXAM_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.append(self)
+
+    def get(self, exam_id, loader, *extra_key):
+        key = (exam_id, *extra_key)
+
+        # Read the version before loading, so an edit during loading still invalidates the entry
+        version = get_exam_version(exam_id)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = loader()
+
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def reset_exam_caches():
+    """Empties every exam cache, e.g., after the database was rebuilt outside the app."""
+    for cache in _caches:
+        cache.clear()
@@ -0,0 +1,318 @@
+"""
+Exam Statistics
+
+Running statistics of the handed-in submissions of each exam, so instructors can
+see score distribution, question difficulty and option choices without reading
+every submission.
+
+- `exam_stats`: Number of submissions, sum and sum of squares of the scores, and a
+  histogram of the scores in whole points (for the median)
+- `question_stats`: Number of answers, correct answers and sum of points per question,
+  and how often each option was selected
+
+Statistics are updated incrementally when a submission is handed in, when its
+review is saved, and when a question it answered is deleted. Every submission remembers what was counted for it
+(`submissions.stats_score`, `submission_answers.stats_points`), so recording it
+again replaces its earlier contribution instead of adding to it.
+
+Functions:
+- `record_submissions`: Adds (or updates) the contribution of some submissions.
+- `record_session_submissions`: Same, within the SQLAlchemy session's transaction.
+- `load_exam_stats`: Summary of an exam's statistics, with per-question numbers.
+- `rebuild_exam_stats`: Recounts the statistics from scratch.
+"""
+
+# Built-in Python imports
+from collections import Counter, defaultdict
+import json
+import math
+
+# Local Imports
+from app import app, db
+from app.database import get_db
+
+STATS_REBUILD_BATCH_SIZE = 500
+
+_upsert_exam_stats = """
+    INSERT INTO exam_stats (exam_id, submission_count, score_sum, score_sq_sum, updated_at)
+    VALUES (:exam_id, :submission_count, :score_sum, :score_sq_sum, CURRENT_TIMESTAMP)
+    ON CONFLICT (exam_id) DO UPDATE SET
+        submission_count = submission_count + excluded.submission_count,
+        score_sum = score_sum + excluded.score_sum,
+        score_sq_sum = score_sq_sum + excluded.score_sq_sum,
+        updated_at = excluded.updated_at
+"""
+
+_upsert_question_stats = """
+    INSERT INTO question_stats (question_id, exam_id, answer_count, correct_count, points_sum)
+    VALUES (:question_id, :exam_id, :answer_count, :correct_count, :points_sum)
+    ON CONFLICT (question_id) DO UPDATE SET
+        answer_count = answer_count + excluded.answer_count,
+        correct_count = correct_count + excluded.correct_count,
+        points_sum = points_sum + excluded.points_sum
+"""
+
+
+def _increment_json(table, column, key_column):
+    """Statement adding :n to the JSON counter at :path, dropping counters that reach zero."""
+    return f"""
+        UPDATE {table}
+        SET {column} = CASE
+            WHEN COALESCE(json_extract({column}, :path), 0) + :n = 0 THEN json_remove({column}, :path)
+            ELSE json_set({column}, :path, COALESCE(json_extract({column}, :path), 0) + :n)
+        END
+        WHERE {key_column} = :key
+    """
+
+
+_increment_histogram = _increment_json("exam_stats", "score_histogram", "exam_id")
+_increment_option_count = _increment_json("question_stats", "option_counts", "question_id")
+
+
+def _bucket(score):
+    """Histogram bucket of a score: its whole points (same as CAST(score AS INTEGER))."""
+    return int(score)
+
+
+def _placeholders(values):
+    return ", ".join("?" for _ in values)
+
+
+def record_submissions(conn, submission_ids):
+    """
+    - Adds the current scores and answers of the handed-in submissions to their exams' statistics,
+      replacing what was counted for them before (submissions in progress are skipped)
+    - `conn` is a DB-API connection; call it after a write in the same transaction, so the
+      counted state can't change underneath
+    - Changes are committed by the caller
+    """
+    submission_ids = list(submission_ids)
+    if not submission_ids:
+        return
+
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT submission_id, exam_id, COALESCE(total_score, 0), stats_score
+        FROM submissions
+        WHERE submission_id IN ({_placeholders(submission_ids)}) AND status != 'IN_PROGRESS'
+    """, submission_ids)
+    submissions = cur.fetchall()
+    if not submissions:
+        return
+
+    counted_ids = [submission_id for submission_id, *_ in submissions]
+    cur.execute(f"""
+        SELECT sa.submission_id, sa.question_id, q.exam_id, q.points, sa.selected_option_ids,
+            COALESCE(sa.final_points, sa.manual_points, sa.auto_points, 0), sa.stats_points
+        FROM submission_answers sa
+        JOIN questions q ON q.question_id = sa.question_id
+        WHERE sa.submission_id IN ({_placeholders(counted_ids)})
+    """, counted_ids)
+    answers = cur.fetchall()
+
+    # Differences to what is counted now
+    exam_deltas = defaultdict(Counter)
+    histogram_deltas = Counter()
+    for submission_id, exam_id, score, counted in submissions:
+        if counted == score:
+            continue
+
+        delta = exam_deltas[exam_id]
+        if counted is not None:
+            delta["submission_count"] -= 1
+            delta["score_sum"] -= counted
+            delta["score_sq_sum"] -= counted * counted
+            histogram_deltas[exam_id, _bucket(counted)] -= 1
+
+        delta["submission_count"] += 1
+        delta["score_sum"] += score
+        delta["score_sq_sum"] += score * score
+        histogram_deltas[exam_id, _bucket(score)] += 1
+
+    question_deltas = defaultdict(Counter)
+    question_exams = {}
+    option_deltas = Counter()
+    changed_answers = []
+    for submission_id, question_id, exam_id, max_points, selected, points, counted in answers:
+        if counted == points:
+            continue
+
+        question_exams[question_id] = exam_id
+        delta = question_deltas[question_id]
+        if counted is None:
+            # Selections don't change after handing in, they're counted once
+            delta["answer_count"] += 1
+            for option_id in json.loads(selected or "[]") or []:
+                option_deltas[question_id, option_id] += 1
+        else:
+            delta["correct_count"] -= counted >= max_points
+            delta["points_sum"] -= counted
+
+        delta["correct_count"] += points >= max_points
+        delta["points_sum"] += points
+        changed_answers.append({"submission_id": submission_id, "question_id": question_id, "points": points})
+
+    if exam_deltas:
+        cur.executemany(_upsert_exam_stats, [
+            {"exam_id": exam_id, "submission_count": 0, "score_sum": 0, "score_sq_sum": 0, **delta}
+            for exam_id, delta in exam_deltas.items()
+        ])
+        cur.executemany(_increment_histogram, [
+            {"key": exam_id, "path": f'$."{bucket}"', "n": n}
+            for (exam_id, bucket), n in histogram_deltas.items() if n
+        ])
+        cur.execute(f"""
+            UPDATE submissions SET stats_score = COALESCE(total_score, 0)
+            WHERE submission_id IN ({_placeholders(counted_ids)})
+        """, counted_ids)
+
+    if question_deltas:
+        cur.executemany(_upsert_question_stats, [
+            {"question_id": question_id, "exam_id": question_exams[question_id],
+             "answer_count": 0, "correct_count": 0, "points_sum": 0, **delta}
+            for question_id, delta in question_deltas.items()
+        ])
+        cur.executemany(_increment_option_count, [
+            {"key": question_id, "path": f'$."{option_id}"', "n": n}
+            for (question_id, option_id), n in option_deltas.items() if n
+        ])
+        cur.executemany("""
+            UPDATE submission_answers SET stats_points = :points
+            WHERE submission_id = :submission_id AND question_id = :question_id
+        """, changed_answers)
+
+
+def record_session_submissions(submission_ids):
+    """`record_submissions` on the connection of the SQLAlchemy session, after flushing its pending changes."""
+    db.session.flush()
+    record_submissions(db.session.connection().connection.driver_connection, submission_ids)
+
+
+def _median(histogram, count):
+    """Median score from the {bucket: count} histogram (exact for whole-point scores)."""
+    if not count:
+        return None
+
+    # 0-based positions of the middle value(s)
+    middle = sorted({(count - 1) // 2, count // 2})
+    values = []
+    seen = 0
+    for bucket, n in sorted((int(bucket), n) for bucket, n in histogram.items()):
+        values += [bucket for position in middle if seen <= position < seen + n]
+        seen += n
+
+    return sum(values) / len(values)
+
+
+def load_exam_stats(conn, exam_id):
+    """
+    - Returns the exam's statistics, or None if no submission was counted yet
+    - Reads one row per question and option, independent of the number of submissions
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM exam_stats WHERE exam_id = ?", (exam_id,))
+    row = cur.fetchone()
+    if not row or not row["submission_count"]:
+        return None
+
+    count = row["submission_count"]
+    histogram = json.loads(row["score_histogram"] or "{}")
+    mean = row["score_sum"] / count
+    variance = max(row["score_sq_sum"] / count - mean * mean, 0.0)
+
+    cur.execute("""
+        SELECT q.question_id, q.question_text, q.points, q.order_index,
+            COALESCE(qs.answer_count, 0) AS answer_count,
+            COALESCE(qs.correct_count, 0) AS correct_count,
+            COALESCE(qs.points_sum, 0) AS points_sum,
+            COALESCE(qs.option_counts, '{}') AS option_counts
+        FROM questions q
+        LEFT JOIN question_stats qs ON qs.question_id = q.question_id
+        WHERE q.exam_id = ?
+        ORDER BY q.order_index, q.question_id
+    """, (exam_id,))
+    questions = cur.fetchall()
+
+    cur.execute("""
+        SELECT o.question_id, o.option_id, o.option_text, o.is_correct
+        FROM options o
+        JOIN questions q ON q.question_id = o.question_id
+        WHERE q.exam_id = ?
+        ORDER BY o.option_id
+    """, (exam_id,))
+    options = defaultdict(list)
+    for option in cur.fetchall():
+        options[option["question_id"]].append(option)
+
+    question_stats = []
+    for q in questions:
+        answered = q["answer_count"]
+        option_counts = json.loads(q["option_counts"])
+        question_stats.append({
+            "question_id": q["question_id"],
+            "question_text": q["question_text"],
+            "points": q["points"],
+            "answer_count": answered,
+            "correct_count": q["correct_count"],
+            # Share of answers that were correct, lower means harder
+            "difficulty": q["correct_count"] / answered if answered else None,
+            "mean_points": q["points_sum"] / answered if answered else None,
+            "options": [
+                {
+                    "option_id": option["option_id"],
+                    "option_text": option["option_text"],
+                    "is_correct": bool(option["is_correct"]),
+                    "count": option_counts.get(str(option["option_id"]), 0),
+                }
+                for option in options[q["question_id"]]
+            ],
+        })
+
+    return {
+        "exam_id": exam_id,
+        "submission_count": count,
+        "mean": mean,
+        "median": _median(histogram, count),
+        "std_dev": math.sqrt(variance),
+        "histogram": {int(bucket): n for bucket, n in histogram.items()},
+        "updated_at": row["updated_at"],
+        "questions": question_stats,
+    }
+
+
+def rebuild_exam_stats(conn, exam_id=None):
+    """
+    - Clears the statistics of one exam (all if None) and counts its handed-in submissions again
+    - Needed after question points or correct options are edited
+    - Returns the number of submissions counted, changes are committed by the caller
+    """
+    scope, params = ("WHERE exam_id = ?", [exam_id]) if exam_id is not None else ("", [])
+
+    cur = conn.cursor()
+    cur.execute(f"DELETE FROM exam_stats {scope}", params)
+    cur.execute(f"DELETE FROM question_stats {scope}", params)
+    cur.execute(f"UPDATE submissions SET stats_score = NULL {scope}", params)
+    cur.execute(f"""
+        UPDATE submission_answers SET stats_points = NULL
+        WHERE submission_id IN (SELECT submission_id FROM submissions {scope})
+    """, params)
+
+    status_filter = "AND" if scope else "WHERE"
+    cur.execute(f"SELECT submission_id FROM submissions {scope} {status_filter} status != 'IN_PROGRESS'", params)
+    submission_ids = [row[0] for row in cur.fetchall()]
+
+    for start in range(0, len(submission_ids), STATS_REBUILD_BATCH_SIZE):
+        record_submissions(conn, submission_ids[start:start + STATS_REBUILD_BATCH_SIZE])
+
+    return len(submission_ids)
+
+
+@app.cli.command("rebuild-exam-stats")
+def rebuild_exam_stats_command():
+    """Recount the statistics of every exam."""
+    conn = get_db()
+    counted = rebuild_exam_stats(conn)
+    conn.commit()
+    conn.close()
+
+    print(f"[Stats] Recounted {counted} submissions")
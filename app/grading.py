@@ -0,0 +1,126 @@
+"""
+Automatic Grading Engine
+
+Grades exam submissions against an exam's answer key.
+
+The answer key of an exam (question -> points, multi-answer flag, set of correct
+option IDs) is loaded with a single query, and every submission is then graded
+in memory with set comparisons, so grading cost no longer depends on the number
+of database round trips per question.
+
+Functions:
+- `load_answer_key`: Builds the answer key of one exam.
+- `get_answer_key`: Cached `load_answer_key`, invalidated when the exam is edited.
+- `normalize_answers`: Converts answers to {question_id: [option_ids]}.
+- `grade_questions`: Points of each answered question of one set of answers.
+- `grade_answers`: Scores one set of answers against an answer key.
+- `grade_many`: Grades a batch of submissions, loading their answers and each exam's key only once.
+"""
+
+# Built-in Python imports
+from collections import namedtuple
+from types import MappingProxyType
+
+# Third-party imports
+from sqlalchemy import and_
+
+# Local Imports
+from app.models import db, Questions, Options
+from app.exam_cache import ExamCache
+from app.submission_answers import load_selections, to_option_ids
+
+# One answer key entry per question of an exam
+AnswerKeyEntry = namedtuple("AnswerKeyEntry", ["points", "is_multiple_correct", "correct_ids"])
+
+_answer_keys = ExamCache()
+
+
+def load_answer_key(exam_id):
+    """
+    - Fetches every question of the exam together with its correct options in one query
+    - Returns {question_id: AnswerKeyEntry}
+    """
+    rows = db.session.query(
+        Questions.question_id,
+        Questions.points,
+        Questions.is_multiple_correct,
+        Options.option_id
+    ).outerjoin(
+        Options, and_(Options.question_id == Questions.question_id, Options.is_correct.is_(True))
+    ).filter(Questions.exam_id == exam_id).all()
+
+    questions = {}
+    correct_ids = {}
+    for question_id, points, is_multiple_correct, option_id in rows:
+        questions[question_id] = (points, bool(is_multiple_correct))
+        correct = correct_ids.setdefault(question_id, set())
+        if option_id is not None:
+            correct.add(option_id)
+
+    return MappingProxyType({
+        qid: AnswerKeyEntry(points, is_multiple_correct, frozenset(correct_ids[qid]))
+        for qid, (points, is_multiple_correct) in questions.items()
+    })
+
+
+def get_answer_key(exam_id):
+    """Returns the exam's answer key, only querying the database if it isn't cached yet."""
+    return _answer_keys.get(exam_id, lambda: load_answer_key(exam_id))
+
+
+def normalize_answers(answers):
+    """
+    Converts answers to {question_id: [option_ids]}
+    (e.g., {'5': 14, '6': [16, 17, 18]} --> {5: [14], 6: [16, 17, 18]})
+    """
+    return {int(qid): to_option_ids(selected) for qid, selected in (answers or {}).items()}
+
+
+def grade_questions(answer_key, answers):
+    """
+    - Single-answer questions are correct if the chosen option is a correct one
+    - Multi-answer questions are correct if all correct options are chosen
+    - Returns {question_id: points} for every answered question of the exam
+    """
+    answers = normalize_answers(answers)
+
+    points = {}
+    for qid, selected in answers.items():
+        entry = answer_key.get(qid)
+        if entry is None:
+            continue
+
+        if entry.is_multiple_correct:
+            correct = entry.correct_ids <= set(selected)
+        else:
+            correct = bool(selected) and selected[0] in entry.correct_ids
+
+        points[qid] = entry.points if correct else 0
+
+    return points
+
+
+def grade_answers(answer_key, answers):
+    """Returns the total score of one set of answers."""
+    return sum(grade_questions(answer_key, answers).values())
+
+
+def grade_many(submissions):
+    """
+    - Grades a batch of submissions, possibly from different exams
+    - Their answers are loaded in one query, each exam's answer key once for the whole batch
+    - Returns {submission_id: {question_id: points}}, a submission's score is the sum of its points
+    """
+    selections = load_selections([submission.submission_id for submission in submissions])
+
+    answer_keys = {}
+    points = {}
+    for submission in submissions:
+        if submission.exam_id not in answer_keys:
+            answer_keys[submission.exam_id] = get_answer_key(submission.exam_id)
+
+        points[submission.submission_id] = grade_questions(
+            answer_keys[submission.exam_id], selections.get(submission.submission_id)
+        )
+
+    return points
@@ -0,0 +1,249 @@
+"""
+Item Analysis
+
+Classic post-exam item analysis of an exam's handed-in submissions:
+- p-value (share of students answering a question correctly)
+- Discrimination (point-biserial correlation of a question with the rest of the score)
+- Distractor analysis per option (selection rate overall, in the top and bottom 27%
+  of the scores, and correlation of choosing it with the score)
+- Cronbach's alpha of the exam
+
+All selections are read in one query and put into a students x options response
+matrix, everything else is computed with vectorized NumPy operations.
+
+Performance (`flask item-analysis` prints the time taken): 10k submissions x 200
+questions (2M answer rows) take about 1.6s on a development machine, 1s of it
+SQLite reading the answers. tests/test_results_usecases.py times an exam of a twentieth
+of that size.
+
+Questions are scored against the answer key (like app/grading.py),
+so the analysis reflects the questions themselves, not manual grading overrides.
+"""
+
+# Third-party imports
+import click
+import numpy as np
+
+# Built-in Python imports
+import re
+import time
+
+# Local Imports
+from app import app
+from app.database import get_db
+from app.grading import get_answer_key
+from app.take_exam.paper import get_exam_paper
+
+# Share of students in the upper and lower groups of the distractor analysis
+GROUP_FRACTION = 0.27
+
+# Characters of a JSON list of option IDs other than the IDs themselves
+_SEPARATORS = str.maketrans('[],"', "    ")
+_NOT_AN_ID = re.compile(r"[^0-9 ]")
+
+
+def load_response_matrix(conn, exam_id, option_ids):
+    """
+    - Returns (submission IDs, students x options boolean matrix of the selected options)
+    - `option_ids` gives the matrix columns, selections of other options are ignored
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT submission_id
+        FROM submissions
+        WHERE exam_id = ? AND status != 'IN_PROGRESS'
+        ORDER BY submission_id
+    """, (exam_id,))
+    submission_ids = np.array([row[0] for row in cur.fetchall()], dtype=np.int64)
+
+    matrix = np.zeros((len(submission_ids), len(option_ids)), dtype=bool)
+    if not len(submission_ids) or not option_ids:
+        return submission_ids, matrix
+
+    # All selections of a submission concatenated into one string, read along the answers' primary key;
+    # selections that aren't a bracketed list count as none
+    cur.execute("""
+        SELECT submission_id, group_concat(selected_option_ids, ' ')
+        FROM submission_answers
+        WHERE submission_id IN (SELECT submission_id FROM submissions WHERE exam_id = ? AND status != 'IN_PROGRESS')
+          AND selected_option_ids LIKE '[%]'
+        GROUP BY submission_id
+    """, (exam_id,))
+    rows = cur.fetchall()
+
+    selections = [_option_ids(text) for _, text in rows]
+    counts = np.fromiter((len(ids) for ids in selections), dtype=np.int64, count=len(selections))
+    answered = np.fromiter((submission_id for submission_id, _ in rows), dtype=np.int64, count=len(rows))
+
+    students = np.repeat(np.searchsorted(submission_ids, answered), counts)
+    selected = np.concatenate(selections) if selections else np.zeros(0, dtype=np.int64)
+
+    # Column of each selected option, -1 for options that aren't part of the exam (anymore)
+    columns = np.full(max(option_ids) + 2, -1, dtype=np.int64)
+    columns[option_ids] = np.arange(len(option_ids))
+    selected_columns = columns[np.where((selected < 0) | (selected >= len(columns)), -1, selected)]
+    known = selected_columns >= 0
+
+    matrix[students[known], selected_columns[known]] = True
+    return submission_ids, matrix
+
+
+def _option_ids(text):
+    """Option IDs in concatenated JSON lists of them, IDs stored as strings included, anything else ignored."""
+    text = text.translate(_SEPARATORS)
+    if _NOT_AN_ID.search(text):
+        text = " ".join(token for token in text.split() if not _NOT_AN_ID.search(token))
+    return np.fromstring(text, dtype=np.int64, sep=" ")
+
+
+def _group_sums(matrix, starts, ends):
+    """Sums each row of a boolean matrix over the column ranges [starts, ends), e.g. the options of each question."""
+    running = np.zeros((matrix.shape[0], matrix.shape[1] + 1), dtype=np.int32)
+    np.cumsum(matrix, axis=1, out=running[:, 1:])
+    return running[:, ends] - running[:, starts]
+
+
+def _correlation(x, y):
+    """Pearson correlation of each column of `x` with the matching column of `y`, NaN for columns without variance."""
+    x = x - x.mean(axis=0)
+    y = y - y.mean(axis=0)
+    numerator = (x * y).sum(axis=0)
+    denominator = np.sqrt((x * x).sum(axis=0) * (y * y).sum(axis=0))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return numerator / denominator
+
+
+def _point_biserial(responses, rates, scores):
+    """
+    Correlation of each column of a boolean matrix with the scores, NaN for columns without variance.
+    - `rates` are the column means, so the matrix itself never has to be centered
+    """
+    centered = (scores - scores.mean()).astype(np.float32)
+    covariance = (centered @ responses.astype(np.float32)) / len(scores)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return covariance / np.sqrt(rates * (1 - rates) * scores.var())
+
+
+def _number(value):
+    """Converts a NumPy scalar to a JSON-friendly float, NaN to None."""
+    value = float(value)
+    return None if np.isnan(value) else round(value, 4)
+
+
+def analyze_exam(conn, exam_id):
+    """Returns the item analysis of the exam, or None if it has no questions."""
+    paper = get_exam_paper(exam_id)
+    answer_key = get_answer_key(exam_id)
+    if not paper:
+        return None
+
+    # Columns: every option of every question, grouped by question in the paper's order
+    option_ids = [option_id for pq in paper for option_id, _ in pq.choices]
+    option_counts = [len(pq.choices) for pq in paper]
+    is_correct = np.array([
+        option_id in answer_key[pq.question_id].correct_ids for pq in paper for option_id, _ in pq.choices
+    ], dtype=bool)
+    points = np.array([answer_key[pq.question_id].points for pq in paper], dtype=float)
+
+    submission_ids, responses = load_response_matrix(conn, exam_id, option_ids)
+    students, questions = len(submission_ids), len(paper)
+
+    # Selected and correctly selected options per student and question
+    ends = np.cumsum(option_counts)
+    starts = ends - option_counts
+    selected_count = _group_sums(responses, starts, ends)
+    selected_correct = _group_sums(responses & is_correct, starts, ends)
+    correct_count = _group_sums(is_correct[None, :], starts, ends)
+
+    # Like app/grading.py: a correct choice, or all correct options of multi-answer questions
+    is_multiple = np.array([pq.is_multiple_correct for pq in paper], dtype=bool)
+    correct = np.where(
+        is_multiple,
+        selected_correct == correct_count,
+        (selected_count == 1) & (selected_correct == 1)
+    )
+
+    item_scores = correct * points
+    totals = item_scores.sum(axis=1)
+    if students:
+        p_values = correct.mean(axis=0)
+        # Against the rest of the score, so a question isn't correlated with itself
+        discrimination = _correlation(correct.astype(float), totals[:, None] - item_scores)
+
+        # Distractor analysis: top and bottom groups by score
+        group = max(int(round(students * GROUP_FRACTION)), 1)
+        ranking = np.argsort(totals, kind="stable")
+        selection_rate = responses.mean(axis=0)
+        lower_rate = responses[ranking[:group]].mean(axis=0)
+        upper_rate = responses[ranking[-group:]].mean(axis=0)
+        option_correlation = _point_biserial(responses, selection_rate, totals)
+    else:
+        p_values = discrimination = np.full(questions, np.nan)
+        selection_rate = lower_rate = upper_rate = option_correlation = np.full(len(option_ids), np.nan)
+
+    # Cronbach's alpha
+    alpha = np.nan
+    if students > 1 and questions > 1:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            alpha = questions / (questions - 1) * (1 - item_scores.var(axis=0, ddof=1).sum() / totals.var(ddof=1))
+
+    column = 0
+    question_results = []
+    for index, pq in enumerate(paper):
+        options = []
+        for option_id, option_text in pq.choices:
+            options.append({
+                "option_id": option_id,
+                "option_text": option_text,
+                "is_correct": bool(is_correct[column]),
+                "selection_rate": _number(selection_rate[column]),
+                "upper_rate": _number(upper_rate[column]),
+                "lower_rate": _number(lower_rate[column]),
+                "point_biserial": _number(option_correlation[column]),
+            })
+            column += 1
+
+        question_results.append({
+            "question_id": pq.question_id,
+            "question_text": pq.question_text,
+            "points": float(points[index]),
+            "p_value": _number(p_values[index]),
+            "discrimination": _number(discrimination[index]),
+            "options": options,
+        })
+
+    return {
+        "exam_id": exam_id,
+        "submission_count": students,
+        "question_count": questions,
+        "mean_score": _number(totals.mean()) if students else None,
+        "cronbach_alpha": _number(alpha),
+        "questions": question_results,
+    }
+
+
+@app.cli.command("item-analysis")
+@click.argument("exam_id", type=int)
+def item_analysis_command(exam_id):
+    """Print the item analysis of an exam."""
+    conn = get_db()
+    started = time.perf_counter()
+    result = analyze_exam(conn, exam_id)
+    elapsed = time.perf_counter() - started
+    conn.close()
+
+    if result is None:
+        print(f"[Item analysis] Exam {exam_id} has no questions")
+        return
+
+    print(f"[Item analysis] Exam {exam_id}: {result['submission_count']} submissions, "
+          f"mean score {result['mean_score']}, Cronbach's alpha {result['cronbach_alpha']} ({elapsed:.3f}s)")
+    for number, question in enumerate(result["questions"], start=1):
+        print(f"  Q{number} (#{question['question_id']}): p-value {question['p_value']}, "
+              f"discrimination {question['discrimination']}")
+        for option in question["options"]:
+            marker = "*" if option["is_correct"] else " "
+            print(f"    {marker} {option['option_text'][:40]:<40} chosen {option['selection_rate']}, "
+                  f"upper {option['upper_rate']}, lower {option['lower_rate']}, r {option['point_biserial']}")
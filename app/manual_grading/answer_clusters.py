@@ -0,0 +1,158 @@
+"""
+Answer Clusters
+
+Groups equivalent text answers to a question, so grading one answer of a cluster
+grades all of them (grading by question groups answers by their cluster, see
+answer_groups.py).
+
+- Answers are normalized (Unicode NFKC, case folded, punctuation dropped, whitespace
+  collapsed), and answers with the same normalized text form one cluster
+- Optionally, near-duplicates are merged too: answers whose word shingles have a
+  Jaccard similarity of at least `similarity`. Candidates are found with MinHash
+  signatures and locality-sensitive hashing, so not every pair is compared
+- The cluster of each answer is stored in `submission_answers.cluster_key`; answers
+  handed in after clustering are grouped by their exact text until it is run again
+- Text answers only exist for submissions migrated from the legacy answers JSON (and
+  future text questions); option answers are listed as their groups of identical
+  selections (see answer_groups.py), so every question gets an overview of group sizes
+"""
+
+# Built-in Python imports
+from collections import Counter
+import hashlib
+import re
+import unicodedata
+import zlib
+
+# Third-party imports
+import numpy as np
+
+# Local Imports
+from app.manual_grading.answer_groups import option_groups
+
+# Words per shingle
+SHINGLE_SIZE = 3
+
+# MinHash signature: BANDS x ROWS hash functions; answers sharing all rows of one band are compared
+BANDS, ROWS = 16, 4
+
+# Prime above the 32-bit shingle hashes, for the hash functions (a * x + b) % _PRIME
+_PRIME = 4294967311
+_random = np.random.default_rng(5)
+_HASH_A = _random.integers(1, 2**31, size=BANDS * ROWS, dtype=np.uint64)
+_HASH_B = _random.integers(0, 2**31, size=BANDS * ROWS, dtype=np.uint64)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_answer(text):
+    """Normalized form of an answer, equal for answers that only differ in case, punctuation and spacing."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text)).strip()
+
+
+def cluster_key(normalized):
+    return "cluster:" + hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def _shingles(normalized):
+    """Hashes of the answer's word shingles (a shorter answer is one shingle)."""
+    words = normalized.split(" ")
+    count = max(len(words) - SHINGLE_SIZE + 1, 1)
+    return {zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode()) for i in range(count)}
+
+
+def _minhash(shingles):
+    values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    return ((_HASH_A[:, None] * values[None, :] + _HASH_B[:, None]) % _PRIME).min(axis=1)
+
+
+def _near_duplicates(texts, similarity):
+    """
+    - Returns the components of `texts` (indices) connected by a Jaccard similarity of at least `similarity`
+    - Only texts with an equal band of their MinHash signatures are compared
+    """
+    shingles = [_shingles(text) for text in texts]
+    signatures = np.array([_minhash(s) for s in shingles]).reshape(len(texts), BANDS, ROWS)
+
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(BANDS):
+        buckets = {}
+        for i, rows in enumerate(map(bytes, signatures[:, band])):
+            buckets.setdefault(rows, []).append(i)
+
+        for candidates in buckets.values():
+            for position, i in enumerate(candidates):
+                for j in candidates[position + 1:]:
+                    a, b = shingles[i], shingles[j]
+                    if find(i) != find(j) and len(a & b) >= similarity * len(a | b):
+                        parent[find(j)] = find(i)
+
+    components = {}
+    for i in range(len(texts)):
+        components.setdefault(find(i), []).append(i)
+    return list(components.values())
+
+
+def build_clusters(conn, exam_id, question_id, similarity=None):
+    """
+    - Clusters the text answers of the exam's handed-in submissions to the question and
+      stores each answer's cluster; `similarity` (0..1) also merges near-duplicates
+    - A cluster is named after its most common normalized answer
+    - Returns [(cluster key, most common answer, size)], largest first, with the option answers'
+      groups (answer key, selected options' text, size) among them; changes are committed by the caller
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT sa.submission_id, sa.answer_text
+        FROM submission_answers sa
+        JOIN submissions s ON s.submission_id = sa.submission_id
+        WHERE sa.question_id = ? AND s.exam_id = ? AND s.status != 'IN_PROGRESS' AND sa.answer_text IS NOT NULL
+        """,
+        (question_id, exam_id),
+    )
+    answers = [(submission_id, text, normalize_answer(text)) for submission_id, text in cur.fetchall()]
+    if not answers:
+        return option_groups(conn, exam_id, question_id)
+
+    counts = Counter(normalized for _, _, normalized in answers)
+    texts = sorted(counts, key=lambda text: (-counts[text], text))
+    if similarity is not None:
+        components = _near_duplicates(texts, similarity)
+    else:
+        components = [[i] for i in range(len(texts))]
+
+    # Texts are sorted by frequency, so the first text of a component is its most common one
+    cluster_of = {}
+    for component in components:
+        representative = texts[min(component)]
+        for i in component:
+            cluster_of[texts[i]] = representative
+
+    cur.executemany(
+        "UPDATE submission_answers SET cluster_key = ? WHERE submission_id = ? AND question_id = ?",
+        [(cluster_key(cluster_of[normalized]), submission_id, question_id) for submission_id, _, normalized in answers],
+    )
+
+    # Most common original answer of each cluster, for display
+    sizes = Counter(cluster_of[normalized] for _, _, normalized in answers)
+    examples = {}
+    for _, text, normalized in answers:
+        examples.setdefault(cluster_of[normalized], Counter())[text] += 1
+
+    clusters = [
+        (cluster_key(representative), examples[representative].most_common(1)[0][0], size)
+        for representative, size in sizes.items()
+    ]
+    clusters += option_groups(conn, exam_id, question_id)
+    clusters.sort(key=lambda cluster: (-cluster[2], cluster[0]))
+    return clusters
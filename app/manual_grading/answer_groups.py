@@ -0,0 +1,146 @@
+"""
+Grade by Question
+
+Lists the answers of all handed-in submissions of an exam to one question, with
+identical answers grouped together, so each distinct answer is graded once and the
+grade is applied to every submission that gave it.
+
+- Text answers are identical if they're in the same cluster (see answer_clusters.py),
+  or else if their text is; option answers if the same options were selected (in any order)
+- Groups are sorted by size, largest first, and paged with a keyset cursor on
+  (answer_count, answer_key)
+
+Functions:
+- `load_answer_groups`: One page of answer groups of a question, with their members.
+- `group_members`: Submissions that gave some answers (by answer key), for applying a grade.
+- `option_groups`: Sizes of the groups of option answers, for the cluster overview.
+"""
+
+# Built-in Python imports
+import json
+
+# Local Imports
+from app.pagination import keyset_condition, paginate
+
+# Key of an answer row `sa`: its cluster, its text, or its selected options in ascending order
+ANSWER_KEY = """
+    CASE WHEN sa.cluster_key IS NOT NULL THEN sa.cluster_key
+    WHEN sa.answer_text IS NOT NULL THEN 'text:' || sa.answer_text
+    ELSE 'options:' || (
+        SELECT json_group_array(value) FROM (SELECT value FROM json_each(sa.selected_option_ids) ORDER BY value)
+    ) END
+"""
+
+# Answers of handed-in submissions to one question of one exam
+_ANSWERS = """
+    FROM submission_answers sa
+    JOIN submissions s ON s.submission_id = sa.submission_id
+    WHERE sa.question_id = ? AND s.exam_id = ? AND s.status != 'IN_PROGRESS'
+"""
+
+
+def load_answer_groups(conn, exam_id, question_id, limit, cursor=None):
+    """
+    - Returns (page of answer groups, next cursor or None)
+    - Every group has the answer (one of them for clusters, with the number of distinct texts),
+      how many gave it and how many of those were graded manually, the range of their points,
+      and its members (submission, roll number, points, version)
+    """
+    sql = f"""
+        SELECT g.*, (
+            SELECT group_concat(o.option_text, ', ')
+            FROM json_each(g.selected_option_ids) sel
+            JOIN options o ON o.option_id = sel.value
+        ) AS option_text
+        FROM (
+            SELECT {ANSWER_KEY} AS answer_key,
+                MIN(sa.answer_text) AS answer_text,
+                MIN(sa.selected_option_ids) AS selected_option_ids,
+                COUNT(DISTINCT sa.answer_text) AS variant_count,
+                COUNT(*) AS answer_count,
+                COUNT(sa.manual_points) AS graded_count,
+                MIN(COALESCE(sa.final_points, sa.manual_points, sa.auto_points, 0)) AS min_points,
+                MAX(COALESCE(sa.final_points, sa.manual_points, sa.auto_points, 0)) AS max_points,
+                json_group_array(json_object(
+                    'submission_id', s.submission_id,
+                    'roll_number', s.roll_number,
+                    'points', COALESCE(sa.final_points, sa.manual_points, sa.auto_points, 0),
+                    'version', s.version
+                )) AS members
+            {_ANSWERS}
+            GROUP BY answer_key
+        ) g
+    """
+    params = [question_id, exam_id]
+
+    # Largest groups first
+    if cursor:
+        condition, cursor_params = keyset_condition("g.answer_count", "g.answer_key", cursor, descending=True)
+        sql += " WHERE " + condition
+        params += cursor_params
+
+    sql += " ORDER BY g.answer_count DESC, g.answer_key DESC LIMIT ?"
+    params.append(limit + 1)
+
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    rows, next_cursor = paginate(cur.fetchall(), limit, lambda r: (r["answer_count"], r["answer_key"]))
+
+    groups = []
+    for r in rows:
+        groups.append(
+            {
+                "answer_key": r["answer_key"],
+                "answer_text": r["answer_text"] if r["answer_text"] is not None else r["option_text"],
+                "selected_option_ids": json.loads(r["selected_option_ids"] or "[]"),
+                "variant_count": r["variant_count"],
+                "answer_count": r["answer_count"],
+                "graded_count": r["graded_count"],
+                "min_points": r["min_points"],
+                "max_points": r["max_points"],
+                "members": json.loads(r["members"]),
+            }
+        )
+    return groups, next_cursor
+
+
+def group_members(conn, exam_id, question_id, answer_keys):
+    """Returns {answer_key: [submission IDs]} of the handed-in submissions that gave these answers."""
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT {ANSWER_KEY} AS answer_key, sa.submission_id
+        {_ANSWERS}
+          AND {ANSWER_KEY} IN (SELECT value FROM json_each(?))
+        ORDER BY sa.submission_id
+        """,
+        (question_id, exam_id, json.dumps(list(answer_keys))),
+    )
+
+    members = {key: [] for key in answer_keys}
+    for r in cur.fetchall():
+        members[r["answer_key"]].append(r["submission_id"])
+    return members
+
+
+def option_groups(conn, exam_id, question_id):
+    """Returns [(answer key, selected options' text, size)] of the option answers (not text answers), largest first."""
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT g.answer_key, g.answer_count, (
+            SELECT group_concat(o.option_text, ', ')
+            FROM json_each(g.selected_option_ids) sel
+            JOIN options o ON o.option_id = sel.value
+        ) AS option_text
+        FROM (
+            SELECT {ANSWER_KEY} AS answer_key, MIN(sa.selected_option_ids) AS selected_option_ids, COUNT(*) AS answer_count
+            {_ANSWERS}
+              AND sa.answer_text IS NULL
+            GROUP BY answer_key
+        ) g
+        ORDER BY g.answer_count DESC, g.answer_key
+        """,
+        (question_id, exam_id),
+    )
+    return [(r["answer_key"], r["option_text"], r["answer_count"]) for r in cur.fetchall()]
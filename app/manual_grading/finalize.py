@@ -0,0 +1,244 @@
+"""
+Bulk Finalize Review
+
+Finalizes the review of all handed-in submissions of an exam at once, instead of
+saving every submission separately: recalculates each total from its answers,
+marks it REVIEWED and counts it in the exam statistics (same as saving one review).
+
+- Works in chunks of FINALIZE_BATCH_SIZE submissions, in ID order, one short
+  transaction per chunk, so instructors can keep browsing and grading in between
+- Each chunk also moves the run's checkpoint (`review_finalize_runs`), so the
+  progress can be shown while it runs, and an interrupted run resumes after the
+  last finished chunk
+- Runs in the background on the scheduler when it's running, and unfinished runs
+  are picked up again on startup
+
+Functions:
+- `start_finalize`: Starts a run for an exam, or resumes its unfinished one.
+- `finalize_chunk`: Finalizes the next chunk of a run.
+- `run_finalize`: Starts or resumes a run and finalizes all chunks.
+- `load_finalize_progress`: Progress of an exam's latest run.
+- `schedule_finalize`: Runs `run_finalize` as a scheduler job.
+"""
+
+# Third-party imports
+import click
+
+# Built-in Python imports
+import os
+import time
+
+# Local Imports
+from app import app
+from app.database import begin_immediate, get_db, row_to_dict
+from app.exam_stats import record_submissions
+from app.scheduler import scheduler
+
+FINALIZE_BATCH_SIZE = int(os.getenv('FINALIZE_BATCH_SIZE', 200))
+
+_PENDING = "status IN ('SUBMITTED', 'IN_REVIEW')"
+
+
+def load_finalize_progress(conn, exam_id):
+    """Returns the exam's latest run (status, total, done, timestamps), or None if it never ran."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT exam_id, status, total, done, started_at, updated_at, finished_at
+        FROM review_finalize_runs
+        WHERE exam_id = ?
+        """,
+        (exam_id,),
+    )
+    row = cur.fetchone()
+    return row_to_dict(row) if row else None
+
+
+def start_finalize(conn, exam_id):
+    """
+    - Starts a new run if the exam has none or its last one is done, and returns its progress
+    - An unfinished run is left as it is, so it resumes after its checkpoint
+    """
+    begin_immediate(conn)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT status FROM review_finalize_runs WHERE exam_id = ?", (exam_id,))
+        row = cur.fetchone()
+
+        if not row or row["status"] == "DONE":
+            cur.execute(
+                f"""
+                INSERT INTO review_finalize_runs (exam_id, status, total, done, last_submission_id, started_at, updated_at)
+                VALUES (?, 'RUNNING', (SELECT COUNT(*) FROM submissions WHERE exam_id = ? AND {_PENDING}), 0, 0,
+                    CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT (exam_id) DO UPDATE SET
+                    status = excluded.status,
+                    total = excluded.total,
+                    done = 0,
+                    last_submission_id = 0,
+                    started_at = excluded.started_at,
+                    updated_at = excluded.updated_at,
+                    finished_at = NULL
+                """,
+                (exam_id, exam_id),
+            )
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return load_finalize_progress(conn, exam_id)
+
+
+def finalize_chunk(conn, exam_id, batch_size=FINALIZE_BATCH_SIZE):
+    """
+    - Finalizes the next `batch_size` pending submissions after the run's checkpoint, in one transaction
+    - Returns the number finalized, 0 once there are none left (the run is then marked DONE)
+    """
+    begin_immediate(conn)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT last_submission_id FROM review_finalize_runs WHERE exam_id = ? AND status = 'RUNNING'",
+            (exam_id,),
+        )
+        run = cur.fetchone()
+        if not run:
+            conn.rollback()
+            return 0
+
+        cur.execute(
+            f"""
+            SELECT submission_id FROM submissions
+            WHERE exam_id = ? AND {_PENDING} AND submission_id > ?
+            ORDER BY submission_id
+            LIMIT ?
+            """,
+            (exam_id, run["last_submission_id"], batch_size),
+        )
+        submission_ids = [row[0] for row in cur.fetchall()]
+
+        if not submission_ids:
+            cur.execute(
+                """
+                UPDATE review_finalize_runs
+                SET status = 'DONE', updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+                WHERE exam_id = ?
+                """,
+                (exam_id,),
+            )
+            conn.commit()
+            return 0
+
+        # Final points, else manual points, else automatic points (like recalc_total_score),
+        # a changed total increments the version
+        placeholders = ", ".join("?" for _ in submission_ids)
+        cur.execute(
+            f"""
+            UPDATE submissions
+            SET total_score = totals.total,
+                version = version + (total_score IS NOT totals.total),
+                status = 'REVIEWED',
+                updated_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT s.submission_id, (
+                    SELECT COALESCE(SUM(COALESCE(final_points, manual_points, auto_points, 0)), 0)
+                    FROM submission_answers sa
+                    WHERE sa.submission_id = s.submission_id
+                ) AS total
+                FROM submissions s
+                WHERE s.submission_id IN ({placeholders})
+            ) AS totals
+            WHERE submissions.submission_id = totals.submission_id
+            """,
+            submission_ids,
+        )
+        record_submissions(conn, submission_ids)
+
+        cur.execute(
+            """
+            UPDATE review_finalize_runs
+            SET done = done + ?, last_submission_id = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE exam_id = ?
+            """,
+            (len(submission_ids), submission_ids[-1], exam_id),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return len(submission_ids)
+
+
+def run_finalize(conn, exam_id, batch_size=FINALIZE_BATCH_SIZE, progress=None):
+    """
+    - Starts (or resumes) the exam's run and finalizes chunks until none are left
+    - `progress` is called with the run's progress after every chunk
+    - Returns the final progress
+    """
+    start_finalize(conn, exam_id)
+    while finalize_chunk(conn, exam_id, batch_size):
+        if progress:
+            progress(load_finalize_progress(conn, exam_id))
+
+    return load_finalize_progress(conn, exam_id)
+
+
+def finalize_exam_job(exam_id):
+    """APScheduler job finalizing all reviews of an exam, see `run_finalize`."""
+    with app.app_context():
+        conn = get_db()
+        try:
+            started = time.perf_counter()
+            result = run_finalize(conn, exam_id, progress=lambda p: print(
+                f"[Finalize] Exam {exam_id}: {p['done']}/{p['total']} reviews finalized"
+            ))
+        finally:
+            conn.close()
+
+        print(f"[Finalize] Exam {exam_id} done, {result['done']} reviews finalized in {time.perf_counter() - started:.3f}s.")
+
+
+def schedule_finalize(exam_id):
+    """Runs the exam's finalize job on the scheduler right away."""
+    scheduler.add_job(
+        id=f"finalize_{exam_id}",
+        func=finalize_exam_job,
+        args=[exam_id],
+        trigger="date",
+        replace_existing=True
+    )
+
+
+def resume_finalize_runs():
+    """
+    Runs once on startup.
+    - Schedules the runs that were interrupted (e.g., by a restart) to continue after their checkpoint
+    """
+    with app.app_context():
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT exam_id FROM review_finalize_runs WHERE status = 'RUNNING'")
+        exam_ids = [row[0] for row in cur.fetchall()]
+        conn.close()
+
+    for exam_id in exam_ids:
+        print(f"[Finalize] Resuming the unfinished run of Exam {exam_id}.")
+        schedule_finalize(exam_id)
+
+    return len(exam_ids)
+
+
+@app.cli.command("finalize-reviews")
+@click.argument("exam_id", type=int)
+def finalize_reviews_command(exam_id):
+    """Finalize the review of all handed-in submissions of an exam."""
+    conn = get_db()
+    result = run_finalize(conn, exam_id, progress=lambda p: print(
+        f"[Finalize] {p['done']}/{p['total']} reviews finalized"
+    ))
+    conn.close()
+
+    print(f"[Finalize] Exam {exam_id}: {result['done']} reviews finalized")
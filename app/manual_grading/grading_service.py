@@ -0,0 +1,232 @@
+"""
+Manual Grading Mutations
+
+Applies grading operations (points and/or feedback for one answer) to one or many
+submissions in one short transaction:
+1. Read the versions and totals of the submissions, the max points of the questions
+   and the current points of the answers, all in one query
+2. Upsert the answer rows
+3. Set every changed submission's total to its old total plus the differences, and
+   increment its version once (also for feedback only)
+
+The transaction takes the write lock up front (BEGIN IMMEDIATE), so nothing can
+change between reading the current points and writing the new ones. If any
+operation is invalid, nothing of the batch is applied.
+
+Optimistic concurrency:
+Every grading change (points, totals and feedback) increments `submissions.version`.
+A client sends the version it last saw, and if the submission was changed since (e.g.,
+by another instructor), the change is rejected with `VersionConflict` instead of
+overwriting theirs.
+"""
+
+# Built-in Python imports
+from collections import namedtuple
+import json
+import os
+
+# Local Imports
+from app.database import begin_immediate
+
+# Largest number of operations accepted in one batch
+GRADING_BATCH_LIMIT = int(os.getenv('GRADING_BATCH_LIMIT', 5000))
+
+# Result of a grading change
+GradeChange = namedtuple("GradeChange", ["question_id", "points", "total_score", "version"])
+
+# One operation of a batch: `points` is None for feedback only, `version` and `max_points` are optional
+GradingOperation = namedtuple(
+    "GradingOperation",
+    ["submission_id", "question_id", "points", "feedback", "version", "max_points"],
+    defaults=(None, None, None, None),
+)
+
+# Pass as `points` to give the question's max points
+FULL_CREDIT = "full"
+
+
+class VersionConflict(Exception):
+    """The submission was changed after the version the client sent."""
+
+    def __init__(self, version, total_score, submission_id=None):
+        super().__init__(f"Submission was changed, it is now at version {version}")
+        self.version = version
+        self.total_score = total_score
+        self.submission_id = submission_id
+
+
+class InvalidOperation(ValueError):
+    """An operation of a batch can't be applied, `index` is its position in the batch."""
+
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+
+class SubmissionNotFound(LookupError):
+    """An operation refers to a submission that doesn't exist."""
+
+    def __init__(self, submission_id):
+        super().__init__(f"Submission {submission_id} not found")
+        self.submission_id = submission_id
+
+
+def _append(existing, comment):
+    """Appends a comment on a new line, like the feedback route."""
+    existing = (existing or "").strip()
+    return existing + "\n" + comment if existing else comment
+
+
+# Everything the batch needs, for all (submission, question) pairs at once.
+# A submission without a total yet gets the sum of its answers (before this batch)
+_LOAD_QUERY = """
+    WITH pairs AS (
+        SELECT DISTINCT json_extract(value, '$[0]') AS submission_id, json_extract(value, '$[1]') AS question_id
+        FROM json_each(?)
+    )
+    SELECT p.submission_id, p.question_id, s.exam_id, s.version, s.feedback,
+        COALESCE(s.total_score, (
+            SELECT COALESCE(SUM(COALESCE(final_points, manual_points, auto_points, 0)), 0)
+            FROM submission_answers WHERE submission_id = s.submission_id
+        )) AS total_score,
+        q.exam_id AS question_exam_id, q.points AS max_points,
+        COALESCE(sa.final_points, sa.manual_points, sa.auto_points, 0) AS old_points,
+        sa.feedback AS answer_feedback
+    FROM pairs p
+    LEFT JOIN submissions s ON s.submission_id = p.submission_id
+    LEFT JOIN questions q ON q.question_id = p.question_id
+    LEFT JOIN submission_answers sa ON sa.submission_id = p.submission_id AND sa.question_id = p.question_id
+"""
+
+
+def apply_grading(conn, operations):
+    """
+    - Applies a list of GradingOperation in one transaction; an operation with the same
+      answer as an earlier one in the batch overrides its points
+    - `points` is a number or FULL_CREDIT, `max_points` overrides the question's points,
+      `feedback` is appended to the answer's and the submission's feedback
+    - Returns (a GradeChange per operation, {submission_id: (total_score, version)} of the
+      touched submissions), with the totals and versions after the whole batch
+    - Raises SubmissionNotFound, VersionConflict if an operation's `version` is outdated,
+      InvalidOperation if points are outside 0..max points or the question belongs to another exam
+    - Commits on success, rolls back everything otherwise
+    """
+    begin_immediate(conn)
+    try:
+        cur = conn.cursor()
+        cur.execute(_LOAD_QUERY, (json.dumps([[op.submission_id, op.question_id] for op in operations]),))
+        answers = {(row["submission_id"], row["question_id"]): row for row in cur.fetchall()}
+
+        submissions = {}
+        applied_points = []
+        points_now = {}
+        feedback_now = {}
+        for index, op in enumerate(operations):
+            row = answers[op.submission_id, op.question_id]
+            if row["exam_id"] is None:
+                raise SubmissionNotFound(op.submission_id)
+
+            if op.version is not None and op.version != row["version"]:
+                raise VersionConflict(row["version"], row["total_score"], op.submission_id)
+
+            if row["question_exam_id"] is not None and row["question_exam_id"] != row["exam_id"]:
+                raise InvalidOperation(index, f"question {op.question_id} is not part of the submission's exam")
+
+            submission = submissions.setdefault(op.submission_id, {
+                "submission_id": op.submission_id,
+                "total_score": row["total_score"],
+                "version": row["version"],
+                "feedback": row["feedback"],
+                "changed": False,
+                "feedback_changed": False,
+            })
+            key = op.submission_id, op.question_id
+            applied_points.append(None)
+
+            if op.points is not None:
+                max_points = op.max_points if op.max_points is not None else row["max_points"]
+                points = op.points
+                if points == FULL_CREDIT:
+                    points = float(max_points or 0)
+                elif max_points is not None and not 0 <= points <= float(max_points):
+                    raise InvalidOperation(index, "points must be between 0 and max_points")
+
+                submission["total_score"] += points - points_now.get(key, row["old_points"])
+                submission["changed"] = True
+                points_now[key] = applied_points[index] = points
+
+            if op.feedback:
+                feedback_now[key] = _append(feedback_now.get(key, row["answer_feedback"]), op.feedback)
+                submission["feedback"] = _append(submission["feedback"], op.feedback)
+                submission["feedback_changed"] = True
+
+        for submission in submissions.values():
+            submission["version"] += submission["changed"] or submission["feedback_changed"]
+
+        cur.executemany(
+            """
+            INSERT INTO submission_answers (submission_id, question_id, manual_points, final_points)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (submission_id, question_id) DO UPDATE SET
+                manual_points = excluded.manual_points,
+                final_points = excluded.final_points
+            """,
+            [(submission_id, question_id, points, points) for (submission_id, question_id), points in points_now.items()],
+        )
+        cur.executemany(
+            """
+            INSERT INTO submission_answers (submission_id, question_id, feedback)
+            VALUES (?, ?, ?)
+            ON CONFLICT (submission_id, question_id) DO UPDATE SET feedback = excluded.feedback
+            """,
+            [(submission_id, question_id, feedback) for (submission_id, question_id), feedback in feedback_now.items()],
+        )
+        # Totals are only written for submissions whose points changed
+        cur.executemany(
+            """
+            UPDATE submissions
+            SET total_score = CASE WHEN :changed THEN :total_score ELSE total_score END,
+                version = :version,
+                feedback = :feedback,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE submission_id = :submission_id
+            """,
+            list(submissions.values()),
+        )
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    changes = [
+        GradeChange(
+            op.question_id, points,
+            submissions[op.submission_id]["total_score"],
+            submissions[op.submission_id]["version"],
+        )
+        for op, points in zip(operations, applied_points)
+    ]
+    totals = {
+        submission_id: (submission["total_score"], submission["version"])
+        for submission_id, submission in submissions.items()
+    }
+    return changes, totals
+
+
+def set_answer_points(conn, submission_id, question_id, points, expected_version=None, max_points=None):
+    """
+    - Sets manual and final points of one answer and updates the submission's total by the difference
+    - `points` is a number or FULL_CREDIT, `max_points` overrides the question's points
+    - Returns a GradeChange, or None if the submission doesn't exist
+    - Raises VersionConflict if `expected_version` is given and outdated,
+      ValueError if the points are outside 0..max points
+    """
+    try:
+        changes, _ = apply_grading(conn, [
+            GradingOperation(submission_id, question_id, points, version=expected_version, max_points=max_points)
+        ])
+    except SubmissionNotFound:
+        return None
+
+    return changes[0]
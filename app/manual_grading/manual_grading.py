@@ -1,8 +1,18 @@
-import sqlite3
 import json
-import os
 from flask import Blueprint, request, jsonify
 
+from app.database import get_db, row_to_dict
+from app.pagination import page_args, keyset_condition, paginate
+from app.exam_stats import record_submissions
+from app.manual_grading.answer_clusters import build_clusters
+from app.manual_grading.answer_groups import group_members, load_answer_groups
+from app.manual_grading.finalize import load_finalize_progress, run_finalize, schedule_finalize, start_finalize
+from app.scheduler import scheduler
+from app.manual_grading.grading_service import (
+    FULL_CREDIT, GRADING_BATCH_LIMIT, GradingOperation, InvalidOperation, SubmissionNotFound, VersionConflict,
+    apply_grading, set_answer_points,
+)
+
 manualGradingBp = Blueprint(
     "manualGradingBp",
     __name__,
@@ -11,124 +21,151 @@ manualGradingBp = Blueprint(
 )
 
 
-def get_db():
-    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-    db_path = os.path.join(base_dir, "oesDB.db")
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
-
-
-def row_to_dict(row):
-    return {k: row[k] for k in row.keys()}
-
-
-# submissions.answers JSON helpers
-def load_answers_from_row(row):
-    raw = row["answers"]
-    if not raw:
-        return []
-    try:
-        data = json.loads(raw)
-    except Exception:
-        return []
-
-    if isinstance(data, list):
-        return data
-    if isinstance(data, dict) and "questions" in data and isinstance(data["questions"], list):
-        return data["questions"]
-    return []
-
-
-def save_answers(conn, submission_id, answers):
-    raw = json.dumps(answers)
+# submission_answers helpers (one row per answered question)
+def load_answers(conn, submission_id):
     cur = conn.cursor()
     cur.execute(
-        "UPDATE submissions SET answers = ?, updated_at = CURRENT_TIMESTAMP WHERE submission_id = ?",
-        (raw, submission_id),
+        """
+        SELECT
+            sa.question_id,
+            sa.selected_option_ids,
+            COALESCE(sa.answer_text, (
+                SELECT group_concat(o.option_text, ', ')
+                FROM json_each(sa.selected_option_ids) sel
+                JOIN options o ON o.option_id = sel.value
+            )) AS answer_text,
+            sa.auto_points,
+            sa.manual_points,
+            sa.final_points,
+            sa.feedback
+        FROM submission_answers sa
+        LEFT JOIN questions q ON q.question_id = sa.question_id
+        WHERE sa.submission_id = ?
+        ORDER BY q.order_index, sa.question_id
+        """,
+        (submission_id,),
     )
 
+    answers = []
+    for r in cur.fetchall():
+        ans = row_to_dict(r)
+        ans["selected_option_ids"] = json.loads(ans["selected_option_ids"] or "[]")
+        answers.append(ans)
+    return answers
+
 
-def recalc_total_score(conn, submission_id, answers=None):
+def get_answer(conn, submission_id, question_id):
     cur = conn.cursor()
+    cur.execute(
+        "SELECT * FROM submission_answers WHERE submission_id = ? AND question_id = ?",
+        (submission_id, question_id),
+    )
+    return cur.fetchone()
 
-    if answers is None:
-        cur.execute("SELECT answers FROM submissions WHERE submission_id = ?", (submission_id,))
-        row = cur.fetchone()
-        if not row:
-            return None
-        try:
-            answers = json.loads(row["answers"]) if row["answers"] else []
-        except Exception:
-            answers = []
 
-    if isinstance(answers, dict) and "questions" in answers:
-        answers_list = answers["questions"]
-    else:
-        answers_list = answers
-
-    total = 0.0
-    for ans in answers_list:
-        final_p = ans.get("final_points")
-        if final_p is None:
-            manual_p = ans.get("manual_points")
-            auto_p = ans.get("auto_points")
-            if manual_p is not None:
-                final_p = manual_p
-            elif auto_p is not None:
-                final_p = auto_p
-            else:
-                final_p = 0.0
-        total += float(final_p)
+def save_answer(conn, submission_id, question_id, **fields):
+    """Inserts or updates the given columns of one answer row, and touches the submission."""
+    columns = ", ".join(fields)
+    placeholders = ", ".join("?" for _ in fields)
+    updates = ", ".join(f"{column} = excluded.{column}" for column in fields)
 
+    cur = conn.cursor()
     cur.execute(
-        "UPDATE submissions SET total_score = ?, updated_at = CURRENT_TIMESTAMP WHERE submission_id = ?",
-        (total, submission_id),
+        f"""
+        INSERT INTO submission_answers (submission_id, question_id, {columns})
+        VALUES (?, ?, {placeholders})
+        ON CONFLICT (submission_id, question_id) DO UPDATE SET {updates}
+        """,
+        (submission_id, question_id, *fields.values()),
+    )
+    cur.execute(
+        "UPDATE submissions SET updated_at = CURRENT_TIMESTAMP WHERE submission_id = ?",
+        (submission_id,),
     )
-    return total
 
 
-def find_answer_entry(answers, question_id):
-    for ans in answers:
-        if ans.get("question_id") == question_id:
-            return ans
-    return None
+def submission_exists(conn, submission_id):
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM submissions WHERE submission_id = ?", (submission_id,))
+    return cur.fetchone() is not None
 
 
-def get_question_max_points(conn, question_id):
+def submission_version(conn, submission_id):
     cur = conn.cursor()
-    cur.execute("SELECT points FROM questions WHERE question_id = ?", (question_id,))
+    cur.execute("SELECT version FROM submissions WHERE submission_id = ?", (submission_id,))
     row = cur.fetchone()
-    if not row:
+    return row["version"] if row else None
+
+
+def recalc_total_score(conn, submission_id):
+    if not submission_exists(conn, submission_id):
         return None
-    return row["points"]
+
+    # Final points, else manual points, else automatic points
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT COALESCE(SUM(COALESCE(final_points, manual_points, auto_points, 0)), 0) AS total
+        FROM submission_answers
+        WHERE submission_id = ?
+        """,
+        (submission_id,),
+    )
+    total = float(cur.fetchone()["total"])
+
+    # A changed total is a grading change, so it increments the version (see grading_service.py)
+    cur.execute(
+        """
+        UPDATE submissions
+        SET version = version + (total_score IS NOT ?), total_score = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE submission_id = ?
+        """,
+        (total, total, submission_id),
+    )
+    return total
 
 
 # U4-F1: Load Manual Grading Dashboard
 @manualGradingBp.route("/dashboard/<path:instructor_email>", methods=["GET"])
 def load_manual_grading_dashboard(instructor_email):
+    try:
+        limit, cursor = page_args(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute(
-        """
+    sql = """
         SELECT
             e.exam_id,
             e.title,
             e.course_code,
+            e.created_at,
             COUNT(s.submission_id) AS total_submissions,
             SUM(CASE WHEN s.status = 'IN_REVIEW' THEN 1 ELSE 0 END) AS in_review,
             SUM(CASE WHEN s.status = 'REVIEWED' THEN 1 ELSE 0 END) AS reviewed
         FROM exams e
         LEFT JOIN submissions s ON s.exam_id = e.exam_id
         WHERE e.instructor_email = ?
+    """
+    params = [instructor_email]
+
+    # Keyset pagination over exams, newest first
+    if cursor:
+        condition, cursor_params = keyset_condition("e.created_at", "e.exam_id", cursor, descending=True)
+        sql += " AND " + condition
+        params += cursor_params
+
+    sql += """
         GROUP BY e.exam_id, e.title, e.course_code
-        ORDER BY e.created_at DESC
-        """,
-        (instructor_email,),
-    )
-    rows = cur.fetchall()
+        ORDER BY e.created_at DESC, e.exam_id DESC
+        LIMIT ?
+    """
+    params.append(limit + 1)
+
+    cur.execute(sql, params)
+    rows, next_cursor = paginate(cur.fetchall(), limit, lambda r: (r["created_at"], r["exam_id"]))
     conn.close()
 
     exams = []
@@ -144,7 +181,7 @@ def load_manual_grading_dashboard(instructor_email):
             }
         )
 
-    return jsonify(exams), 200
+    return jsonify(exams=exams, next_cursor=next_cursor), 200
 
 
 # U4-F2: List Submissions for Selected Exam
@@ -156,6 +193,11 @@ def list_submissions(exam_id):
     if status_filter == "GRADED":
         status_filter = "REVIEWED"
 
+    try:
+        limit, cursor = page_args(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
     conn = get_db()
     cur = conn.cursor()
 
@@ -178,10 +220,17 @@ def list_submissions(exam_id):
         sql += " AND s.status = ?"
         params.append(status_filter)
 
-    sql += " ORDER BY s.submitted_at ASC"
+    # Keyset pagination, oldest first
+    if cursor:
+        condition, cursor_params = keyset_condition("s.submitted_at", "s.submission_id", cursor)
+        sql += " AND " + condition
+        params += cursor_params
+
+    sql += " ORDER BY s.submitted_at ASC, s.submission_id ASC LIMIT ?"
+    params.append(limit + 1)
 
     cur.execute(sql, params)
-    rows = cur.fetchall()
+    rows, next_cursor = paginate(cur.fetchall(), limit, lambda r: (r["submitted_at"], r["submission_id"]))
     conn.close()
 
     submissions = []
@@ -198,7 +247,7 @@ def list_submissions(exam_id):
             }
         )
 
-    return jsonify(submissions), 200
+    return jsonify(submissions=submissions, next_cursor=next_cursor), 200
 
 
 # U4-F3: Open a Submission for Review
@@ -255,9 +304,9 @@ def open_submission_for_review(submission_id):
         )
         row = cur.fetchone()
 
-    answers = load_answers_from_row(row)
     submission_info = row_to_dict(row)
-    submission_info["answers"] = answers
+    submission_info.pop("answers", None)  # Legacy column
+    submission_info["answers"] = load_answers(conn, submission_id)
 
     conn.close()
     return jsonify(submission_info), 200
@@ -271,45 +320,12 @@ def open_submission_for_review(submission_id):
 def toggle_verdict(submission_id, question_id):
     data = request.get_json(silent=True) or {}
     force_correct = bool(data.get("force_correct", False))
-    max_points = data.get("max_points")
-
-    conn = get_db()
-    cur = conn.cursor()
-
-    cur.execute("SELECT * FROM submissions WHERE submission_id = ?", (submission_id,))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
-        return jsonify(error="Submission not found"), 404
-
-    answers = load_answers_from_row(row)
-    ans = find_answer_entry(answers, question_id)
 
-    if ans is None:
-        ans = {"question_id": question_id, "answer_text": "", "auto_points": 0}
-        answers.append(ans)
-
-    if max_points is None:
-        max_points = get_question_max_points(conn, question_id)
-    if max_points is None:
-        max_points = 0
-
-    ans["manual_points"] = float(max_points) if force_correct else 0.0
-    ans["final_points"] = ans["manual_points"]
-
-    save_answers(conn, submission_id, answers)
-    total = recalc_total_score(conn, submission_id, answers)
-
-    conn.commit()
-    conn.close()
-
-    return jsonify(
-        {
-            "question_id": question_id,
-            "final_points": ans["final_points"],
-            "total_score": total,
-        }
-    ), 200
+    return _grade_answer(
+        submission_id, question_id,
+        FULL_CREDIT if force_correct else 0.0,
+        data.get("version"), data.get("max_points"),
+    )
 
 
 # U4-F5: Set Partial Credit
@@ -327,46 +343,43 @@ def set_manual_points(submission_id, question_id):
     except (TypeError, ValueError):
         return jsonify(error="points must be a number"), 400
 
-    conn = get_db()
-    cur = conn.cursor()
+    return _grade_answer(submission_id, question_id, points, data.get("version"), data.get("max_points"))
 
-    max_points = data.get("max_points")
-    if max_points is None:
-        max_points = get_question_max_points(conn, question_id)
 
-    # If still None, allow it, but don’t block save
-    if max_points is not None:
-        if points < 0 or points > float(max_points):
-            conn.close()
-            return jsonify(error="points must be between 0 and max_points"), 400
+def _grade_answer(submission_id, question_id, points, version, max_points):
+    """Applies a point change with the grading service and builds the response (409 if the version is outdated)."""
+    try:
+        if version is not None:
+            version = int(version)
+        if max_points is not None:
+            max_points = float(max_points)
+    except (TypeError, ValueError):
+        return jsonify(error="version and max_points must be numbers"), 400
 
-    cur.execute("SELECT * FROM submissions WHERE submission_id = ?", (submission_id,))
-    row = cur.fetchone()
-    if not row:
+    conn = get_db()
+    try:
+        change = set_answer_points(conn, submission_id, question_id, points, version, max_points)
+    except VersionConflict as e:
+        return jsonify(
+            error="This submission was changed by someone else, reload it and try again",
+            version=e.version,
+            total_score=e.total_score,
+        ), 409
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    finally:
         conn.close()
-        return jsonify(error="Submission not found"), 404
 
-    answers = load_answers_from_row(row)
-    ans = find_answer_entry(answers, question_id)
-    if ans is None:
-        ans = {"question_id": question_id, "answer_text": "", "auto_points": 0}
-        answers.append(ans)
-
-    ans["manual_points"] = points
-    ans["final_points"] = points
-
-    save_answers(conn, submission_id, answers)
-    total = recalc_total_score(conn, submission_id, answers)
-
-    conn.commit()
-    conn.close()
+    if change is None:
+        return jsonify(error="Submission not found"), 404
 
     return jsonify(
         {
             "question_id": question_id,
-            "manual_points": points,
-            "final_points": points,
-            "total_score": total,
+            "manual_points": change.points,
+            "final_points": change.points,
+            "total_score": change.total_score,
+            "version": change.version,
         }
     ), 200
 
@@ -401,28 +414,26 @@ def add_feedback(submission_id):
         new_feedback = (existing_feedback + "\n" + comment).strip() if existing_feedback else comment
 
     cur.execute(
-        "UPDATE submissions SET feedback = ?, updated_at = CURRENT_TIMESTAMP WHERE submission_id = ?",
+        "UPDATE submissions SET feedback = ?, version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE submission_id = ?",
         (new_feedback, submission_id),
     )
 
-    # Per-question feedback inside answers JSON
+    # Per-question feedback on the answer row
     if question_id is not None:
         qid = int(question_id)
-        answers = load_answers_from_row(row)
-        ans = find_answer_entry(answers, qid)
-        if ans is None:
-            ans = {"question_id": qid, "answer_text": "", "auto_points": 0}
-            answers.append(ans)
-
-        existing_q_fb = (ans.get("feedback") or "").strip()
-        ans["feedback"] = (existing_q_fb + "\n" + comment).strip() if existing_q_fb else comment
+        ans = get_answer(conn, submission_id, qid)
 
-        save_answers(conn, submission_id, answers)
+        existing_q_fb = ((ans["feedback"] if ans else None) or "").strip()
+        save_answer(
+            conn, submission_id, qid,
+            feedback=(existing_q_fb + "\n" + comment).strip() if existing_q_fb else comment,
+        )
 
+    version = submission_version(conn, submission_id)
     conn.commit()
     conn.close()
 
-    return jsonify(message="Feedback saved", feedback=new_feedback), 201
+    return jsonify(message="Feedback saved", feedback=new_feedback, version=version), 201
 
 
 # U4-F7: Recalculate Submission Score
@@ -430,13 +441,14 @@ def add_feedback(submission_id):
 def recalc_submission_totals(submission_id):
     conn = get_db()
     total = recalc_total_score(conn, submission_id)
+    version = submission_version(conn, submission_id)
     conn.commit()
     conn.close()
 
     if total is None:
         return jsonify(error="Submission not found"), 404
 
-    return jsonify(total_score=total), 200
+    return jsonify(total_score=total, version=version), 200
 
 
 # U4-F8: Save Changes / Finalize Review
@@ -461,6 +473,10 @@ def save_submission_review(submission_id):
         (submission_id,),
     )
 
+    # Replace what was counted for the submission in the exam statistics
+    record_submissions(conn, [submission_id])
+
+    version = submission_version(conn, submission_id)
     conn.commit()
     conn.close()
 
@@ -468,6 +484,7 @@ def save_submission_review(submission_id):
     return jsonify(
         message="Submission saved",
         total_score=total,
+        version=version,
         status="REVIEWED",
         status_display="GRADED",
     ), 200
@@ -506,36 +523,252 @@ def verify_submission_integrity(submission_id):
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("SELECT * FROM submissions WHERE submission_id = ?", (submission_id,))
-    row = cur.fetchone()
-    if not row:
+    if not submission_exists(conn, submission_id):
         conn.close()
         return jsonify(error="Submission not found"), 404
 
-    answers = load_answers_from_row(row)
-
-    changed = False
-    for ans in answers:
-        if "final_points" not in ans or ans["final_points"] is None:
-            manual_p = ans.get("manual_points")
-            auto_p = ans.get("auto_points")
-            if manual_p is not None:
-                ans["final_points"] = manual_p
-            elif auto_p is not None:
-                ans["final_points"] = auto_p
-            else:
-                ans["final_points"] = 0.0
-            changed = True
-
-    if changed:
-        save_answers(conn, submission_id, answers)
-
-    total = recalc_total_score(conn, submission_id, answers)
+    # Answers without final points get their manual, else automatic points
+    cur.execute(
+        """
+        UPDATE submission_answers
+        SET final_points = COALESCE(manual_points, auto_points, 0)
+        WHERE submission_id = ? AND final_points IS NULL
+        """,
+        (submission_id,),
+    )
+    changed = cur.rowcount > 0
+
+    total = recalc_total_score(conn, submission_id)
+    version = submission_version(conn, submission_id)
     conn.commit()
     conn.close()
 
     return jsonify(
         message="Integrity check completed",
         total_score=total,
+        version=version,
         answers_fixed=changed,
     ), 200
+
+
+def _parse_grade(index, data):
+    """Returns (points or FULL_CREDIT or None, feedback or None) of a grading request, raises InvalidOperation if it's malformed."""
+    try:
+        points = data.get("points")
+        if points is not None:
+            points = float(points)
+        elif "force_correct" in data:
+            points = FULL_CREDIT if bool(data["force_correct"]) else 0.0
+    except (TypeError, ValueError):
+        raise InvalidOperation(index, "points must be a number")
+
+    feedback = str(data.get("feedback") or "").strip() or None
+    if points is None and feedback is None:
+        raise InvalidOperation(index, "points, force_correct or feedback is required")
+
+    return points, feedback
+
+
+def _parse_operation(index, data):
+    """Turns one operation of a batch request into a GradingOperation, raises InvalidOperation if it's malformed."""
+    if not isinstance(data, dict):
+        raise InvalidOperation(index, "operation must be an object")
+
+    try:
+        submission_id = int(data["submission_id"])
+        question_id = int(data["question_id"])
+        version = int(data["version"]) if data.get("version") is not None else None
+        max_points = float(data["max_points"]) if data.get("max_points") is not None else None
+    except KeyError:
+        raise InvalidOperation(index, "submission_id and question_id are required")
+    except (TypeError, ValueError):
+        raise InvalidOperation(index, "submission_id, question_id, version and max_points must be numbers")
+
+    points, feedback = _parse_grade(index, data)
+    return GradingOperation(submission_id, question_id, points, feedback, version, max_points)
+
+
+# U4-F11: Batch Grading (many answers of one or many submissions, all or nothing)
+@manualGradingBp.route("/batch", methods=["POST"])
+def grade_batch():
+    data = request.get_json(silent=True) or {}
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify(error="operations must be a non-empty list"), 400
+    if len(operations) > GRADING_BATCH_LIMIT:
+        return jsonify(error=f"at most {GRADING_BATCH_LIMIT} operations per batch"), 400
+
+    conn = get_db()
+    try:
+        operations = [_parse_operation(index, op) for index, op in enumerate(operations)]
+        changes, totals = apply_grading(conn, operations)
+    except InvalidOperation as e:
+        return jsonify(error=f"operation {e.index}: {e}", index=e.index), 400
+    except SubmissionNotFound as e:
+        return jsonify(error=str(e), submission_id=e.submission_id), 404
+    except VersionConflict as e:
+        return jsonify(
+            error=f"Submission {e.submission_id} was changed by someone else, reload it and try again",
+            submission_id=e.submission_id,
+            version=e.version,
+            total_score=e.total_score,
+        ), 409
+    finally:
+        conn.close()
+
+    return jsonify(
+        {
+            "results": [
+                {
+                    "submission_id": op.submission_id,
+                    "question_id": change.question_id,
+                    "manual_points": change.points,
+                    "final_points": change.points,
+                }
+                for op, change in zip(operations, changes)
+            ],
+            "submissions": [
+                {"submission_id": submission_id, "total_score": total_score, "version": version}
+                for submission_id, (total_score, version) in totals.items()
+            ],
+        }
+    ), 200
+
+
+def _get_exam_question(conn, exam_id, question_id):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT question_id, question_text, points FROM questions WHERE question_id = ? AND exam_id = ?",
+        (question_id, exam_id),
+    )
+    return cur.fetchone()
+
+
+# U4-F12: Grade by Question (every answer to one question, identical answers grouped)
+@manualGradingBp.route("/exams/<int:exam_id>/questions/<int:question_id>/answers", methods=["GET"])
+def list_question_answers(exam_id, question_id):
+    try:
+        limit, cursor = page_args(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    conn = get_db()
+    question = _get_exam_question(conn, exam_id, question_id)
+    if not question:
+        conn.close()
+        return jsonify(error="Question not found in this exam"), 404
+
+    groups, next_cursor = load_answer_groups(conn, exam_id, question_id, limit, cursor)
+    conn.close()
+
+    return jsonify(question=row_to_dict(question), groups=groups, next_cursor=next_cursor), 200
+
+
+# U4-F13: Grade Answer Groups (one grade for every submission with the same answer)
+@manualGradingBp.route("/exams/<int:exam_id>/questions/<int:question_id>/answers/apply", methods=["POST"])
+def apply_question_grades(exam_id, question_id):
+    data = request.get_json(silent=True) or {}
+    groups = data.get("groups")
+    if not isinstance(groups, list) or not groups:
+        return jsonify(error="groups must be a non-empty list"), 400
+
+    conn = get_db()
+    try:
+        if not _get_exam_question(conn, exam_id, question_id):
+            return jsonify(error="Question not found in this exam"), 404
+
+        grades = []
+        for index, group in enumerate(groups):
+            if not isinstance(group, dict) or not isinstance(group.get("answer_key"), str):
+                raise InvalidOperation(index, "answer_key is required")
+            grades.append((group["answer_key"], *_parse_grade(index, group)))
+
+        members = group_members(conn, exam_id, question_id, [answer_key for answer_key, *_ in grades])
+        operations = [
+            GradingOperation(submission_id, question_id, points, feedback)
+            for answer_key, points, feedback in grades
+            for submission_id in members[answer_key]
+        ]
+        _, totals = apply_grading(conn, operations) if operations else (None, {})
+    except InvalidOperation as e:
+        return jsonify(error=f"group {e.index}: {e}", index=e.index), 400
+    finally:
+        conn.close()
+
+    return jsonify(
+        {
+            "groups": [
+                {"answer_key": answer_key, "answer_count": len(members[answer_key])}
+                for answer_key, *_ in grades
+            ],
+            "submissions": [
+                {"submission_id": submission_id, "total_score": total_score, "version": version}
+                for submission_id, (total_score, version) in totals.items()
+            ],
+        }
+    ), 200
+
+
+# U4-F14: Cluster Equivalent Answers (grading a cluster grades every answer in it)
+@manualGradingBp.route("/exams/<int:exam_id>/questions/<int:question_id>/clusters", methods=["POST"])
+def cluster_question_answers(exam_id, question_id):
+    data = request.get_json(silent=True) or {}
+    similarity = data.get("similarity")
+    if similarity is not None:
+        try:
+            similarity = float(similarity)
+        except (TypeError, ValueError):
+            similarity = None
+        if similarity is None or not 0 < similarity <= 1:
+            return jsonify(error="similarity must be a number between 0 and 1"), 400
+
+    conn = get_db()
+    if not _get_exam_question(conn, exam_id, question_id):
+        conn.close()
+        return jsonify(error="Question not found in this exam"), 404
+
+    clusters = build_clusters(conn, exam_id, question_id, similarity)
+    conn.commit()
+    conn.close()
+
+    # Sizes first, so the instructor can start with the largest clusters
+    return jsonify(
+        clusters=[
+            {"answer_key": key, "answer_text": text, "answer_count": size}
+            for key, text, size in clusters
+        ]
+    ), 200
+
+
+# U4-F15: Finalize All Reviews of an Exam (chunked, resumable, with progress)
+@manualGradingBp.route("/exams/<int:exam_id>/finalize", methods=["POST"])
+def finalize_exam_reviews(exam_id):
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM exams WHERE exam_id = ?", (exam_id,))
+    if not cur.fetchone():
+        conn.close()
+        return jsonify(error="Exam not found"), 404
+
+    # In the background when the scheduler runs in this process, the progress is polled with GET
+    if scheduler.running:
+        progress = start_finalize(conn, exam_id)
+        conn.close()
+        schedule_finalize(exam_id)
+        return jsonify(progress), 202
+
+    progress = run_finalize(conn, exam_id)
+    conn.close()
+    return jsonify(progress), 200
+
+
+@manualGradingBp.route("/exams/<int:exam_id>/finalize", methods=["GET"])
+def get_finalize_progress(exam_id):
+    conn = get_db()
+    progress = load_finalize_progress(conn, exam_id)
+    conn.close()
+
+    if progress is None:
+        return jsonify(error="Reviews of this exam were never finalized in bulk"), 404
+
+    return jsonify(progress), 200
@@ -0,0 +1,56 @@
+"""
+Database Migrations
+
+Applies the versioned SQL scripts in `sql_scripts/migrations` to the configured database.
+
+- Scripts are named `NNN_description.sql` and applied in order of their number
+- The number of the last applied script is stored in SQLite's `PRAGMA user_version`
+- `sql_scripts/initializeDB.sql` creates the latest schema and sets the version itself
+"""
+
+# Built-in Python imports
+import os
+import re
+
+# Local Imports
+from app import app, db
+
+MIGRATIONS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "sql_scripts", "migrations"))
+
+
+def list_migrations():
+    """Returns [(version, path)] of all migration scripts, sorted by version."""
+    migrations = []
+    for name in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r"^(\d+)_.+\.sql$", name)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(MIGRATIONS_DIR, name)))
+
+    return sorted(migrations)
+
+
+def apply_migrations():
+    """
+    - Applies every migration newer than the database's schema version, each in its own transaction
+    - Does nothing if the database has no tables yet
+    """
+    with app.app_context():
+        raw = db.engine.raw_connection()
+        try:
+            conn = raw.driver_connection
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if "submissions" not in tables:
+                return
+
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, path in list_migrations():
+                if number <= version:
+                    continue
+
+                with open(path) as f:
+                    script = f.read()
+
+                conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+                print(f"[Migrations] Applied {os.path.basename(path)}")
+        finally:
+            raw.close()
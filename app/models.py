@@ -34,6 +34,10 @@ class Courses(db.Model):
 
 
 class Exams(db.Model):
+    __table_args__ = (
+        db.Index("ix_exams_instructor_email_created_at", "instructor_email", "created_at"),
+    )
+
     exam_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     instructor_email = db.Column(db.String(50), db.ForeignKey("instructors.email"), nullable=False)
     course_code = db.Column(db.String(50), db.ForeignKey("courses.course_code"))
@@ -43,9 +47,16 @@ class Exams(db.Model):
     closes_at = db.Column(db.DateTime, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False)
     updated_at = db.Column(db.DateTime)
+    # Kept in sync with the exam's questions by the question routes
+    total_points = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
 
 class Questions(db.Model):
+    __table_args__ = (
+        db.Index("ix_questions_exam_id_order_index", "exam_id", "order_index"),
+    )
+
     question_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     exam_id = db.Column(db.Integer, db.ForeignKey("exams.exam_id"), nullable=False)
     question_text = db.Column(db.Text, nullable=False)
@@ -55,6 +66,10 @@ class Questions(db.Model):
 
 
 class Options(db.Model):
+    __table_args__ = (
+        db.Index("ix_options_question_id", "question_id"),
+    )
+
     option_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     question_id = db.Column(db.Integer, db.ForeignKey("questions.question_id"), nullable=False)
     option_text = db.Column(db.Text, nullable=False)
@@ -62,6 +77,15 @@ class Options(db.Model):
 
 
 class Submissions(db.Model):
+    __table_args__ = (
+        db.Index("ix_submissions_roll_number_status", "roll_number", "status"),
+        db.Index("ix_submissions_exam_id_status", "exam_id", "status"),
+        db.Index("ix_submissions_exam_id_submitted_at", "exam_id", "submitted_at"),
+        db.Index("ix_submissions_roll_number_submitted_at", "roll_number", "submitted_at"),
+        # A student can only have one submission in progress at a time
+        db.Index("ux_submissions_in_progress", "roll_number", unique=True, sqlite_where=db.text("status = 'IN_PROGRESS'")),
+    )
+
     submission_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     exam_id = db.Column(db.Integer, db.ForeignKey("exams.exam_id"), nullable=False)
     roll_number = db.Column(db.Integer, db.ForeignKey("students.roll_number"), nullable=False)
@@ -70,5 +94,58 @@ class Submissions(db.Model):
     updated_at = db.Column(db.DateTime)
     feedback = db.Column(db.Text)
     status = db.Column(Enum("IN_PROGRESS", "SUBMITTED", "IN_REVIEW", "REVIEWED"), nullable=False)
-    answers = db.Column(db.JSON)
+    answers = db.Column(db.JSON)  # Legacy, answers are stored in submission_answers
     total_score = db.Column(db.Integer)
+    order_seed = db.Column(db.Integer)
+    autosave_seq = db.Column(db.Integer)
+    stats_score = db.Column(db.Float)  # Score counted in exam_stats, None if not counted yet
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")  # Incremented by every grading change
+    last_seen_at = db.Column(db.DateTime)  # Last autosave request, also ones that didn't write answers
+
+
+class SubmissionAnswers(db.Model):
+    __table_args__ = (
+        db.Index("ix_submission_answers_question_id", "question_id"),
+    )
+
+    submission_id = db.Column(db.Integer, db.ForeignKey("submissions.submission_id"), primary_key=True)
+    question_id = db.Column(db.Integer, primary_key=True)
+    selected_option_ids = db.Column(db.JSON)
+    answer_text = db.Column(db.Text)
+    auto_points = db.Column(db.Float)
+    manual_points = db.Column(db.Float)
+    final_points = db.Column(db.Float)
+    feedback = db.Column(db.Text)
+    stats_points = db.Column(db.Float)  # Points counted in question_stats, None if not counted yet
+    cluster_key = db.Column(db.Text)  # Cluster of equivalent answers, see app/manual_grading/answer_clusters.py
+
+
+# Running totals of the handed-in submissions of an exam, see app/exam_stats.py
+class ExamStats(db.Model):
+    exam_id = db.Column(db.Integer, db.ForeignKey("exams.exam_id"), primary_key=True)
+    submission_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    score_sum = db.Column(db.Float, nullable=False, default=0, server_default="0")
+    score_sq_sum = db.Column(db.Float, nullable=False, default=0, server_default="0")
+    score_histogram = db.Column(db.JSON, nullable=False, default=dict, server_default="{}")  # {whole points: count}
+    updated_at = db.Column(db.DateTime)
+
+
+class QuestionStats(db.Model):
+    exam_id = db.Column(db.Integer, db.ForeignKey("exams.exam_id"), nullable=False)
+    question_id = db.Column(db.Integer, primary_key=True)
+    answer_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    correct_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    points_sum = db.Column(db.Float, nullable=False, default=0, server_default="0")
+    option_counts = db.Column(db.JSON, nullable=False, default=dict, server_default="{}")  # {option_id: times selected}
+
+
+# Progress of finalizing all reviews of an exam, see app/manual_grading/finalize.py
+class ReviewFinalizeRuns(db.Model):
+    exam_id = db.Column(db.Integer, db.ForeignKey("exams.exam_id"), primary_key=True)
+    status = db.Column(Enum("RUNNING", "DONE"), nullable=False, default="RUNNING", server_default="RUNNING")
+    total = db.Column(db.Integer, nullable=False, default=0, server_default="0")  # Submissions to finalize when the run started
+    done = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_submission_id = db.Column(db.Integer, nullable=False, default=0, server_default="0")  # Checkpoint, runs resume after it
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
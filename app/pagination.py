@@ -0,0 +1,88 @@
+"""
+Keyset Pagination
+
+Helpers for listing large result sets page by page, without OFFSET.
+
+A page is requested with `?limit=N&cursor=...`. The cursor is an opaque token
+holding the sort key of the last row of the previous page (e.g., submitted_at and
+submission_id), and the next page is fetched with a WHERE condition on that key,
+so every page costs the same no matter how deep into the history it is.
+
+- `page_args`: Reads and validates `limit` and `cursor` from the request args.
+- `keyset_condition`: SQL condition selecting the rows after a cursor.
+- `paginate`: Splits fetched rows into the page and the next cursor.
+"""
+
+# Built-in Python imports
+import base64
+import json
+import os
+
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 500))
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+
+def page_args(args, key_length=2):
+    """
+    - Returns (limit, cursor values or None) from the request args
+    - Raises ValueError for a malformed limit or cursor
+    """
+    limit = args.get("limit", PAGE_SIZE, type=int)
+    if limit is None or limit < 1:
+        raise ValueError("limit must be a positive integer")
+
+    cursor = args.get("cursor")
+    if not cursor:
+        return min(limit, MAX_PAGE_SIZE), None
+
+    try:
+        values = decode_cursor(cursor)
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(values, list) or len(values) != key_length:
+        raise ValueError("invalid cursor")
+
+    return min(limit, MAX_PAGE_SIZE), values
+
+
+def keyset_condition(sort_column, id_column, cursor, descending=False):
+    """
+    Returns (sql, params) selecting the rows that come after the cursor when ordered by
+    `sort_column, id_column` (both ASC or both DESC). NULL sort values are allowed,
+    they come first in ascending and last in descending order, like SQLite orders them.
+    """
+    sort_value, id_value = cursor
+    after = "<" if descending else ">"
+
+    if sort_value is None:
+        sql = f"({sort_column} IS NULL AND {id_column} {after} ?)"
+        if not descending:
+            sql = f"({sql} OR {sort_column} IS NOT NULL)"
+        return sql, [id_value]
+
+    # Row value comparison, so SQLite can seek an index on (sort_column, id_column)
+    sql = f"({sort_column}, {id_column}) {after} (?, ?)"
+    if descending:
+        sql = f"({sql} OR {sort_column} IS NULL)"
+    return sql, [sort_value, id_value]
+
+
+def paginate(rows, limit, key):
+    """
+    - `rows` must be fetched with `LIMIT limit + 1`
+    - Returns (page rows, next cursor or None if it's the last page)
+    - `key` returns the sort key values of a row
+    """
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(list(key(rows[-1])))
@@ -1,70 +1,189 @@
+# Third-party imports
+from sqlalchemy import bindparam, text
+
 # Built-in Python import
 from datetime import datetime, timezone, timedelta
+import json
+import time
 import os
 
 # Local Imports
 from app import app, scheduler, db
-from app.models import Exams, Questions, Submissions
-from app.take_exam.take_exam import finalize_submission
+from app.models import Exams, Submissions
+from app.grading import get_answer_key, grade_questions
+from app.submission_answers import load_in_progress_selections, save_auto_points
+from app.exam_stats import record_session_submissions
+from app.take_exam.autosave_buffer import flush_autosaves
+from app.database import retry_on_busy
 
 AUTOSAVE_GRACE_PERIOD=int(os.getenv('AUTOSAVE_GRACE_PERIOD'))
+CLOSE_BATCH_SIZE=int(os.getenv('CLOSE_BATCH_SIZE', 500))
+
+# Closes the submissions of [[submission_id, total_score], ...] that are still in progress, returning their IDs
+_close_statement = text("""
+    UPDATE submissions
+    SET total_score = json_extract(totals.value, '$[1]'), submitted_at = :submitted_at, status = 'SUBMITTED'
+    FROM json_each(:totals) AS totals
+    WHERE submissions.submission_id = json_extract(totals.value, '$[0]') AND submissions.status = 'IN_PROGRESS'
+    RETURNING submissions.submission_id
+""").bindparams(bindparam("submitted_at", type_=db.DateTime))
+
+@retry_on_busy
+def _close_chunk(points, submitted_at):
+    # Points are only stored for submissions still in progress, and that write takes the lock,
+    # so the close below sees the same ones
+    save_auto_points(points)
+    result = db.session.execute(_close_statement, {
+        "totals": json.dumps([
+            [submission_id, sum(question_points.values())] for submission_id, question_points in points.items()
+        ]),
+        "submitted_at": submitted_at,
+    })
+    closed = [submission_id for submission_id, in result]
+    record_session_submissions(closed)
+    db.session.commit()
+    return len(closed)
+
+def bulk_close_submissions(exam_id, batch_size=CLOSE_BATCH_SIZE):
+    """
+    - Grades all in-progress submissions of the exam in memory, with the exam's answer key and
+      all their answers loaded once
+    - Writes points, scores, status and submission time back in chunks of `batch_size`, one transaction per chunk
+    - Submissions finalized by the student in the meantime are left untouched
+    - Returns the number of submissions closed
+    """
+    answer_key = get_answer_key(exam_id)
+    selections = load_in_progress_selections(exam_id)
+    submission_ids = [submission_id for submission_id, in db.session.query(Submissions.submission_id).filter_by(
+        exam_id=exam_id, status="IN_PROGRESS"
+    )]
+
+    submitted_at = datetime.utcnow()
+    closed = 0
+    for start in range(0, len(submission_ids), batch_size):
+        chunk = submission_ids[start:start + batch_size]
+        closed += _close_chunk({
+            submission_id: grade_questions(answer_key, selections.get(submission_id))
+            for submission_id in chunk
+        }, submitted_at)
+
+    return closed
 
 def close_exam(exam_id):
     """
     APScheduler job that runs once at the closing time of an exam.
     - Finds all submissions for the given exam that are currently in progress
-    - Finalizes the submissions and updates the database
+    - Grades and finalizes them in bulk, see `bulk_close_submissions`
     """
     with app.app_context():
         exam = Exams.query.get(exam_id)
         if exam:
             print(f"[Scheduler] Exam {exam_id} expired.")
-            active_submissions = Submissions.query.filter_by(exam_id=exam_id, status="IN_PROGRESS").all()
 
-            for submission in active_submissions:
-                saved_answers = submission.answers or {}
-                saved_answers = {int(k): v for k, v in saved_answers.items()}
-                questions = Questions.query.filter_by(exam_id=exam_id)
-                finalize_submission(submission, saved_answers, questions)
+            # Write any buffered autosaves first so they're included in the grading
+            flush_autosaves()
+
+            started = time.perf_counter()
+            closed = bulk_close_submissions(exam_id)
+            elapsed = time.perf_counter() - started
+
+            rate = closed / elapsed if elapsed > 0 else closed
+            print(f"[Scheduler] Autosubmitted {closed} submissions of Exam {exam_id} in {elapsed:.3f}s ({rate:.0f}/s).")
+
+def catch_up_closed_exams():
+    """
+    Runs once on startup.
+    - Finds exams whose closing time (plus the autosave grace period) passed while the app was down,
+      but that still have submissions in progress
+    - Closes them the same way their timer would have
+    """
+    with app.app_context():
+        cutoff = datetime.utcnow() - timedelta(seconds=AUTOSAVE_GRACE_PERIOD)
+        missed_exams = db.session.query(Exams.exam_id).join(
+            Submissions, Submissions.exam_id == Exams.exam_id
+        ).filter(
+            Exams.closes_at <= cutoff,
+            Submissions.status == "IN_PROGRESS"
+        ).distinct().all()
+
+    for (exam_id,) in missed_exams:
+        print(f"[Scheduler] Exam {exam_id} closed while the app was down, catching up.")
+        close_exam(exam_id)
+
+    return len(missed_exams)
 
-                db.session.commit()
-                print(f"[Scheduler] Autosubmited {submission.submission_id}.")
+def schedule_exam_close(exam_id, closes_at):
+    """
+    Registers, moves or removes the closing timer of one exam.
+    - Called by the exam routes whenever they write an exam's closing time
+    - Returns True if a timer is (now) scheduled
+    """
+    job_id = f"close_{exam_id}"
+    job = scheduler.get_job(job_id)
+
+    # Exams that already closed don't get a timer
+    if closes_at <= datetime.utcnow():
+        if job:
+            scheduler.remove_job(job_id)
+        return False
+
+    # Added delay so autosave will have time to run one last time on exam expiration
+    expiration = closes_at + timedelta(seconds=AUTOSAVE_GRACE_PERIOD)
+
+    # Keep the timer if it already matches the close time
+    # (expiration time needs to be timezone-aware for the comparison, pending jobs have no run time yet)
+    if job:
+        if getattr(job, "next_run_time", None) == expiration.replace(tzinfo=timezone.utc):
+            return True
+        scheduler.remove_job(job_id)
+
+    scheduler.add_job(
+        id=job_id,
+        func=close_exam,
+        args=[exam_id],
+        trigger="date",
+        run_date=expiration,
+        replace_existing=True
+    )
+    print(f"[Scheduler] Expiration scheduled for Exam {exam_id} at {expiration}(UTC)")
+    return True
+
+def rebuild_exam_timers():
+    """
+    Runs once on startup.
+    - Schedules a closing timer for every exam that hasn't closed yet
+    """
+    with app.app_context():
+        now = datetime.utcnow()
+        upcoming_exams = db.session.query(Exams.exam_id, Exams.closes_at).filter(Exams.closes_at > now).all()
+
+        for exam_id, closes_at in upcoming_exams:
+            schedule_exam_close(exam_id, closes_at)
 
 def set_exam_timers():
     """
-    APScheduler job that runs every minute.
+    Optional safety-net APScheduler job that runs every ACTIVE_EXAM_CHECK_INTERVAL seconds.
+    Timers are normally registered by the exam routes, this only catches ones that were missed.
     - Finds all exams that are currently active (opened but not yet closed)
-    - Schedules one job per active exam to run at the exam's closing time
+    - Makes sure each one has a job scheduled at the exam's closing time
     """
     with app.app_context():
         # Get currently active exams
         now = datetime.utcnow()
-        active_exams = Exams.query.filter(
+        active_exams = db.session.query(Exams.exam_id, Exams.closes_at).filter(
             Exams.opens_at <= now,
             Exams.closes_at > now
         ).all()
 
-        for exam in active_exams:
-            job_id = f"close_{exam.exam_id}"
-            job = scheduler.get_job(job_id)
-
-            # Added delay so autosave will have time to run one last time on exam expiration
-            expiration = exam.closes_at + timedelta(seconds=AUTOSAVE_GRACE_PERIOD)
-
-            # If the exam doesn't already have a timer, set one,
-            # or if it has one but it doesn't match with the close time update it
-            if job:
-                # Expiration time needs to be timezone-aware for the comparison
-                if job.next_run_time == expiration.replace(tzinfo=timezone.utc):
-                    continue
-                scheduler.remove_job(job_id)
-
-            if (exam.closes_at - now).total_seconds() > 0:
-                scheduler.add_job(
-                    id=job_id,
-                    func=close_exam,
-                    args=[exam.exam_id],
-                    trigger="date",
-                    run_date=expiration
-                )
-                print(f"[Scheduler] Expiration scheduled for Exam {exam.exam_id} at {expiration}(UTC)")
+        for exam_id, closes_at in active_exams:
+            schedule_exam_close(exam_id, closes_at)
+
+def flush_autosave_buffer():
+    """
+    APScheduler job that runs every AUTOSAVE_FLUSH_INTERVAL seconds when write-behind autosaving is enabled.
+    - Writes all buffered autosaves to the database in one transaction
+    """
+    with app.app_context():
+        written = flush_autosaves()
+        if written:
+            print(f"[Scheduler] Flushed {written} buffered autosaves.")
@@ -0,0 +1,110 @@
+"""
+Submission Answers
+
+Answers of a submission are stored one row per question in `submission_answers`
+(selected options, automatically and manually graded points, feedback), so saving
+or grading one question only touches one row, and totals are summed in SQL.
+
+Selected options are stored as a JSON list of option IDs, also for single-answer
+questions (an unanswered question is an empty list).
+
+Functions:
+- `to_option_ids`: Converts a submitted answer (option ID, list of IDs or None) to a list of option IDs.
+- `load_selections`: Selected options of many submissions, in one query.
+- `load_in_progress_selections`: Selected options of all in-progress submissions of an exam, in one query.
+- `save_selections`: Upserts the selected options of some questions of an in-progress submission.
+- `save_auto_points`: Stores automatically graded points per question.
+"""
+
+# Third-party imports
+from sqlalchemy import bindparam, text
+
+# Local Imports
+from app.models import db, Submissions, SubmissionAnswers
+
+_upsert_selection = text("""
+    INSERT INTO submission_answers (submission_id, question_id, selected_option_ids)
+    SELECT :submission_id, :question_id, :selected_option_ids
+    WHERE EXISTS (SELECT 1 FROM submissions WHERE submission_id = :submission_id AND status = 'IN_PROGRESS')
+    ON CONFLICT (submission_id, question_id) DO UPDATE SET selected_option_ids = excluded.selected_option_ids
+""").bindparams(bindparam("selected_option_ids", type_=db.JSON))
+
+_update_auto_points = text("""
+    UPDATE submission_answers
+    SET auto_points = :auto_points
+    WHERE submission_id = :submission_id AND question_id = :question_id
+      AND EXISTS (SELECT 1 FROM submissions WHERE submission_id = :submission_id AND status = 'IN_PROGRESS')
+""")
+
+
+def to_option_ids(answer):
+    """Converts an answer to a list of option IDs (e.g., 14 --> [14], None --> [])."""
+    if answer is None:
+        return []
+    if not isinstance(answer, list):
+        answer = [answer]
+    return [int(option_id) for option_id in answer if option_id is not None]
+
+
+def _collect(rows):
+    selections = {}
+    for submission_id, question_id, selected_option_ids in rows:
+        selections.setdefault(submission_id, {})[question_id] = to_option_ids(selected_option_ids)
+    return selections
+
+
+def load_selections(submission_ids):
+    """Returns {submission_id: {question_id: [option_ids]}}, submissions without answers are left out."""
+    if not submission_ids:
+        return {}
+
+    rows = db.session.query(
+        SubmissionAnswers.submission_id,
+        SubmissionAnswers.question_id,
+        SubmissionAnswers.selected_option_ids
+    ).filter(SubmissionAnswers.submission_id.in_(submission_ids)).all()
+
+    return _collect(rows)
+
+
+def load_in_progress_selections(exam_id):
+    """Same as `load_selections`, for every in-progress submission of the exam."""
+    rows = db.session.query(
+        SubmissionAnswers.submission_id,
+        SubmissionAnswers.question_id,
+        SubmissionAnswers.selected_option_ids
+    ).join(
+        Submissions, Submissions.submission_id == SubmissionAnswers.submission_id
+    ).filter(Submissions.exam_id == exam_id, Submissions.status == "IN_PROGRESS").all()
+
+    return _collect(rows)
+
+
+def save_selections(answers_by_submission):
+    """
+    - Writes {submission_id: {question_id: answer}} in one `executemany`, leaving other questions untouched
+    - Submissions that are no longer in progress are skipped
+    - Changes are committed by the caller
+    """
+    params = [
+        {"submission_id": submission_id, "question_id": int(question_id), "selected_option_ids": to_option_ids(answer)}
+        for submission_id, answers in answers_by_submission.items()
+        for question_id, answer in answers.items()
+    ]
+    if params:
+        db.session.execute(_upsert_selection, params)
+
+
+def save_auto_points(points_by_submission):
+    """
+    - Stores {submission_id: {question_id: points}} on the answer rows
+    - Submissions that are no longer in progress are skipped, so points are stored before changing the status
+    - Changes are committed by the caller
+    """
+    params = [
+        {"submission_id": submission_id, "question_id": question_id, "auto_points": question_points}
+        for submission_id, points in points_by_submission.items()
+        for question_id, question_points in points.items()
+    ]
+    if params:
+        db.session.execute(_update_auto_points, params)
@@ -0,0 +1,96 @@
+"""
+U5: Write-Behind Autosave Buffer
+
+Optional in-memory buffer for autosaves (enabled with AUTOSAVE_WRITE_BEHIND=True).
+
+Instead of one commit per autosave, the changed answers of every submission are
+collected in memory and written to the database in one `executemany` transaction
+every AUTOSAVE_FLUSH_INTERVAL seconds.
+
+Anything that reads or replaces a submission's answers (loading the exam page,
+saving, submitting, closing the exam) must flush the buffer first, so no answers
+are lost or overwritten by an older autosave.
+"""
+
+# Third-party imports
+from sqlalchemy import bindparam, text
+
+# Built-in Python imports
+from collections import namedtuple
+import threading
+import os
+
+# Local Imports
+from app.models import db
+from app.database import retry_on_busy
+from app.submission_answers import save_selections
+
+AUTOSAVE_WRITE_BEHIND = os.getenv('AUTOSAVE_WRITE_BEHIND') == 'True'
+AUTOSAVE_FLUSH_INTERVAL = int(os.getenv('AUTOSAVE_FLUSH_INTERVAL', 3))
+
+PendingAutosave = namedtuple("PendingAutosave", ["answers", "seq", "updated_at"])
+
+_pending = {}
+_lock = threading.Lock()
+
+_flush_statement = text("""
+    UPDATE submissions
+    SET autosave_seq = :seq, updated_at = :updated_at
+    WHERE submission_id = :submission_id AND status = 'IN_PROGRESS'
+""").bindparams(bindparam("updated_at", type_=db.DateTime))
+
+
+def buffer_autosave(submission_id, changes, seq, updated_at):
+    """Keeps the submission's changed answers ({question_id: answer}) until the next flush, merged with older ones."""
+    with _lock:
+        pending = _pending.get(submission_id)
+        answers = {**pending.answers, **changes} if pending else dict(changes)
+        _pending[submission_id] = PendingAutosave(answers, seq, updated_at)
+
+
+def get_pending(submission_id):
+    """Returns the submission's buffered autosave, or None if there isn't one."""
+    return _pending.get(submission_id)
+
+
+@retry_on_busy
+def _write_autosaves(entries):
+    save_selections({sid: entry.answers for sid, entry in entries})
+    db.session.execute(_flush_statement, [
+        {"submission_id": sid, "seq": entry.seq, "updated_at": entry.updated_at}
+        for sid, entry in entries
+    ])
+    db.session.commit()
+
+
+def flush_autosaves(submission_ids=None):
+    """
+    - Writes the buffered autosaves of the given submissions (all if None) in one transaction
+    - Submissions that are no longer in progress are skipped
+    - Returns the number of autosaves written
+    """
+    with _lock:
+        if submission_ids is None:
+            entries = list(_pending.items())
+            _pending.clear()
+        else:
+            entries = [(sid, _pending.pop(sid)) for sid in submission_ids if sid in _pending]
+
+    if not entries:
+        return 0
+
+    try:
+        _write_autosaves(entries)
+    except Exception:
+        db.session.rollback()
+
+        # Put the autosaves back, under any newer changes that arrived in the meantime
+        with _lock:
+            for sid, entry in entries:
+                newer = _pending.get(sid)
+                if newer:
+                    entry = newer._replace(answers={**entry.answers, **newer.answers})
+                _pending[sid] = entry
+        raise
+
+    return len(entries)
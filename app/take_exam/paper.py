@@ -0,0 +1,134 @@
+"""
+U5: Exam Paper Loader
+
+Loads the questions of an exam together with their options in a single query,
+and keeps the result as an immutable "paper" in the exam cache, so rendering and
+validating an exam doesn't cost one query per question.
+
+Shuffled exams derive the question (and optionally option) order from a seed
+stored on the submission, so the order can be recomputed on every request.
+
+The rendered HTML of a paper's question list is cached as well, keyed by the exam
+version and the order seed, so that many students opening the same exam at once
+only cost one render (for shuffled exams, one per student unless SHUFFLE_VARIANTS
+caps the seeds). Each student's answers are overlaid on the cached HTML.
+
+Structure:
+- A paper is a tuple of `PaperQuestion`, in the order given by the instructor.
+- `choices` is a tuple of (option_id, option_text) pairs, in option creation order.
+"""
+
+# Third-party imports
+from flask import render_template
+from markupsafe import Markup
+
+# Built-in Python imports
+from collections import namedtuple
+import random
+import re
+
+# Local Imports
+from app.models import db, Questions, Options
+from app.exam_cache import ExamCache
+
+PaperQuestion = namedtuple(
+    "PaperQuestion",
+    ["question_id", "question_text", "is_multiple_correct", "points", "order_index", "choices"]
+)
+
+_papers = ExamCache()
+_fragments = ExamCache()
+
+# Every option input of a rendered fragment carries this attribute, used to mark it as selected
+_OPTION_ATTRIBUTE = re.compile(r'data-option="(\d+)"')
+
+
+def load_exam_paper(exam_id):
+    """Fetches all questions and options of the exam in one joined query."""
+    rows = db.session.query(
+        Questions.question_id,
+        Questions.question_text,
+        Questions.is_multiple_correct,
+        Questions.points,
+        Questions.order_index,
+        Options.option_id,
+        Options.option_text
+    ).outerjoin(
+        Options, Options.question_id == Questions.question_id
+    ).filter(
+        Questions.exam_id == exam_id
+    ).order_by(Questions.order_index.asc(), Questions.question_id.asc(), Options.option_id.asc()).all()
+
+    questions = {}
+    choices = {}
+    for qid, text, is_multiple_correct, points, order_index, option_id, option_text in rows:
+        if qid not in questions:
+            questions[qid] = (qid, text, bool(is_multiple_correct), points, order_index)
+            choices[qid] = []
+        if option_id is not None:
+            choices[qid].append((int(option_id), option_text))
+
+    # Dicts keep insertion order, so the questions stay sorted by order_index
+    return tuple(PaperQuestion(*fields, tuple(choices[qid])) for qid, fields in questions.items())
+
+
+def get_exam_paper(exam_id):
+    """Returns the exam's paper, only querying the database if it isn't cached yet."""
+    return _papers.get(exam_id, lambda: load_exam_paper(exam_id))
+
+
+def order_paper(paper, seed, shuffle_questions=True, shuffle_options=False):
+    """
+    Returns the paper's questions in the order derived from the seed.
+    - The same paper and seed always give the same order
+    - Options are shuffled within their question only if `shuffle_options` is set
+    """
+    rng = random.Random(seed)
+
+    # Position map: positions[i] is the paper index of the question shown at position i
+    positions = list(range(len(paper)))
+    if shuffle_questions:
+        rng.shuffle(positions)
+
+    questions = [paper[i] for i in positions]
+    if shuffle_options:
+        questions = [q._replace(choices=tuple(rng.sample(q.choices, len(q.choices)))) for q in questions]
+
+    return questions
+
+
+def render_paper_fragment(exam_id, questions, order_seed=None, shuffle_options=False):
+    """
+    Returns the HTML of the question list, with no answers selected.
+    - `questions` must be the paper's questions in the order they're shown
+    - `order_seed` and `shuffle_options` are what that order was derived with (None for the instructor's order)
+    """
+    return _fragments.get(
+        exam_id,
+        lambda: render_template('paper_fragment.html', questions=questions),
+        order_seed,
+        shuffle_options
+    )
+
+
+def overlay_answers(fragment, selected_ids):
+    """Marks the options with the given IDs as selected in a rendered fragment."""
+    def mark(match):
+        if int(match.group(1)) in selected_ids:
+            return match.group(0) + " checked"
+        return match.group(0)
+
+    return Markup(_OPTION_ATTRIBUTE.sub(mark, fragment))
+
+
+def posted_option_ids(form_data):
+    """Collects the IDs of all options selected in a posted submission form."""
+    selected_ids = set()
+    for name, values in form_data.lists():
+        if not name.endswith(("-answer_single", "-answer_multi")):
+            continue
+        for value in values:
+            if value.isdigit():
+                selected_ids.add(int(value))
+
+    return selected_ids
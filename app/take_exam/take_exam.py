@@ -10,7 +10,8 @@ Functionalities:
   and sets up a new submission session.
 - Exam taking: Presents questions in the in the order the given by the instructor,
   or in a randomzied one, allows student to submit or save and exit.
-- Autosave functionality: Periodically saves in-progress submissions to the database.
+- Autosave functionality: Periodically saves in-progress submissions to the database,
+  sending only the answers that changed since the last save.
 - Submission finalization: Automatically grades the submission, and updates its relevant
   information in the database
 
@@ -24,8 +25,9 @@ Dependencies:
 """
 
 # Third-party imports
-from flask import Blueprint, flash, redirect, render_template, request, session, url_for
+from flask import Blueprint, flash, jsonify, redirect, render_template, request, session, url_for
 from flask_login import current_user, login_required
+from sqlalchemy.dialects.sqlite import insert
 
 # Built-in Python imports
 import random
@@ -35,7 +37,13 @@ import os
 
 # Local Imports
 from app.take_exam.forms import ExamSearchForm, ExamInitializationForm, SubmissionForm
-from app.models import db, Instructors, Exams, Questions, Options, Submissions
+from app.models import db, Instructors, Exams, Submissions
+from app.grading import grade_many
+from app.submission_answers import load_selections, save_selections, save_auto_points
+from app.exam_stats import record_session_submissions
+from app.take_exam.paper import get_exam_paper, order_paper, render_paper_fragment, overlay_answers, posted_option_ids
+from app.take_exam.autosave_buffer import AUTOSAVE_WRITE_BEHIND, buffer_autosave, get_pending, flush_autosaves
+from app.database import retry_on_busy
 
 # Instantiate blueprint
 take_examBp = Blueprint("take_examBp", __name__, url_prefix="/take_exam",  template_folder="templates")
@@ -43,38 +51,136 @@ take_examBp = Blueprint("take_examBp", __name__, url_prefix="/take_exam",  templ
 # Constant initialization
 AUTOSAVE_INTERVAL = int(os.getenv('AUTOSAVE_INTERVAL'))
 AUTOSAVE_GRACE_PERIOD = int(os.getenv('AUTOSAVE_GRACE_PERIOD'))
+SHUFFLE_VARIANTS = int(os.getenv('SHUFFLE_VARIANTS', 0))
 
-# Helper function
-def finalize_submission(submission, answers, questions):
+# Helper functions
+def finalize_submissions(submissions):
     """
-    - Calculates submission score
-    - Sets score, time of submission, and changes status
-    - Updates database
+    - Grades the submissions in one batch against their exams' answer keys
+    - Stores the points of every answer, sets score, time of submission, and changes status
+    - Adds them to their exams' statistics
+    - Changes are committed by the caller
     """
+    points = grade_many(submissions)
+    save_auto_points(points)
+    submitted_at = datetime.utcnow()
 
-    score = 0
-    for question in questions:
-        if question.is_multiple_correct:
-            answers_are_correct = True
-            correct_options = Options.query.filter_by(question_id=question.question_id, is_correct=True).all()
-            for option in correct_options:
-                if option.option_id not in answers[question.question_id]:
-                    answers_are_correct = False
+    for submission in submissions:
+        submission.total_score = sum(points[submission.submission_id].values())
+        submission.submitted_at = submitted_at
+        submission.status = "SUBMITTED"
+
+        print(f"[U5] Submitted {submission.submission_id} with points {points[submission.submission_id]}") # Debugging
+
+    record_session_submissions(submission.submission_id for submission in submissions)
+
+
+def finalize_submission(submission):
+    """Grades and finalizes a single submission."""
+    finalize_submissions([submission])
+
+
+@retry_on_busy
+def start_submission(exam, roll_number):
+    """
+    Starts a submission of the exam for the student, or returns the one they already have in progress.
+    - The insert is skipped by the unique index on in-progress submissions if one exists,
+      so double submits or parallel tabs can't create duplicates
+    """
+    current_datetime = datetime.utcnow()
+    db.session.execute(
+        insert(Submissions).values(
+            exam_id = exam.exam_id,
+            roll_number = roll_number,
+            started_at = current_datetime,
+            updated_at = current_datetime,
+            status = "IN_PROGRESS",
+            order_seed = new_order_seed()
+        ).on_conflict_do_nothing(
+            index_elements=[Submissions.roll_number],
+            index_where=(Submissions.status == "IN_PROGRESS")
+        )
+    )
+    db.session.commit()
+
+    return Submissions.query.filter_by(roll_number=roll_number, status="IN_PROGRESS").one()
 
-            if answers_are_correct:
-                score += question.points
 
-            continue
+def new_order_seed():
+    """
+    Returns the order seed of a new submission.
+    - A random 63-bit value, so no two students practically share a question order
+    - With SHUFFLE_VARIANTS set, one of only that many seeds: students share orders,
+      but also the cached rendering of their exam paper
+    """
+    if SHUFFLE_VARIANTS > 0:
+        return random.randrange(SHUFFLE_VARIANTS)
+    return random.getrandbits(63)
 
-        option = Options.query.get(answers[question.question_id])
-        if option and option.is_correct:
-            score += question.points
 
-    submission.total_score = score
-    submission.submitted_at = datetime.utcnow()
-    submission.status = "SUBMITTED"
+def submission_order_seed(submission, exam):
+    """
+    Returns the seed the submission's question order is derived from,
+    or None if the exam isn't shuffled
+    """
+    if not exam.security_settings["shuffle"]:
+        return None
 
-    print(f"[U5] Submitted {submission.submission_id} with answers {answers}") # Debugging
+    # Submissions started before seeds were stored fall back to their ID
+    if submission.order_seed is None:
+        return submission.submission_id
+
+    return submission.order_seed
+
+
+def last_activity(submission):
+    """Returns when the submission was last saved or autosaved, whichever is later."""
+    last_seen = submission.last_seen_at
+    if last_seen and (not submission.updated_at or last_seen > submission.updated_at):
+        return last_seen
+    return submission.updated_at
+
+
+def touch_last_seen(submission, now):
+    """
+    Stores the time of an autosave request on the submission, also for ones that don't write answers.
+    - Only written if the stored time is older than half the autosave interval, so stale
+      and buffered autosaves don't each need a write
+    - Changes are committed by the caller
+    """
+    last_seen = submission.last_seen_at
+    if not last_seen or (now - last_seen).total_seconds() >= AUTOSAVE_INTERVAL / 2:
+        submission.last_seen_at = now
+
+
+def validate_answer_patch(paper, patch):
+    """
+    Checks a {question_id: answer} patch against the exam paper, without looking at other questions.
+    - Returns the patch with int keys and values, or None if it's invalid
+    """
+    questions = {q.question_id: q for q in paper}
+    validated = {}
+
+    for key, answer in patch.items():
+        try:
+            question = questions.get(int(key))
+        except (TypeError, ValueError):
+            return None
+        if not question:
+            return None
+
+        option_ids = {option_id for option_id, _ in question.choices}
+        if question.is_multiple_correct:
+            if answer is None:
+                answer = []
+            if not isinstance(answer, list) or not all(isinstance(a, int) and a in option_ids for a in answer):
+                return None
+        elif answer is not None and not (isinstance(answer, int) and answer in option_ids):
+            return None
+
+        validated[question.question_id] = answer
+
+    return validated
 
 
 ##### User-Accessible Routes #####
@@ -118,7 +224,7 @@ def initialization():
         current_exam_id = submission.exam_id
         session['current_exam_id'] = submission.exam_id
 
-        taking_exam_now = (int((current_datetime - submission.updated_at).total_seconds()) <= (AUTOSAVE_INTERVAL + AUTOSAVE_GRACE_PERIOD))
+        taking_exam_now = (int((current_datetime - last_activity(submission)).total_seconds()) <= (AUTOSAVE_INTERVAL + AUTOSAVE_GRACE_PERIOD))
     else:
         # Validate the cookie that was set in exam search
         current_exam_id = session.get('current_exam_id')
@@ -154,17 +260,8 @@ def initialization():
             return redirect(url_for('take_examBp.exam_search'))
 
         if form.accept.data:
-            # Initialize submission and store it in the database + as a cookie
-            current_datetime = datetime.utcnow()
-            submission = Submissions(
-                exam_id = exam.exam_id,
-                roll_number = current_user.roll_number,
-                started_at = current_datetime,
-                updated_at = current_datetime,
-                status = "IN_PROGRESS"
-            )
-            db.session.add(submission)
-            db.session.commit()
+            # Initialize submission (or reuse the unfinished one) and store it in the database + as a cookie
+            submission = start_submission(exam, current_user.roll_number)
 
         # Cookies that act as one-time tokens are required to start/continue single-session exams
         if single_session:
@@ -185,6 +282,9 @@ def start():
     if not current_submission_id:
         return redirect(url_for('take_examBp.initialization'))
 
+    # Make sure buffered autosaves are shown, and can't later overwrite what's saved or submitted here
+    flush_autosaves([current_submission_id])
+
     submission = Submissions.query.get(current_submission_id)
     if not submission or submission.status != "IN_PROGRESS":
         session.pop('current_submission_id', None)
@@ -213,102 +313,87 @@ def start():
             session.pop('can_start', None)
             session['can_save_or_sub'] = True
 
-        # Retrive the exams questions in order
-        questions = Questions.query.filter_by(exam_id=exam.exam_id).order_by(Questions.order_index.asc()).all()
-
-        # Shuffle order if the setting is enabled
-        if exam.security_settings["shuffle"]:
-            random.shuffle(questions)
-
-        # Save order to use when saving or submitting
-        session["shuffled_order"] = [q.question_id for q in questions]
+    # Retrive the exams questions in order, or in the order derived from the submission's seed if shuffling is enabled
+    order_seed = submission_order_seed(submission, exam)
+    shuffle_options = order_seed is not None and exam.security_settings.get("shuffle_options", False)
+    paper = get_exam_paper(exam.exam_id)
+    if order_seed is None:
+        questions = list(paper)
     else:
-        # Retreive question order used on page load
-        ordered_ids = session.get('shuffled_order')
-        if not ordered_ids:
-            flash('Correct question order unknown. Saving/Submitting failed.', 'danger')
-            return redirect(url_for('initialization'))
-
-        questions = Questions.query.filter(Questions.question_id.in_(ordered_ids)).all()
-        questions.sort(key=lambda q: ordered_ids.index(q.question_id))
-
-    # Retrieve saved answers, if any, and convert them to the correct dict format
-    # (keys must be ints, e.g., {'5': 14, '6': [16, 17, 18]} --> {5: 14, 6: [16, 17, 18]})
-    saved_answers = submission.answers or {}
-    saved_answers = {int(k): v for k, v in saved_answers.items()}
+        questions = order_paper(paper, order_seed, shuffle_options=shuffle_options)
 
     form = SubmissionForm()
 
-    # Populate the dynamic form with questions
-    for index, question in enumerate(questions):
-        # Append new question subform if needed
-        if index >= len(form.questions):
-            form.questions.append_entry()
-
-        subform = form.questions[index]
-        subform.question_id.data = question.question_id
-        options = Options.query.filter_by(question_id=question.question_id).all()
-        choices = [(int(opt.option_id), opt.option_text) for opt in options]
+    if is_post:
+        # Populate the dynamic form with the questions' choices, so the answers can be validated
+        for index, question in enumerate(questions):
+            # Append new question subform if needed
+            if index >= len(form.questions):
+                form.questions.append_entry()
 
-        if question.is_multiple_correct:
-            subform.single_or_multi.data = 'multi'
-            subform.answer_multi.choices = choices
-
-            # Load saved answers on the submission from the DB, ONLY if it's not a POST request,
-            # otherwise it'll overwrite any changes every time
-            if not is_post and question.question_id in saved_answers:
-                subform.answer_multi.data = saved_answers[question.question_id]
+            subform = form.questions[index]
+            subform.question_id.data = question.question_id
 
-        else:
-            subform.single_or_multi.data = 'single'
-            subform.answer_single.choices = choices
-
-            if not is_post and question.question_id in saved_answers:
-                subform.answer_single.data = saved_answers[question.question_id]
+            if question.is_multiple_correct:
+                subform.single_or_multi.data = 'multi'
+                subform.answer_multi.choices = list(question.choices)
+            else:
+                subform.single_or_multi.data = 'single'
+                subform.answer_single.choices = list(question.choices)
 
-        print(f"[U5] Added question {question.question_id} with choices {choices}") # Debugging
+        if form.validate_on_submit():
+            print("[U5] Submission form validated") # Debugging
 
+            # PROBABLY NOT NEEDED
+            if submission.status != "IN_PROGRESS":
+                return redirect(url_for('dashboard'))
 
-    if form.validate_on_submit():
-        print("[U5] Submission form validated") # Debugging
+            # Student's need a token to save or submit in single-session mode
+            if exam.security_settings['single_session'] and not session.get('can_save_or_sub'):
+                return redirect(url_for('take_examBp.initialization'))
 
-        # PROBABLY NOT NEEDED
-        if submission.status != "IN_PROGRESS":
-            return redirect(url_for('dashboard'))
+            # Collect answers
+            answers = {}
+            for subform in form.questions:
+                qid = subform.question_id.data
 
-        # Student's need a token to save or submit in single-session mode
-        if exam.security_settings['single_session'] and not session.get('can_save_or_sub'):
-            return redirect(url_for('take_examBp.initialization'))
+                if subform.single_or_multi.data == 'multi':
+                    answers[qid] = subform.answer_multi.data
+                else:
+                    answers[qid] = subform.answer_single.data
 
-        # Collect answers
-        answers = {}
-        for subform in form.questions:
-            qid = subform.question_id.data
+            print(f"[U5] Collected answers {answers} for submission {current_submission_id}") # Debugging
 
-            if subform.single_or_multi.data == 'multi':
-                answers[qid] = subform.answer_multi.data
-            else:
-                answers[qid] = subform.answer_single.data
+            save_selections({submission.submission_id: answers})
+            submission.updated_at = datetime.utcnow()
 
-        print(f"[U5] Collected answers {answers} for submission {current_submission_id}") # Debugging
+            if (form.submit_flag.data == "1"):
+                finalize_submission(submission)
+                flash('Submitted successfully!', 'success')
 
-        submission.answers = answers
-        submission.updated_at = datetime.utcnow()
+            session.pop('current_submission_id', None)
+            session.pop('current_exam_id', None)
+            session.pop('can_save_or_sub', None)
+            db.session.commit()
 
-        if (form.submit_flag.data == "1"):
-            finalize_submission(submission, answers, questions)
-            flash('Submitted successfully!', 'success')
+            return redirect(url_for('dashboard'))
 
-        session.pop('current_submission_id', None)
-        session.pop('current_exam_id', None)
-        session.pop('shuffled_order', None)
-        session.pop('can_save_or_sub', None)
-        db.session.commit()
+        # Keep the choices the student just sent when showing the page again
+        selected_ids = posted_option_ids(request.form)
+    else:
+        # Show the answers saved on the submission in the DB
+        selected_ids = {
+            option_id
+            for options in load_selections([submission.submission_id]).get(submission.submission_id, {}).values()
+            for option_id in options
+        }
 
-        return redirect(url_for('dashboard'))
+    # The question list is rendered once per exam version and order, then the student's answers are overlaid
+    paper_html = overlay_answers(render_paper_fragment(exam.exam_id, questions, order_seed, shuffle_options), selected_ids)
 
     return render_template(
-        'submission.html', form=form, exam=exam, questions=questions, feedback=submission.feedback,
+        'submission.html', form=form, exam=exam, questions=questions, paper_html=paper_html, feedback=submission.feedback,
+        autosave_seq=(submission.autosave_seq or 0),
         remaining_seconds=int((exam.closes_at - datetime.utcnow()).total_seconds()), interval=(AUTOSAVE_INTERVAL * 1000) # The interval is needed in ms for the template
     )
 
@@ -316,11 +401,13 @@ def start():
 ########## User-Innacessible Endpoint ##########
 @take_examBp.route("/autosave", methods=["POST"])
 @login_required
+@retry_on_busy
 def autosave():
     submission_id = session.get("current_submission_id")
     if not submission_id:
         return ("no active submission", 400)
 
+    flush_autosaves([submission_id])
     submission = Submissions.query.get(submission_id)
     if not submission or submission.status != "IN_PROGRESS":
         return ("invalid submission", 400)
@@ -338,7 +425,7 @@ def autosave():
             else:
                 answers[qid] = subform.answer_single.data
 
-        submission.answers = answers
+        save_selections({submission_id: answers})
     elif save_type == "report":
         feedback = request.form.get("feedback")
 
@@ -353,3 +440,59 @@ def autosave():
     db.session.commit()
     print(f"[U5] Autosaved {save_type} for submission {submission_id}")
     return ("autosaved", 200)
+
+
+@take_examBp.route("/autosave/v2", methods=["POST"])
+@login_required
+@retry_on_busy
+def autosave_patch():
+    """
+    Autosave that only receives the answers changed since the last one.
+    - Body: {"seq": <client sequence number>, "answers": {"<question_id>": <answer>, ...}}
+    - Stale sequence numbers and empty patches don't write anything
+    - Only the patched questions are validated and written, one row per question
+    """
+    submission_id = session.get("current_submission_id")
+    if not submission_id:
+        return jsonify(error="no active submission"), 400
+
+    submission = Submissions.query.get(submission_id)
+    if not submission or submission.status != "IN_PROGRESS":
+        return jsonify(error="invalid submission"), 400
+
+    data = request.get_json(silent=True) or {}
+    seq = data.get("seq")
+    patch = data.get("answers") or {}
+    if not isinstance(seq, int) or not isinstance(patch, dict):
+        return jsonify(error="seq and answers are required"), 400
+
+    touch_last_seen(submission, datetime.utcnow())
+
+    # With write-behind enabled, the latest patch may still be in the buffer
+    pending = get_pending(submission_id)
+    saved_seq = pending.seq if pending else (submission.autosave_seq or 0)
+
+    if seq <= saved_seq:
+        db.session.commit()
+        return jsonify(status="stale", seq=saved_seq), 200
+    if not patch:
+        db.session.commit()
+        return jsonify(status="unchanged", seq=saved_seq), 200
+
+    changes = validate_answer_patch(get_exam_paper(submission.exam_id), patch)
+    if changes is None:
+        db.session.commit()
+        return jsonify(error="invalid answers"), 400
+
+    # Only the rows of the changed questions are written
+    if AUTOSAVE_WRITE_BEHIND:
+        buffer_autosave(submission_id, changes, seq, datetime.utcnow())
+        db.session.commit()
+    else:
+        save_selections({submission_id: changes})
+        submission.autosave_seq = seq
+        submission.updated_at = datetime.utcnow()
+        db.session.commit()
+
+    print(f"[U5] Autosaved {len(changes)} answers for submission {submission_id}")
+    return jsonify(status="saved", seq=seq), 200
@@ -0,0 +1,135 @@
+"""
+Result Export
+
+Streams the results of one exam or of all exams of a course as CSV or NDJSON.
+
+Rows are read from a single SQLite cursor while the response is being sent, one
+submission at a time, so the export never holds the whole result set in memory
+and the header goes out before the query has produced its first row.
+
+- One line per submission: exam, student, status, per-question points and totals
+- Per-question points are the final, manual or automatic points, whichever is set
+- CSV has one column per question position (Q1, Q2, ...), NDJSON maps question IDs to points
+"""
+
+# Built-in Python imports
+from itertools import groupby
+import csv
+import io
+import json
+import os
+
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 65536))
+
+EXPORT_FIELDS = [
+    "submission_id", "exam_id", "exam_title", "roll_number", "student_name",
+    "status", "submitted_at", "total_score", "total_points"
+]
+
+# Submissions that have been handed in, like the instructors' results list
+_EXPORT_QUERY = """
+    SELECT
+        s.submission_id, s.exam_id, e.title AS exam_title, s.roll_number, st.name AS student_name,
+        s.status, s.submitted_at, s.total_score, e.total_points,
+        a.question_id, COALESCE(a.final_points, a.manual_points, a.auto_points) AS points
+    FROM submissions s
+    JOIN exams e ON e.exam_id = s.exam_id
+    JOIN students st ON st.roll_number = s.roll_number
+    LEFT JOIN submission_answers a ON a.submission_id = s.submission_id
+    WHERE e.instructor_email = ? AND {scope}
+      AND s.status IN ('SUBMITTED', 'GRADED', 'IN_REVIEW', 'REVIEWED')
+    ORDER BY s.submission_id
+"""
+
+
+def question_positions(cur, exam_ids):
+    """Returns {question_id: position} with positions counted from 1 within each exam."""
+    if not exam_ids:
+        return {}
+
+    placeholders = ", ".join("?" for _ in exam_ids)
+    cur.execute(f"""
+        SELECT exam_id, question_id
+        FROM questions
+        WHERE exam_id IN ({placeholders})
+        ORDER BY exam_id, order_index, question_id
+    """, list(exam_ids))
+
+    positions = {}
+    for _, rows in groupby(cur.fetchall(), key=lambda r: r["exam_id"]):
+        for position, row in enumerate(rows, start=1):
+            positions[row["question_id"]] = position
+    return positions
+
+
+def iter_submissions(cur, instructor_email, exam_id=None, course_code=None):
+    """
+    - Runs the export query and yields (submission fields, {question_id: points}) per submission
+    - Rows are stepped through lazily, only one submission is held at a time
+    """
+    if exam_id is not None:
+        scope, params = "e.exam_id = ?", [instructor_email, exam_id]
+    else:
+        scope, params = "e.course_code = ?", [instructor_email, course_code]
+
+    cur.execute(_EXPORT_QUERY.format(scope=scope), params)
+
+    for _, rows in groupby(cur, key=lambda r: r["submission_id"]):
+        points = {}
+        for row in rows:
+            if row["question_id"] is not None:
+                points[row["question_id"]] = row["points"]
+        yield {field: row[field] for field in EXPORT_FIELDS}, points
+
+
+def _chunked(lines):
+    """Joins small pieces of output into chunks of about EXPORT_CHUNK_SIZE characters."""
+    buffer = io.StringIO()
+    for line in lines:
+        buffer.write(line)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer = io.StringIO()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def csv_lines(submissions, positions):
+    """Yields the CSV header, then one line per submission."""
+    question_count = max(positions.values(), default=0)
+
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def render(values):
+        line.seek(0)
+        line.truncate()
+        writer.writerow(values)
+        return line.getvalue()
+
+    yield render(EXPORT_FIELDS + [f"Q{n}" for n in range(1, question_count + 1)])
+
+    for fields, points in submissions:
+        by_position = [""] * question_count
+        for question_id, question_points in points.items():
+            position = positions.get(question_id)
+            if position and question_points is not None:
+                by_position[position - 1] = question_points
+        yield render([fields[field] for field in EXPORT_FIELDS] + by_position)
+
+
+def ndjson_lines(submissions):
+    """Yields one JSON object per submission."""
+    for fields, points in submissions:
+        yield json.dumps({**fields, "questions": {str(qid): p for qid, p in points.items()}}) + "\n"
+
+
+def stream_export(conn, lines):
+    """Yields the first line on its own (the CSV header goes out before the query runs), then chunks, and returns the connection afterwards."""
+    try:
+        lines = iter(lines)
+        yield next(lines, "")
+        yield from _chunked(lines)
+    finally:
+        conn.close()
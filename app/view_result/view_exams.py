@@ -1,20 +1,15 @@
-import sqlite3
 import json
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, Response, request, jsonify, render_template, stream_with_context, url_for
 from flask_login import current_user, login_required
+from werkzeug.utils import secure_filename
 
-# Database connection helper
-def get_db():
-    """Connect to database with Row factory for dict-like access."""
-    conn = sqlite3.connect("oesDB.db")
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
-
-# Convert database row to dictionary
-def row_to_dict(row):
-    """Convert SQLite Row object to dictionary."""
-    return {k: row[k] for k in row.keys()}
+from app.database import get_db, row_to_dict
+from app.grading import get_answer_key, grade_questions
+from app.take_exam.paper import get_exam_paper
+from app.pagination import page_args, keyset_condition, paginate
+from app.exam_stats import load_exam_stats
+from app.item_analysis import analyze_exam
+from app.view_result.export import question_positions, iter_submissions, csv_lines, ndjson_lines, stream_export
 
 exam_viewBp = Blueprint('exam_view', __name__, template_folder='templates')
 
@@ -39,6 +34,11 @@ def list_results():
     if not roll_number and not (current_user.is_authenticated and getattr(current_user, "role", None) == "Instructor"):
         return "roll_number query parameter is required", 400
 
+    try:
+        limit, cursor = page_args(request.args)
+    except ValueError as e:
+        return str(e), 400
+
     conn = get_db()
     cur = conn.cursor()
 
@@ -46,7 +46,7 @@ def list_results():
     base_select = """
         SELECT
             s.submission_id, s.exam_id, s.total_score, s.status, s.submitted_at,
-            (SELECT COALESCE(SUM(points),0) FROM questions q WHERE q.exam_id = e.exam_id) AS total_points,
+            e.total_points,
             e.title, e.course_code, c.course_name,
             i.name AS instructor_name, i.email AS instructor_email,
             st.name AS student_name, st.roll_number
@@ -93,16 +93,32 @@ def list_results():
             query += " AND i.name LIKE ?"
             params.append(f"%{instructor_name}%")
 
-    query += " ORDER BY s.submitted_at DESC"
+    # Keyset pagination, newest first
+    if cursor:
+        condition, cursor_params = keyset_condition("s.submitted_at", "s.submission_id", cursor, descending=True)
+        query += " AND " + condition
+        params += cursor_params
+
+    query += " ORDER BY s.submitted_at DESC, s.submission_id DESC LIMIT ?"
+    params.append(limit + 1)
     
     # Execute query and get results
     cur.execute(query, params)
-    results = [row_to_dict(r) for r in cur.fetchall()]
+    results, next_cursor = paginate(
+        [row_to_dict(r) for r in cur.fetchall()], limit, lambda r: (r["submitted_at"], r["submission_id"])
+    )
     conn.close()
 
+    # Page links keep the search filters
+    filters = {k: v for k, v in request.args.items() if k != "cursor"}
+    next_url = url_for('exam_view.list_results', **filters, cursor=next_cursor) if next_cursor else None
+    first_url = url_for('exam_view.list_results', **filters) if cursor else None
+
     return render_template(
         'view_results.html',
         results=results,
+        next_url=next_url,
+        first_url=first_url,
         roll_number=roll_number,
         course_code=course_code or "",
         instructor_name=instructor_name or "",
@@ -117,10 +133,15 @@ def api_list_results():
     if not roll_number:
         return jsonify(error="roll_number required"), 400
 
+    try:
+        limit, cursor = page_args(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
     conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("""
+    query = """
         SELECT
             s.submission_id,
             s.exam_id,
@@ -133,12 +154,129 @@ def api_list_results():
         JOIN exams e ON e.exam_id = s.exam_id
         WHERE s.roll_number = ?
           AND s.status IN ('SUBMITTED', 'GRADED')
-        ORDER BY s.submitted_at DESC
-    """, (roll_number,))
-    rows = cur.fetchall()
+    """
+    params = [roll_number]
+
+    # Keyset pagination, newest first
+    if cursor:
+        condition, cursor_params = keyset_condition("s.submitted_at", "s.submission_id", cursor, descending=True)
+        query += " AND " + condition
+        params += cursor_params
+
+    query += " ORDER BY s.submitted_at DESC, s.submission_id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    cur.execute(query, params)
+    results, next_cursor = paginate(
+        [row_to_dict(r) for r in cur.fetchall()], limit, lambda r: (r["submitted_at"], r["submission_id"])
+    )
+    conn.close()
+
+    return jsonify(results=results, next_cursor=next_cursor)
+
+
+# Bulk export of exam results
+@exam_viewBp.route('/results/export', methods=['GET'])
+@login_required
+def export_results():
+    """Stream the results of one of the instructor's exams (?exam_id=) or courses (?course_code=) as CSV or NDJSON."""
+    if getattr(current_user, "role", None) != "Instructor":
+        return "Only instructors can export results", 403
+
+    exam_id = request.args.get('exam_id', type=int)
+    course_code = request.args.get('course_code')
+    fmt = request.args.get('format', 'csv')
+
+    if exam_id is None and not course_code:
+        return "exam_id or course_code query parameter is required", 400
+    if fmt not in ("csv", "ndjson"):
+        return "format must be csv or ndjson", 400
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    if exam_id is not None:
+        cur.execute("SELECT exam_id FROM exams WHERE exam_id = ? AND instructor_email = ?", (exam_id, current_user.email))
+    else:
+        cur.execute("SELECT exam_id FROM exams WHERE course_code = ? AND instructor_email = ?", (course_code, current_user.email))
+    exam_ids = [row["exam_id"] for row in cur.fetchall()]
+
+    if exam_id is not None and not exam_ids:
+        conn.close()
+        return "Exam not found", 404
+
+    submissions = iter_submissions(conn.cursor(), current_user.email, exam_id=exam_id, course_code=course_code)
+    if fmt == "csv":
+        lines, mimetype = csv_lines(submissions, question_positions(cur, exam_ids)), "text/csv"
+    else:
+        lines, mimetype = ndjson_lines(submissions), "application/x-ndjson"
+
+    # The connection is returned to the pool by the generator, once the last row is sent
+    filename = secure_filename(f"results-{exam_id if exam_id is not None else course_code}.{fmt}")
+    return Response(
+        stream_with_context(stream_export(conn, lines)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+# Statistics of an exam
+@exam_viewBp.route('/api/exams/<int:exam_id>/stats', methods=['GET'])
+@login_required
+def api_exam_stats(exam_id):
+    """API endpoint to get the precomputed score and question statistics of one of the instructor's exams."""
+    if getattr(current_user, "role", None) != "Instructor":
+        return jsonify(error="Only instructors can view exam statistics"), 403
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    cur.execute("SELECT instructor_email, total_points FROM exams WHERE exam_id = ?", (exam_id,))
+    exam = cur.fetchone()
+    if not exam:
+        conn.close()
+        return jsonify(error="Exam not found"), 404
+    if exam["instructor_email"] != current_user.email:
+        conn.close()
+        return jsonify(error="Not allowed to view this exam"), 403
+
+    stats = load_exam_stats(conn, exam_id)
+    conn.close()
+
+    if stats is None:
+        stats = {"exam_id": exam_id, "submission_count": 0, "questions": []}
+    stats["total_points"] = exam["total_points"]
+
+    return jsonify(stats)
+
+
+# Item analysis of an exam
+@exam_viewBp.route('/api/exams/<int:exam_id>/item-analysis', methods=['GET'])
+@login_required
+def api_item_analysis(exam_id):
+    """API endpoint to get p-values, discrimination, distractor analysis and Cronbach's alpha of one of the instructor's exams."""
+    if getattr(current_user, "role", None) != "Instructor":
+        return jsonify(error="Only instructors can view item analysis"), 403
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    cur.execute("SELECT instructor_email FROM exams WHERE exam_id = ?", (exam_id,))
+    exam = cur.fetchone()
+    if not exam:
+        conn.close()
+        return jsonify(error="Exam not found"), 404
+    if exam["instructor_email"] != current_user.email:
+        conn.close()
+        return jsonify(error="Not allowed to view this exam"), 403
+
+    analysis = analyze_exam(conn, exam_id)
     conn.close()
 
-    return jsonify([row_to_dict(r) for r in rows])
+    if analysis is None:
+        return jsonify(error="Exam has no questions"), 404
+
+    return jsonify(analysis)
 
 
 # View detailed exam result with questions and answers
@@ -191,19 +329,6 @@ def view_result_detail(submission_id):
     exam_id = sub["exam_id"]
     total_score = sub["total_score"]
     feedback = sub["feedback"]
-    answers_json = sub["answers"] or "{}"
-    answers = json.loads(answers_json)
-
-    # Parse answers format (can be dict or list)
-    is_answers_map = isinstance(answers, dict)
-    answers_by_q = {}
-    if not is_answers_map and isinstance(answers, list):
-        for a in answers:
-            try:
-                qid = int(a.get("question_id"))
-            except Exception:
-                continue
-            answers_by_q[qid] = a
 
     # Show message if exam not graded yet
     if status not in ("GRADED", "REVIEWED"):
@@ -216,94 +341,66 @@ def view_result_detail(submission_id):
             total_score=None
         )
 
-    # Get questions and options for this exam
+    # One row per answered question
     cur.execute("""
-        SELECT q.question_id, q.question_text, q.points, q.is_multiple_correct,
-               o.option_id, o.option_text, o.is_correct
-        FROM questions q
-        LEFT JOIN options o ON o.question_id = q.question_id
-        WHERE q.exam_id = ?
-        ORDER BY q.order_index, o.option_id
-    """, (exam_id,))
-    rows = cur.fetchall()
+        SELECT question_id, selected_option_ids, auto_points, manual_points, final_points
+        FROM submission_answers
+        WHERE submission_id = ?
+    """, (submission_id,))
+    answers_by_q = {row["question_id"]: row for row in cur.fetchall()}
+
     conn.close()
 
+    # Questions, options, correct answers and points all come from the exam cache
+    answer_key = get_answer_key(exam_id)
+    paper = get_exam_paper(exam_id)
+
     # Build questions data structure
     questions = {}
-    for r in rows:
-        qid = r["question_id"]
-        if qid not in questions:
-            questions[qid] = {
-                "question_id": qid,
-                "question_text": r["question_text"],
-                "points": r["points"],
-                "is_multiple_correct": bool(r["is_multiple_correct"]),
-                "options": []
-            }
-        if r["option_id"] is not None:
-            questions[qid]["options"].append({
-                "option_id": r["option_id"],
-                "option_text": r["option_text"],
-                "is_correct": bool(r["is_correct"])
-            })
+    for pq in paper:
+        key_entry = answer_key.get(pq.question_id)
+        if key_entry is None:
+            continue
+        questions[pq.question_id] = {
+            "question_id": pq.question_id,
+            "question_text": pq.question_text,
+            "points": key_entry.points,
+            "is_multiple_correct": pq.is_multiple_correct,
+            "options": [
+                {
+                    "option_id": option_id,
+                    "option_text": option_text,
+                    "is_correct": option_id in key_entry.correct_ids
+                }
+                for option_id, option_text in pq.choices
+            ]
+        }
+
+    selections = {qid: json.loads(entry["selected_option_ids"] or "[]") for qid, entry in answers_by_q.items()}
+
+    # Answers without grading data are graded the same way as on hand-in
+    computed_points = grade_questions(answer_key, selections)
 
     # Mark which options the student selected
     for qid, qdata in questions.items():
-        # Get selected option IDs from answers
-        if is_answers_map:
-            selected_ids = answers.get(str(qid), [])
-        else:
-            entry = answers_by_q.get(qid)
-            if entry is None:
-                selected_ids = []
-            else:
-                # Handle different answer formats
-                if isinstance(entry.get('selected_option_ids'), list):
-                    selected_ids = entry.get('selected_option_ids')
-                elif isinstance(entry.get('selected'), list):
-                    selected_ids = entry.get('selected')
-                elif isinstance(entry.get('answer'), list):
-                    selected_ids = entry.get('answer')
-                elif isinstance(entry.get('answer'), int):
-                    selected_ids = [entry.get('answer')]
-                else:
-                    selected_ids = []
-        
-        if isinstance(selected_ids, int):
-            selected_ids = [selected_ids]
-        selected_ids = set(map(int, selected_ids)) if selected_ids else set()
+        entry = answers_by_q.get(qid)
+        selected_ids = set(selections.get(qid) or [])
 
         # Mark selected options in data
         for opt in qdata["options"]:
             opt["selected_by_student"] = opt["option_id"] in selected_ids
 
         # Calculate earned points for this question
-        entry = answers_by_q.get(qid) if not is_answers_map else None
-        if entry is not None:
+        if entry is not None and entry["final_points"] is not None:
+            qdata['earned_points'] = float(entry["final_points"])
+        elif entry is not None and entry["manual_points"] is not None:
             # Use manually graded points if available
-            final_p = entry.get('final_points')
-            manual_p = entry.get('manual_points')
-            auto_p = entry.get('auto_points')
-            if final_p is not None:
-                qdata['earned_points'] = float(final_p)
-            elif manual_p is not None:
-                qdata['earned_points'] = float(manual_p)
-            elif auto_p is not None:
-                qdata['earned_points'] = float(auto_p)
-            else:
-                # Auto-grade: full points if all correct answers selected
-                correct_ids = {o['option_id'] for o in qdata['options'] if o.get('is_correct')}
-                if correct_ids and selected_ids == correct_ids:
-                    qdata['earned_points'] = qdata['points']
-                else:
-                    qdata['earned_points'] = 0
+            qdata['earned_points'] = float(entry["manual_points"])
+        elif entry is not None and entry["auto_points"] is not None:
+            qdata['earned_points'] = float(entry["auto_points"])
         else:
             # No grading data, compute automatically
-            correct_ids = {o['option_id'] for o in qdata['options'] if o.get('is_correct')}
-            if correct_ids and selected_ids == correct_ids:
-                qdata['earned_points'] = qdata['points']
-            else:
-                qdata['earned_points'] = 0
+            qdata['earned_points'] = computed_points.get(qid, 0)
 
     # Calculate total possible points
     total_possible = sum(q['points'] for q in questions.values())
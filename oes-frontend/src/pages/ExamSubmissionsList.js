@@ -5,24 +5,61 @@ import { useParams, Link } from "react-router-dom";
 function ExamSubmissionsList() {
   const { examId } = useParams();
   const [submissions, setSubmissions] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [statusFilter, setStatusFilter] = useState("");
   const [error, setError] = useState("");
+  const [finalizeProgress, setFinalizeProgress] = useState(null);
 
-  async function loadSubmissions() {
+  // Loads the first page, or appends the next one
+  async function loadSubmissions(append = false) {
     setError("");
     try {
-      let url = `http://localhost:5000/grading/exams/${examId}/submissions`;
+      const params = {};
       if (statusFilter) {
-        url += `?status=${encodeURIComponent(statusFilter)}`;
+        params.status = statusFilter;
       }
-      const res = await axios.get(url);
-      setSubmissions(res.data);
+      if (append && nextCursor) {
+        params.cursor = nextCursor;
+      }
+      const res = await axios.get(
+        `http://localhost:5000/grading/exams/${examId}/submissions`,
+        { params }
+      );
+      setSubmissions((prev) =>
+        append ? [...prev, ...res.data.submissions] : res.data.submissions
+      );
+      setNextCursor(res.data.next_cursor);
     } catch (err) {
       console.error(err);
       setError("Failed to load submissions");
     }
   }
 
+  // Marks every SUBMITTED / IN_REVIEW submission as graded, the server works through them in chunks
+  async function handleFinalizeAll() {
+    if (!window.confirm("Finalize the review of all submitted submissions of this exam?")) return;
+    setError("");
+    const url = `http://localhost:5000/grading/exams/${examId}/finalize`;
+
+    try {
+      let res = await axios.post(url);
+      setFinalizeProgress(res.data);
+
+      // Running in the background: poll the progress
+      while (res.data.status !== "DONE") {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        res = await axios.get(url);
+        setFinalizeProgress(res.data);
+      }
+
+      loadSubmissions();
+    } catch (err) {
+      console.error(err);
+      setError("Failed to finalize reviews");
+      setFinalizeProgress(null);
+    }
+  }
+
   useEffect(() => {
     loadSubmissions();
     // eslint-disable-next-line react-hooks/exhaustive-deps
@@ -46,9 +83,25 @@ function ExamSubmissionsList() {
         </select>
       </div>
 
-      <button className="btn btn-secondary btn-sm mt-2" onClick={loadSubmissions}>
-        Refresh
-      </button>
+      <div className="d-flex align-items-center gap-2 mt-2">
+        <button className="btn btn-secondary btn-sm" onClick={() => loadSubmissions()}>
+          Refresh
+        </button>
+        <button
+          className="btn btn-primary btn-sm"
+          onClick={handleFinalizeAll}
+          disabled={finalizeProgress != null && finalizeProgress.status !== "DONE"}
+        >
+          Finalize All Reviews
+        </button>
+        {finalizeProgress && (
+          <span>
+            {finalizeProgress.status === "DONE"
+              ? `Finalized ${finalizeProgress.done} reviews.`
+              : `Finalizing... ${finalizeProgress.done} / ${finalizeProgress.total}`}
+          </span>
+        )}
+      </div>
 
       {error && <div className="alert alert-danger mt-3">{error}</div>}
 
@@ -93,6 +146,12 @@ function ExamSubmissionsList() {
         </tbody>
       </table>
 
+      {nextCursor && (
+        <button className="btn btn-outline-primary btn-sm" onClick={() => loadSubmissions(true)}>
+          Load more
+        </button>
+      )}
+
       <Link className="btn btn-link mt-3" to="/instructor/grading">
         ← Back to Manual Grading Dashboard
       </Link>
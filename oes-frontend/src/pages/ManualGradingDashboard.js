@@ -5,15 +5,19 @@ import { Link } from "react-router-dom";
 function ManualGradingDashboard() {
   const [email, setEmail] = useState("teacher@uni.com");
   const [exams, setExams] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [error, setError] = useState("");
 
-  async function loadDashboard() {
+  // Loads the first page, or appends the next one
+  async function loadDashboard(append = false) {
     setError("");
     try {
       const res = await axios.get(
-        `http://localhost:5000/grading/dashboard/${encodeURIComponent(email)}`
+        `http://localhost:5000/grading/dashboard/${encodeURIComponent(email)}`,
+        { params: append && nextCursor ? { cursor: nextCursor } : {} }
       );
-      setExams(res.data);
+      setExams((prev) => (append ? [...prev, ...res.data.exams] : res.data.exams));
+      setNextCursor(res.data.next_cursor);
     } catch (err) {
       console.error(err);
       setError("Failed to load manual grading dashboard");
@@ -36,7 +40,7 @@ function ManualGradingDashboard() {
         onChange={(e) => setEmail(e.target.value)}
       />
 
-      <button className="btn btn-primary mt-3" onClick={loadDashboard}>
+      <button className="btn btn-primary mt-3" onClick={() => loadDashboard()}>
         Load Manual Grading
       </button>
 
@@ -65,6 +69,12 @@ function ManualGradingDashboard() {
           </li>
         ))}
       </ul>
+
+      {nextCursor && (
+        <button className="btn btn-outline-primary btn-sm mt-3" onClick={() => loadDashboard(true)}>
+          Load more
+        </button>
+      )}
     </div>
   );
 }
@@ -8,6 +8,7 @@ function SubmissionReviewPage() {
   const [submission, setSubmission] = useState(null);
   const [answers, setAnswers] = useState([]);
   const [totalScore, setTotalScore] = useState(null);
+  const [version, setVersion] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
   const [overallFeedback, setOverallFeedback] = useState("");
@@ -23,6 +24,7 @@ function SubmissionReviewPage() {
       setSubmission(res.data);
       setAnswers(res.data.answers || []);
       setTotalScore(res.data.total_score || res.data.totalScore || null);
+      setVersion(res.data.version ?? null);
       setOverallFeedback(res.data.feedback || "");
     } catch (err) {
       console.error(err);
@@ -39,14 +41,23 @@ function SubmissionReviewPage() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
+  // Another instructor changed the submission since it was opened
+  function handleConflict(err) {
+    if (err.response?.status !== 409) return false;
+    alert(err.response.data.error);
+    openSubmission();
+    return true;
+  }
+
   async function handleToggleVerdict(questionId, forceCorrect) {
     try {
       const res = await axios.post(
         `http://localhost:5000/grading/submissions/${submissionId}/answers/${questionId}/toggle-verdict`,
-        { force_correct: forceCorrect }
+        { force_correct: forceCorrect, version }
       );
       const updatedFinal = res.data.final_points;
       const updatedTotal = res.data.total_score;
+      setVersion(res.data.version);
 
       setAnswers((prev) =>
         prev.map((a) =>
@@ -58,10 +69,51 @@ function SubmissionReviewPage() {
       setTotalScore(updatedTotal);
     } catch (err) {
       console.error(err);
+      if (handleConflict(err)) return;
       alert("Failed to toggle verdict");
     }
   }
 
+  // One batch request for every answer, applied all or nothing
+  async function handleApplyToAll(forceCorrect) {
+    if (answers.length === 0) return;
+    const verdict = forceCorrect ? "correct" : "wrong";
+    if (!window.confirm(`Mark all ${answers.length} answers as ${verdict}?`)) return;
+
+    try {
+      const res = await axios.post("http://localhost:5000/grading/batch", {
+        operations: answers.map((a) => ({
+          submission_id: Number(submissionId),
+          question_id: a.question_id,
+          force_correct: forceCorrect,
+          version,
+        })),
+      });
+      const points = new Map(
+        res.data.results.map((r) => [r.question_id, r.final_points])
+      );
+      const totals = res.data.submissions[0];
+      setVersion(totals.version);
+
+      setAnswers((prev) =>
+        prev.map((a) =>
+          points.has(a.question_id)
+            ? {
+                ...a,
+                manual_points: points.get(a.question_id),
+                final_points: points.get(a.question_id),
+              }
+            : a
+        )
+      );
+      setTotalScore(totals.total_score);
+    } catch (err) {
+      console.error(err);
+      if (handleConflict(err)) return;
+      alert(err.response?.data?.error || "Failed to apply verdict to all answers");
+    }
+  }
+
   async function handlePartialPoints(questionId, currentPoints) {
     const input = window.prompt(
       "Enter manual points:",
@@ -78,9 +130,10 @@ function SubmissionReviewPage() {
     try {
       const res = await axios.post(
         `http://localhost:5000/grading/submissions/${submissionId}/answers/${questionId}/manual-points`,
-        { points: value }
+        { points: value, version }
       );
       const updatedTotal = res.data.total_score;
+      setVersion(res.data.version);
 
       setAnswers((prev) =>
         prev.map((a) =>
@@ -92,6 +145,7 @@ function SubmissionReviewPage() {
       setTotalScore(updatedTotal);
     } catch (err) {
       console.error(err);
+      if (handleConflict(err)) return;
       alert("Failed to set manual points");
     }
   }
@@ -101,10 +155,11 @@ function SubmissionReviewPage() {
     if (!input) return;
 
     try {
-      await axios.post(
+      const res = await axios.post(
         `http://localhost:5000/grading/submissions/${submissionId}/feedback`,
         { comment: input, question_id: questionId }
       );
+      setVersion(res.data.version);
 
       setAnswers((prev) =>
         prev.map((a) =>
@@ -118,6 +173,7 @@ function SubmissionReviewPage() {
       );
     } catch (err) {
       console.error(err);
+      if (handleConflict(err)) return;
       alert("Failed to add question feedback");
     }
   }
@@ -128,13 +184,15 @@ function SubmissionReviewPage() {
       return;
     }
     try {
-      await axios.post(
+      const res = await axios.post(
         `http://localhost:5000/grading/submissions/${submissionId}/feedback`,
         { comment: overallFeedback }
       );
+      setVersion(res.data.version);
       alert("Overall feedback saved");
     } catch (err) {
       console.error(err);
+      if (handleConflict(err)) return;
       alert("Failed to save overall feedback");
     }
   }
@@ -145,8 +203,10 @@ function SubmissionReviewPage() {
         `http://localhost:5000/grading/submissions/${submissionId}/recalc`
       );
       setTotalScore(res.data.total_score);
+      setVersion(res.data.version);
     } catch (err) {
       console.error(err);
+      if (handleConflict(err)) return;
       alert("Failed to recalculate");
     }
   }
@@ -157,9 +217,11 @@ function SubmissionReviewPage() {
         `http://localhost:5000/grading/submissions/${submissionId}/save`
       );
       setTotalScore(res.data.total_score);
+      setVersion(res.data.version);
       alert("Submission graded and saved");
     } catch (err) {
       console.error(err);
+      if (handleConflict(err)) return;
       alert("Failed to save grading");
     }
   }
@@ -219,7 +281,25 @@ function SubmissionReviewPage() {
         </div>
       )}
 
-      <h5 className="mt-4">Answers</h5>
+      <div className="mt-4 d-flex justify-content-between align-items-center">
+        <h5 className="mb-0">Answers</h5>
+        <div className="d-flex gap-2">
+          <button
+            className="btn btn-sm btn-success"
+            onClick={() => handleApplyToAll(true)}
+            disabled={answers.length === 0}
+          >
+            Mark All Correct
+          </button>
+          <button
+            className="btn btn-sm btn-outline-danger"
+            onClick={() => handleApplyToAll(false)}
+            disabled={answers.length === 0}
+          >
+            Mark All Wrong
+          </button>
+        </div>
+      </div>
       <div className="list-group mt-2">
         {answers.map((ans) => (
           <div key={ans.question_id} className="list-group-item">
@@ -1,6 +1,11 @@
 import os
-from app import app, scheduler
-from app.scheduler import set_exam_timers
+import atexit
+from app import app
+# The scheduler instance is imported through app.scheduler, since that module's name shadows it on the app package
+from app.scheduler import scheduler, set_exam_timers, rebuild_exam_timers, catch_up_closed_exams, flush_autosave_buffer
+from app.take_exam.autosave_buffer import AUTOSAVE_WRITE_BEHIND, AUTOSAVE_FLUSH_INTERVAL
+from app.migrations import apply_migrations
+from app.manual_grading.finalize import resume_finalize_runs
 
 ACTIVE_EXAM_CHECK_INTERVAL=int(os.getenv('ACTIVE_EXAM_CHECK_INTERVAL'))
 
@@ -12,15 +17,41 @@ ACTIVE_EXAM_CHECK_INTERVAL=int(os.getenv('ACTIVE_EXAM_CHECK_INTERVAL'))
 print(app.url_map)
 
 if __name__ == "__main__":
+    # Bring the database schema up to date before serving requests
+    apply_migrations()
+
     # Necessary guard to prevent duplicate schedulers when running in debug mode
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-        scheduler.add_job(
-            id="schedule_timers",
-            func=set_exam_timers,
-            trigger="interval",
-            seconds=ACTIVE_EXAM_CHECK_INTERVAL,
-            replace_existing=True
-        )
+        # Auto-submit exams that closed while the app was down
+        catch_up_closed_exams()
+
+        # Continue bulk review finalizations that were interrupted
+        resume_finalize_runs()
+
+        # Exam routes register closing timers when they're written, this restores any that are missing
+        rebuild_exam_timers()
+
+        # Optional safety net that periodically checks all active exams for missing timers
+        if ACTIVE_EXAM_CHECK_INTERVAL > 0:
+            scheduler.add_job(
+                id="schedule_timers",
+                func=set_exam_timers,
+                trigger="interval",
+                seconds=ACTIVE_EXAM_CHECK_INTERVAL,
+                replace_existing=True
+            )
+
+        if AUTOSAVE_WRITE_BEHIND:
+            scheduler.add_job(
+                id="flush_autosaves",
+                func=flush_autosave_buffer,
+                trigger="interval",
+                seconds=AUTOSAVE_FLUSH_INTERVAL,
+                replace_existing=True
+            )
+
+            # Don't lose buffered autosaves on a normal shutdown
+            atexit.register(flush_autosave_buffer)
 
         scheduler.start()
         print("[Scheduler] Started")
@@ -63,6 +63,11 @@ VALUES
     (4, 'What is the time complexity of binary search?', 0, 5, 1),
     (4, 'Select all tree traversal algorithms.', 1, 10, 2);
 
+-- Exam totals
+UPDATE exams
+SET total_points = (SELECT COALESCE(SUM(points), 0) FROM questions q WHERE q.exam_id = exams.exam_id),
+    question_count = (SELECT COUNT(*) FROM questions q WHERE q.exam_id = exams.exam_id);
+
 -- Options
 INSERT INTO options
     (question_id, option_text, is_correct)
@@ -100,9 +105,23 @@ VALUES
 
 -- Submissions
 INSERT INTO submissions
-    (exam_id, roll_number, started_at, submitted_at, updated_at, feedback, status, answers, total_score)
+    (exam_id, roll_number, started_at, submitted_at, updated_at, feedback, status, total_score)
+VALUES
+    (1, 101, '2025-12-04 10:00:10', '2025-12-05 10:40:00', '2026-01-01 12:50:00', 'Good job!', 'REVIEWED', 18),
+    (1, 102, '2025-12-04 10:05:00', '2025-12-05 10:50:00', NULL, NULL, 'SUBMITTED', 10),
+
+    (3, 103, '2025-12-04 10:30:00', NULL, NULL, NULL, 'IN_PROGRESS', NULL);
+
+-- Submission answers
+INSERT INTO submission_answers
+    (submission_id, question_id, selected_option_ids, auto_points)
 VALUES
-    (1, 101, '2025-12-04 10:00:10', '2025-12-05 10:40:00', '2026-01-01 12:50:00', 'Good job!', 'REVIEWED', '{"1":2,"2":5}', 18),
-    (1, 102, '2025-12-04 10:05:00', '2025-12-05 10:50:00', NULL, NULL, 'SUBMITTED', '{"1":1,"2":5}', 10),
+    (1, 1, '[2]', 8),
+    (1, 2, '[5]', 10),
+
+    (2, 1, '[1]', 0),
+    (2, 2, '[5]', 10),
+
+    (3, 5, '[14]', NULL);
 
-    (3, 103, '2025-12-04 10:30:00', NULL, NULL, NULL, 'IN_PROGRESS', '{"5":14}', NULL);
+-- Exam statistics (exam_stats, question_stats) are counted by `flask rebuild-exam-stats`
@@ -30,6 +30,8 @@ CREATE TABLE IF NOT EXISTS exams (
     closes_at DATETIME NOT NULL,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
     updated_at DATETIME,
+    total_points INTEGER DEFAULT 0 NOT NULL,
+    question_count INTEGER DEFAULT 0 NOT NULL,
     FOREIGN KEY (instructor_email) REFERENCES instructors(email),
     FOREIGN KEY (course_code) REFERENCES courses(course_code)
 );
@@ -63,6 +65,71 @@ CREATE TABLE IF NOT EXISTS submissions (
     status TEXT CHECK (status IN ('IN_PROGRESS', 'SUBMITTED', 'IN_REVIEW', 'REVIEWED')) NOT NULL,
     answers TEXT,
     total_score INTEGER,
+    order_seed INTEGER,
+    autosave_seq INTEGER,
+    stats_score REAL,
+    version INTEGER DEFAULT 0 NOT NULL,
+    last_seen_at DATETIME,
     FOREIGN KEY (exam_id) REFERENCES exams (exam_id),
     FOREIGN KEY (roll_number) REFERENCES students (roll_number)
 );
+
+CREATE TABLE IF NOT EXISTS submission_answers (
+    submission_id INTEGER NOT NULL,
+    question_id INTEGER NOT NULL,
+    selected_option_ids TEXT,
+    answer_text TEXT,
+    auto_points REAL,
+    manual_points REAL,
+    final_points REAL,
+    feedback TEXT,
+    stats_points REAL,
+    cluster_key TEXT,
+    PRIMARY KEY (submission_id, question_id),
+    FOREIGN KEY (submission_id) REFERENCES submissions (submission_id)
+);
+
+CREATE TABLE IF NOT EXISTS exam_stats (
+    exam_id INTEGER PRIMARY KEY,
+    submission_count INTEGER DEFAULT 0 NOT NULL,
+    score_sum REAL DEFAULT 0 NOT NULL,
+    score_sq_sum REAL DEFAULT 0 NOT NULL,
+    score_histogram TEXT DEFAULT '{}' NOT NULL,
+    updated_at DATETIME,
+    FOREIGN KEY (exam_id) REFERENCES exams (exam_id)
+);
+
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id INTEGER PRIMARY KEY,
+    exam_id INTEGER NOT NULL,
+    answer_count INTEGER DEFAULT 0 NOT NULL,
+    correct_count INTEGER DEFAULT 0 NOT NULL,
+    points_sum REAL DEFAULT 0 NOT NULL,
+    option_counts TEXT DEFAULT '{}' NOT NULL,
+    FOREIGN KEY (exam_id) REFERENCES exams (exam_id)
+);
+
+CREATE TABLE IF NOT EXISTS review_finalize_runs (
+    exam_id INTEGER PRIMARY KEY,
+    status TEXT CHECK (status IN ('RUNNING', 'DONE')) DEFAULT 'RUNNING' NOT NULL,
+    total INTEGER DEFAULT 0 NOT NULL,
+    done INTEGER DEFAULT 0 NOT NULL,
+    last_submission_id INTEGER DEFAULT 0 NOT NULL,
+    started_at DATETIME,
+    updated_at DATETIME,
+    finished_at DATETIME,
+    FOREIGN KEY (exam_id) REFERENCES exams (exam_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_submissions_roll_number_status ON submissions (roll_number, status);
+CREATE INDEX IF NOT EXISTS ix_submissions_exam_id_status ON submissions (exam_id, status);
+CREATE INDEX IF NOT EXISTS ix_questions_exam_id_order_index ON questions (exam_id, order_index);
+CREATE INDEX IF NOT EXISTS ix_options_question_id ON options (question_id);
+CREATE INDEX IF NOT EXISTS ix_submissions_exam_id_submitted_at ON submissions (exam_id, submitted_at);
+CREATE INDEX IF NOT EXISTS ix_submissions_roll_number_submitted_at ON submissions (roll_number, submitted_at);
+CREATE INDEX IF NOT EXISTS ix_exams_instructor_email_created_at ON exams (instructor_email, created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_submissions_in_progress ON submissions (roll_number) WHERE status = 'IN_PROGRESS';
+CREATE INDEX IF NOT EXISTS ix_submission_answers_question_id ON submission_answers (question_id);
+
+-- Number of the latest script in sql_scripts/migrations, already included above
+PRAGMA user_version = 13;
@@ -0,0 +1,2 @@
+-- Per-submission seed used to derive the shuffled question/option order
+ALTER TABLE submissions ADD COLUMN order_seed INTEGER;
@@ -0,0 +1,2 @@
+-- Sequence number of the last applied answer patch (autosave v2)
+ALTER TABLE submissions ADD COLUMN autosave_seq INTEGER;
@@ -0,0 +1,6 @@
+-- Indexes matching the most frequent lookups
+-- (active submission of a student, submissions of an exam by status, exam papers, question options)
+CREATE INDEX IF NOT EXISTS ix_submissions_roll_number_status ON submissions (roll_number, status);
+CREATE INDEX IF NOT EXISTS ix_submissions_exam_id_status ON submissions (exam_id, status);
+CREATE INDEX IF NOT EXISTS ix_questions_exam_id_order_index ON questions (exam_id, order_index);
+CREATE INDEX IF NOT EXISTS ix_options_question_id ON options (question_id);
@@ -0,0 +1,10 @@
+-- At most one in-progress submission per student.
+-- Older duplicates (created by double submits before this index existed) are handed in as they are,
+-- and the newest one is kept. They're graded with the other submissions in 005_submission_answers.sql.
+UPDATE submissions
+SET status = 'SUBMITTED', submitted_at = COALESCE(updated_at, started_at)
+WHERE status = 'IN_PROGRESS' AND submission_id NOT IN (
+    SELECT MAX(submission_id) FROM submissions WHERE status = 'IN_PROGRESS' GROUP BY roll_number
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_submissions_in_progress ON submissions (roll_number) WHERE status = 'IN_PROGRESS';
@@ -0,0 +1,78 @@
+-- One row per answered question of a submission, instead of the submissions.answers JSON
+CREATE TABLE IF NOT EXISTS submission_answers (
+    submission_id INTEGER NOT NULL,
+    question_id INTEGER NOT NULL,
+    selected_option_ids TEXT,
+    answer_text TEXT,
+    auto_points REAL,
+    manual_points REAL,
+    final_points REAL,
+    feedback TEXT,
+    PRIMARY KEY (submission_id, question_id),
+    FOREIGN KEY (submission_id) REFERENCES submissions (submission_id)
+);
+
+-- Answers saved while taking an exam: {"<question_id>": <option_id> | [<option_id>, ...]}
+INSERT OR IGNORE INTO submission_answers (submission_id, question_id, selected_option_ids)
+SELECT
+    s.submission_id,
+    CAST(a.key AS INTEGER),
+    CASE a.type WHEN 'array' THEN a.value WHEN 'null' THEN '[]' ELSE json_array(a.value) END
+FROM submissions s, json_each(CASE WHEN json_valid(s.answers) THEN s.answers ELSE '{}' END) a
+WHERE json_type(CASE WHEN json_valid(s.answers) THEN s.answers ELSE '{}' END) = 'object'
+    AND a.key GLOB '[0-9]*';
+
+-- Answers written by manual grading: [{"question_id": ..., "answer_text": ..., "auto_points": ..., ...}],
+-- possibly wrapped as {"questions": [...]}
+INSERT OR REPLACE INTO submission_answers
+    (submission_id, question_id, selected_option_ids, answer_text, auto_points, manual_points, final_points, feedback)
+SELECT
+    s.submission_id,
+    json_extract(a.value, '$.question_id'),
+    json_extract(a.value, '$.selected_option_ids'),
+    json_extract(a.value, '$.answer_text'),
+    json_extract(a.value, '$.auto_points'),
+    json_extract(a.value, '$.manual_points'),
+    json_extract(a.value, '$.final_points'),
+    json_extract(a.value, '$.feedback')
+FROM submissions s, json_each(
+    CASE
+        WHEN NOT json_valid(s.answers) THEN '[]'
+        WHEN json_type(s.answers) = 'array' THEN s.answers
+        ELSE COALESCE(json_extract(s.answers, '$.questions'), '[]')
+    END
+) a
+WHERE a.type = 'object' AND json_extract(a.value, '$.question_id') IS NOT NULL;
+
+-- Points of already submitted answers (same rules as app/grading.py: single-answer questions need a
+-- correct first choice, multi-answer questions need all correct options)
+UPDATE submission_answers
+SET auto_points = (
+    SELECT CASE
+        WHEN q.is_multiple_correct THEN
+            CASE WHEN NOT EXISTS (
+                SELECT 1 FROM options o
+                WHERE o.question_id = q.question_id AND o.is_correct
+                    AND o.option_id NOT IN (SELECT sel.value FROM json_each(submission_answers.selected_option_ids) sel)
+            ) THEN q.points ELSE 0 END
+        WHEN json_array_length(submission_answers.selected_option_ids) = 0 THEN 0
+        WHEN EXISTS (
+            SELECT 1 FROM options o
+            WHERE o.option_id = json_extract(submission_answers.selected_option_ids, '$[0]')
+                AND o.question_id = q.question_id AND o.is_correct
+        ) THEN q.points
+        ELSE 0
+    END
+    FROM questions q WHERE q.question_id = submission_answers.question_id
+)
+WHERE auto_points IS NULL AND selected_option_ids IS NOT NULL
+    AND submission_id IN (SELECT submission_id FROM submissions WHERE status != 'IN_PROGRESS');
+
+-- Scores of submissions handed in without one (the duplicates closed by 004_one_in_progress_submission.sql)
+UPDATE submissions
+SET total_score = (
+    SELECT COALESCE(SUM(COALESCE(final_points, manual_points, auto_points, 0)), 0)
+    FROM submission_answers sa
+    WHERE sa.submission_id = submissions.submission_id
+)
+WHERE status = 'SUBMITTED' AND total_score IS NULL;
@@ -0,0 +1,7 @@
+-- Total points and number of questions of each exam, kept in sync by the question routes
+ALTER TABLE exams ADD COLUMN total_points INTEGER DEFAULT 0 NOT NULL;
+ALTER TABLE exams ADD COLUMN question_count INTEGER DEFAULT 0 NOT NULL;
+
+UPDATE exams
+SET total_points = (SELECT COALESCE(SUM(points), 0) FROM questions q WHERE q.exam_id = exams.exam_id),
+    question_count = (SELECT COUNT(*) FROM questions q WHERE q.exam_id = exams.exam_id);
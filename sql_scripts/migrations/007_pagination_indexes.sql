@@ -0,0 +1,5 @@
+-- Indexes matching the sort keys of the paginated lists
+-- (grading list of an exam, results of a student, grading dashboard of an instructor)
+CREATE INDEX IF NOT EXISTS ix_submissions_exam_id_submitted_at ON submissions (exam_id, submitted_at);
+CREATE INDEX IF NOT EXISTS ix_submissions_roll_number_submitted_at ON submissions (roll_number, submitted_at);
+CREATE INDEX IF NOT EXISTS ix_exams_instructor_email_created_at ON exams (instructor_email, created_at);
@@ -0,0 +1,65 @@
+-- Running statistics per exam and question, updated as submissions are handed in and reviewed
+ALTER TABLE submissions ADD COLUMN stats_score REAL;
+ALTER TABLE submission_answers ADD COLUMN stats_points REAL;
+
+CREATE TABLE IF NOT EXISTS exam_stats (
+    exam_id INTEGER PRIMARY KEY,
+    submission_count INTEGER DEFAULT 0 NOT NULL,
+    score_sum REAL DEFAULT 0 NOT NULL,
+    score_sq_sum REAL DEFAULT 0 NOT NULL,
+    score_histogram TEXT DEFAULT '{}' NOT NULL,
+    updated_at DATETIME,
+    FOREIGN KEY (exam_id) REFERENCES exams (exam_id)
+);
+
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id INTEGER PRIMARY KEY,
+    exam_id INTEGER NOT NULL,
+    answer_count INTEGER DEFAULT 0 NOT NULL,
+    correct_count INTEGER DEFAULT 0 NOT NULL,
+    points_sum REAL DEFAULT 0 NOT NULL,
+    option_counts TEXT DEFAULT '{}' NOT NULL,
+    FOREIGN KEY (exam_id) REFERENCES exams (exam_id)
+);
+
+-- Count the submissions already handed in (same rules as app/exam_stats.py)
+UPDATE submissions SET stats_score = COALESCE(total_score, 0) WHERE status != 'IN_PROGRESS';
+
+UPDATE submission_answers
+SET stats_points = COALESCE(final_points, manual_points, auto_points, 0)
+WHERE submission_id IN (SELECT submission_id FROM submissions WHERE status != 'IN_PROGRESS')
+    AND question_id IN (SELECT question_id FROM questions);
+
+INSERT INTO exam_stats (exam_id, submission_count, score_sum, score_sq_sum, score_histogram, updated_at)
+SELECT exam_id, SUM(n), SUM(score_sum), SUM(score_sq_sum), json_group_object(bucket, n), CURRENT_TIMESTAMP
+FROM (
+    SELECT exam_id, CAST(stats_score AS INTEGER) AS bucket, COUNT(*) AS n,
+        SUM(stats_score) AS score_sum, SUM(stats_score * stats_score) AS score_sq_sum
+    FROM submissions
+    WHERE stats_score IS NOT NULL
+    GROUP BY exam_id, bucket
+)
+GROUP BY exam_id;
+
+INSERT INTO question_stats (question_id, exam_id, answer_count, correct_count, points_sum)
+SELECT q.question_id, q.exam_id, COUNT(*), SUM(sa.stats_points >= q.points), SUM(sa.stats_points)
+FROM submission_answers sa
+JOIN questions q ON q.question_id = sa.question_id
+WHERE sa.stats_points IS NOT NULL
+GROUP BY q.question_id;
+
+UPDATE question_stats
+SET option_counts = (
+    SELECT json_group_object(option_id, n)
+    FROM (
+        SELECT sel.value AS option_id, COUNT(*) AS n
+        FROM submission_answers sa, json_each(sa.selected_option_ids) sel
+        WHERE sa.question_id = question_stats.question_id AND sa.stats_points IS NOT NULL
+        GROUP BY sel.value
+    )
+)
+WHERE EXISTS (
+    SELECT 1 FROM submission_answers sa
+    WHERE sa.question_id = question_stats.question_id AND sa.stats_points IS NOT NULL
+        AND json_array_length(sa.selected_option_ids) > 0
+);
@@ -0,0 +1,2 @@
+-- Version of a submission's grading, for optimistic locking of manual grading changes
+ALTER TABLE submissions ADD COLUMN version INTEGER DEFAULT 0 NOT NULL;
@@ -0,0 +1,2 @@
+-- Answers to one question across all submissions (grading by question)
+CREATE INDEX IF NOT EXISTS ix_submission_answers_question_id ON submission_answers (question_id);
@@ -0,0 +1,2 @@
+-- Cluster of equivalent text answers to a question, for grading them together
+ALTER TABLE submission_answers ADD COLUMN cluster_key TEXT;
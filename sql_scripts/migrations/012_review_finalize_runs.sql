@@ -0,0 +1,12 @@
+-- Progress of finalizing all reviews of an exam in chunks, so an interrupted run can resume
+CREATE TABLE IF NOT EXISTS review_finalize_runs (
+    exam_id INTEGER PRIMARY KEY,
+    status TEXT CHECK (status IN ('RUNNING', 'DONE')) DEFAULT 'RUNNING' NOT NULL,
+    total INTEGER DEFAULT 0 NOT NULL,
+    done INTEGER DEFAULT 0 NOT NULL,
+    last_submission_id INTEGER DEFAULT 0 NOT NULL,
+    started_at DATETIME,
+    updated_at DATETIME,
+    finished_at DATETIME,
+    FOREIGN KEY (exam_id) REFERENCES exams (exam_id)
+);
@@ -0,0 +1,2 @@
+-- Time of the last autosave request, also ones that didn't write answers (autosave v2)
+ALTER TABLE submissions ADD COLUMN last_seen_at DATETIME;
@@ -0,0 +1,79 @@
+import unittest
+import sqlite3
+
+from app import app, db
+from app.database import get_db, pool_stats, retry_on_busy
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        # Configure test app
+        app.config['TESTING'] = True
+
+        # Give app context and activate it
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        # Rebuild DB
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+
+    ########## Test Cases ##########
+    # DB-TC1: Raw connections are pooled, reset on return, and returned when the app context ends
+    def test_connection_pool(self):
+        conn = get_db()
+        self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+        conn.close()
+        before = pool_stats()
+
+        # The returned connection is checked out again instead of opening a new one
+        reused = get_db()
+        self.assertIs(reused, conn)
+
+        # Uncommitted work is rolled back when it's returned
+        reused.execute("INSERT INTO instructors (name, email, password_hash) VALUES ('Tom Hall', 'thal@idsoftware.com', 'x')")
+        reused.close()
+        conn = get_db()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM instructors").fetchone()[0], 0)
+        conn.close()
+
+        # A connection left open is returned when its app context ends
+        with app.app_context():
+            leaked = get_db()
+        self.assertIs(get_db(), leaked)
+
+        after = pool_stats()
+        self.assertEqual(after["connects"], before["connects"])
+        self.assertEqual(after["checkouts"] - before["checkouts"], 4)
+        self.assertEqual(after["returns"] - before["returns"], 3)
+
+    # DB-TC2: Both connection layers use the WAL profile, busy writes are retried
+    def test_sqlite_profile(self):
+        self.assertEqual(db.session.execute(db.text("PRAGMA journal_mode")).scalar(), "wal")
+        self.assertEqual(db.session.execute(db.text("PRAGMA synchronous")).scalar(), 1)  # NORMAL
+
+        conn = get_db()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertGreater(conn.execute("PRAGMA busy_timeout").fetchone()[0], 0)
+        conn.close()
+
+        attempts = []
+
+        @retry_on_busy
+        def write():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise sqlite3.OperationalError("database is locked")
+            return "written"
+
+        self.assertEqual(write(), "written")
+        self.assertEqual(len(attempts), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+
+from app import app, db, bcrypt
+from app.models import Courses, Students, Instructors, Exams, Questions, Options, Submissions, SubmissionAnswers, ExamStats, QuestionStats
+from app.scheduler import bulk_close_submissions
+from app.submission_answers import load_selections, to_option_ids
+from app.exam_cache import reset_exam_caches
+from app.database import get_db
+from app.exam_stats import rebuild_exam_stats
+
+class TestExamManagementUseCases(unittest.TestCase):
+    def setUp(self):
+        # Configure test app
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+
+        # Simulate a web browser
+        self.client = app.test_client()
+
+        # Give app context and activate it
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        # Rebuild DB
+        db.drop_all()
+        db.create_all()
+        reset_exam_caches()
+
+        # Sample instructor
+        self.instructor = Instructors(
+            name="John Carmack", email="jcar@idsoftware.com",
+            password_hash=bcrypt.generate_password_hash('doom1993').decode('utf-8')
+        )
+        db.session.add(self.instructor)
+        db.session.commit()
+
+        # Sample student
+        self.student = Students(
+            roll_number=1, name="John Romero", email="jrom@idsoftware.com",
+            password_hash=bcrypt.generate_password_hash('doom1993').decode('utf-8')
+        )
+        db.session.add(self.student)
+        db.session.commit()
+
+        # Sample course
+        self.course = Courses(
+            course_code="CS101", course_name="Example Course",
+            instructor_email="jcar@idsoftware.com"
+        )
+        db.session.add(self.course)
+        db.session.commit()
+
+        now = datetime.utcnow()
+
+        # Sample exam
+        self.exam = Exams(
+            instructor_email=self.instructor.email,
+            title="Sample Exam",
+            course_code="CS101",
+            security_settings={"password": "", "shuffle": False, "single_session": False, "no_tab_switching": False},
+            opens_at=now - timedelta(hours=1),
+            closes_at=now + timedelta(hours=1),
+            created_at=now
+        )
+        db.session.add(self.exam)
+        db.session.commit()
+
+        # Add questions and options for protected exam
+        self.q1 = Questions(exam_id=self.exam.exam_id, question_text="Q1?", is_multiple_correct=False, points=5, order_index=1)
+        self.q2 = Questions(exam_id=self.exam.exam_id, question_text="Q2?", is_multiple_correct=True, points=10, order_index=2)
+        db.session.add_all([self.q1, self.q2])
+        db.session.commit()
+
+        self.q1_op1 = Options(question_id=self.q1.question_id, option_text="Correct", is_correct=True)
+        self.q1_op2 = Options(question_id=self.q1.question_id, option_text="Wrong", is_correct=False)
+        self.q2_op1 = Options(question_id=self.q2.question_id, option_text="Correct", is_correct=True)
+        self.q2_op2 = Options(question_id=self.q2.question_id, option_text="Wrong", is_correct=False)
+        self.q2_op3 = Options(question_id=self.q2.question_id, option_text="Correct", is_correct=True)
+        db.session.add_all([self.q1_op1, self.q1_op2, self.q2_op1, self.q2_op2, self.q2_op3])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+
+    ########## Answer Helpers ##########
+    def add_answers(self, submission, answers):
+        db.session.add_all(
+            SubmissionAnswers(submission_id=submission.submission_id, question_id=int(qid), selected_option_ids=to_option_ids(answer))
+            for qid, answer in answers.items()
+        )
+        db.session.commit()
+
+    def saved_answers(self, submission):
+        return load_selections([submission.submission_id]).get(submission.submission_id, {})
+
+
+    ########## Test Cases ##########
+    # U3-TC1: Exam totals follow question edits and can be repaired
+    def test_exam_totals(self):
+        patcher = patch('flask_login.utils._get_user', return_value=self.instructor)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        now = datetime.utcnow()
+        submission = Submissions(
+            exam_id=self.exam.exam_id, roll_number=self.student.roll_number,
+            started_at=now, submitted_at=now, status="SUBMITTED"
+        )
+        db.session.add(submission)
+        db.session.commit()
+        self.add_answers(submission, {
+            str(self.q1.question_id): self.q1_op1.option_id,
+            str(self.q2.question_id): [self.q2_op1.option_id, self.q2_op3.option_id]
+        })
+
+        self.client.post(f"/exams/{self.exam.exam_id}/questions/new", data={
+            "question_type": "true_false", "question_text": "Q3?", "tf_answer": "true"
+        })
+        db.session.expire_all()
+        self.assertEqual(self.exam.question_count, 3)
+        self.assertEqual(self.exam.total_points, self.q1.points + self.q2.points + 1)
+
+        self.client.post(f"/exams/questions/{self.q2.question_id}/delete")
+        db.session.expire_all()
+        self.assertEqual(self.exam.question_count, 2)
+        self.assertEqual(self.exam.total_points, self.q1.points + 1)
+
+        # Answers to the deleted question are deleted with it
+        self.assertEqual(list(self.saved_answers(submission)), [self.q1.question_id])
+
+        # Exams whose questions were changed outside the routes are fixed by the repair command
+        self.exam.total_points = 0
+        self.exam.question_count = 0
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=["repair-exam-totals"])
+        self.assertIn("Recomputed totals of 1 exams", result.output)
+
+        db.session.expire_all()
+        self.assertEqual(self.exam.question_count, 2)
+        self.assertEqual(self.exam.total_points, self.q1.points + 1)
+
+    # U3-TC2: Deleting a question takes its points out of the scores and statistics of handed-in submissions
+    def test_delete_question_after_grading(self):
+        patcher = patch('flask_login.utils._get_user', return_value=self.instructor)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        now = datetime.utcnow()
+        student2 = Students(roll_number=2, name="Adrian Carmack", email="acar@idsoftware.com", password_hash="x")
+        db.session.add(student2)
+        first = Submissions(exam_id=self.exam.exam_id, roll_number=self.student.roll_number, started_at=now, status="IN_PROGRESS")
+        second = Submissions(exam_id=self.exam.exam_id, roll_number=student2.roll_number, started_at=now, status="IN_PROGRESS")
+        db.session.add_all([first, second])
+        db.session.commit()
+        self.add_answers(first, {str(self.q1.question_id): self.q1_op1.option_id, str(self.q2.question_id): [self.q2_op1.option_id, self.q2_op3.option_id]})
+        self.add_answers(second, {str(self.q1.question_id): self.q1_op2.option_id, str(self.q2.question_id): [self.q2_op1.option_id, self.q2_op3.option_id]})
+        bulk_close_submissions(self.exam.exam_id)
+
+        # The second one is reviewed with full credit for Q1
+        grading_url = f"/grading/submissions/{second.submission_id}"
+        self.client.post(f"{grading_url}/answers/{self.q1.question_id}/toggle-verdict", json={"force_correct": True})
+        self.client.post(f"{grading_url}/save")
+
+        db.session.expire_all()
+        self.assertEqual([first.total_score, second.total_score], [15, 15])
+        versions = [first.version, second.version]
+        q2_id = self.q2.question_id
+
+        self.client.post(f"/exams/questions/{q2_id}/delete")
+
+        db.session.expire_all()
+        self.assertEqual([first.total_score, second.total_score], [self.q1.points] * 2)
+        self.assertEqual([first.version, second.version], [version + 1 for version in versions])
+        self.assertEqual(second.status, "REVIEWED")
+
+        stats = db.session.get(ExamStats, self.exam.exam_id)
+        self.assertEqual((stats.submission_count, stats.score_sum), (2, 2 * self.q1.points))
+        self.assertEqual(stats.score_histogram, {str(self.q1.points): 2})
+        self.assertIsNone(db.session.get(QuestionStats, q2_id))
+
+        # Same as a recount from scratch
+        counted = (stats.submission_count, stats.score_sum, stats.score_sq_sum, stats.score_histogram)
+        conn = get_db()
+        rebuild_exam_stats(conn, self.exam.exam_id)
+        conn.commit()
+        conn.close()
+        db.session.expire_all()
+        stats = db.session.get(ExamStats, self.exam.exam_id)
+        self.assertEqual((stats.submission_count, stats.score_sum, stats.score_sq_sum, stats.score_histogram), counted)
+
+
+if __name__ == "__main__":
+    unittest.main()
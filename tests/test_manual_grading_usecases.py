@@ -0,0 +1,421 @@
+import unittest
+from datetime import datetime, timedelta
+
+from app import app, db, bcrypt
+from app.models import Courses, Students, Instructors, Exams, Questions, Options, Submissions, SubmissionAnswers, ExamStats
+from app.scheduler import bulk_close_submissions
+from app.submission_answers import to_option_ids
+from app.exam_cache import reset_exam_caches
+from app.database import get_db
+from app.manual_grading.finalize import start_finalize, finalize_chunk
+
+class TestManualGradingUseCases(unittest.TestCase):
+    def setUp(self):
+        # Configure test app
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+
+        # Simulate a web browser
+        self.client = app.test_client()
+
+        # Give app context and activate it
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        # Rebuild DB
+        db.drop_all()
+        db.create_all()
+        reset_exam_caches()
+
+        # Sample instructor
+        self.instructor = Instructors(
+            name="John Carmack", email="jcar@idsoftware.com",
+            password_hash=bcrypt.generate_password_hash('doom1993').decode('utf-8')
+        )
+        db.session.add(self.instructor)
+        db.session.commit()
+
+        # Sample student
+        self.student = Students(
+            roll_number=1, name="John Romero", email="jrom@idsoftware.com",
+            password_hash=bcrypt.generate_password_hash('doom1993').decode('utf-8')
+        )
+        db.session.add(self.student)
+        db.session.commit()
+
+        # Sample course
+        self.course = Courses(
+            course_code="CS101", course_name="Example Course",
+            instructor_email="jcar@idsoftware.com"
+        )
+        db.session.add(self.course)
+        db.session.commit()
+
+        now = datetime.utcnow()
+
+        # Sample exam
+        self.exam = Exams(
+            instructor_email=self.instructor.email,
+            title="Sample Exam",
+            course_code="CS101",
+            security_settings={"password": "", "shuffle": False, "single_session": False, "no_tab_switching": False},
+            opens_at=now - timedelta(hours=1),
+            closes_at=now + timedelta(hours=1),
+            created_at=now
+        )
+        db.session.add(self.exam)
+        db.session.commit()
+
+        # Add questions and options for protected exam
+        self.q1 = Questions(exam_id=self.exam.exam_id, question_text="Q1?", is_multiple_correct=False, points=5, order_index=1)
+        self.q2 = Questions(exam_id=self.exam.exam_id, question_text="Q2?", is_multiple_correct=True, points=10, order_index=2)
+        db.session.add_all([self.q1, self.q2])
+        db.session.commit()
+
+        self.q1_op1 = Options(question_id=self.q1.question_id, option_text="Correct", is_correct=True)
+        self.q1_op2 = Options(question_id=self.q1.question_id, option_text="Wrong", is_correct=False)
+        self.q2_op1 = Options(question_id=self.q2.question_id, option_text="Correct", is_correct=True)
+        self.q2_op2 = Options(question_id=self.q2.question_id, option_text="Wrong", is_correct=False)
+        self.q2_op3 = Options(question_id=self.q2.question_id, option_text="Correct", is_correct=True)
+        db.session.add_all([self.q1_op1, self.q1_op2, self.q2_op1, self.q2_op2, self.q2_op3])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+
+    ########## Answer Helper ##########
+    def add_answers(self, submission, answers):
+        db.session.add_all(
+            SubmissionAnswers(submission_id=submission.submission_id, question_id=int(qid), selected_option_ids=to_option_ids(answer))
+            for qid, answer in answers.items()
+        )
+        db.session.commit()
+
+
+    ########## Test Cases ##########
+    # U4-TC1: Graded points are stored per answer and manual grading updates single rows
+    def test_answer_rows_grading(self):
+        now = datetime.utcnow()
+        submission = Submissions(
+            exam_id=self.exam.exam_id, roll_number=self.student.roll_number,
+            started_at=now, updated_at=now, status="IN_PROGRESS"
+        )
+        db.session.add(submission)
+        db.session.commit()
+        self.add_answers(submission, {
+            str(self.q1.question_id): self.q1_op2.option_id,
+            str(self.q2.question_id): [self.q2_op1.option_id, self.q2_op3.option_id]
+        })
+
+        bulk_close_submissions(self.exam.exam_id)
+        db.session.expire_all()
+
+        q1_answer = db.session.get(SubmissionAnswers, (submission.submission_id, self.q1.question_id))
+        self.assertEqual(q1_answer.auto_points, 0)
+        self.assertEqual(submission.total_score, self.q2.points)
+
+        # Full credit for Q1 only touches its row, the total is summed over all rows
+        response = self.client.post(
+            f"/grading/submissions/{submission.submission_id}/answers/{self.q1.question_id}/toggle-verdict",
+            json={"force_correct": True}
+        )
+        self.assertEqual(response.get_json()["total_score"], self.q1.points + self.q2.points)
+
+        response = self.client.post(f"/grading/submissions/{submission.submission_id}/open", json={
+            "instructor_email": self.instructor.email
+        })
+        answers = {ans["question_id"]: ans for ans in response.get_json()["answers"]}
+        self.assertEqual(answers[self.q1.question_id]["final_points"], self.q1.points)
+        self.assertEqual(answers[self.q1.question_id]["answer_text"], "Wrong")
+        self.assertEqual(answers[self.q2.question_id]["auto_points"], self.q2.points)
+
+    # U4-TC2: Concurrent manual grading of the same submission gets a conflict instead of a lost update
+    def test_grading_version_conflict(self):
+        now = datetime.utcnow()
+        submission = Submissions(exam_id=self.exam.exam_id, roll_number=self.student.roll_number, started_at=now, status="IN_PROGRESS")
+        db.session.add(submission)
+        db.session.commit()
+        self.add_answers(submission, {str(self.q1.question_id): self.q1_op2.option_id, str(self.q2.question_id): [self.q2_op1.option_id]})
+        bulk_close_submissions(self.exam.exam_id)
+
+        opened = self.client.post(f"/grading/submissions/{submission.submission_id}/open", json={
+            "instructor_email": self.instructor.email
+        }).get_json()
+        version = opened["version"]
+        points_url = f"/grading/submissions/{submission.submission_id}/answers/{self.q2.question_id}/manual-points"
+
+        # First instructor gives partial credit
+        response = self.client.post(points_url, json={"points": 4, "version": version})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["total_score"], 4)
+        self.assertEqual(response.get_json()["version"], version + 1)
+
+        # Second instructor still has the old version
+        response = self.client.post(
+            f"/grading/submissions/{submission.submission_id}/answers/{self.q1.question_id}/toggle-verdict",
+            json={"force_correct": True, "version": version}
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()["version"], version + 1)
+
+        # With the current version the change goes through, and the total is adjusted by the difference
+        response = self.client.post(
+            f"/grading/submissions/{submission.submission_id}/answers/{self.q1.question_id}/toggle-verdict",
+            json={"force_correct": True, "version": version + 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["total_score"], self.q1.points + 4)
+
+        response = self.client.post(points_url, json={"points": self.q2.points + 1})
+        self.assertEqual(response.status_code, 400)
+
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Submissions, submission.submission_id).total_score, self.q1.points + 4)
+
+        # Feedback and changed totals are grading changes too, an unchanged total is not
+        base_url = f"/grading/submissions/{submission.submission_id}"
+        response = self.client.post(f"{base_url}/feedback", json={"comment": "Check Q2", "question_id": self.q2.question_id})
+        self.assertEqual(response.get_json()["version"], version + 3)
+        self.assertEqual(self.client.post(f"{base_url}/recalc").get_json()["version"], version + 3)
+
+        db.session.get(Submissions, submission.submission_id).total_score = 0
+        db.session.commit()
+        response = self.client.post(f"{base_url}/save")
+        self.assertEqual(response.get_json()["total_score"], self.q1.points + 4)
+        self.assertEqual(response.get_json()["version"], version + 4)
+
+    # U4-TC3: Batch grading applies many operations across submissions in one transaction
+    def test_grading_batch(self):
+        now = datetime.utcnow()
+        student2 = Students(roll_number=2, name="Adrian Carmack", email="acar@idsoftware.com", password_hash="x")
+        db.session.add(student2)
+        first = Submissions(exam_id=self.exam.exam_id, roll_number=self.student.roll_number, started_at=now, status="IN_PROGRESS")
+        second = Submissions(exam_id=self.exam.exam_id, roll_number=student2.roll_number, started_at=now, status="IN_PROGRESS")
+        db.session.add_all([first, second])
+        db.session.commit()
+        self.add_answers(first, {str(self.q1.question_id): self.q1_op1.option_id, str(self.q2.question_id): [self.q2_op1.option_id]})
+        self.add_answers(second, {str(self.q1.question_id): self.q1_op2.option_id, str(self.q2.question_id): [self.q2_op1.option_id, self.q2_op3.option_id]})
+        bulk_close_submissions(self.exam.exam_id)
+        first_id, second_id = first.submission_id, second.submission_id
+
+        response = self.client.post("/grading/batch", json={"operations": [
+            {"submission_id": first_id, "question_id": self.q2.question_id, "points": 4, "feedback": "Half of it", "version": 0},
+            {"submission_id": first_id, "question_id": self.q1.question_id, "force_correct": False, "version": 0},
+            {"submission_id": second_id, "question_id": self.q1.question_id, "force_correct": True},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual([r["final_points"] for r in data["results"]], [4, 0, self.q1.points])
+        totals = {s["submission_id"]: (s["total_score"], s["version"]) for s in data["submissions"]}
+        self.assertEqual(totals, {first_id: (4, 1), second_id: (self.q1.points + self.q2.points, 1)})
+
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Submissions, first_id).feedback, "Half of it")
+        self.assertEqual(db.session.get(SubmissionAnswers, (first_id, self.q2.question_id)).feedback, "Half of it")
+
+        # One invalid operation rejects the whole batch
+        response = self.client.post("/grading/batch", json={"operations": [
+            {"submission_id": first_id, "question_id": self.q1.question_id, "force_correct": True},
+            {"submission_id": second_id, "question_id": self.q2.question_id, "points": self.q2.points + 1},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["index"], 1)
+
+        # Outdated version, and unknown submission
+        response = self.client.post("/grading/batch", json={"operations": [
+            {"submission_id": first_id, "question_id": self.q1.question_id, "force_correct": True, "version": 0},
+        ]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()["submission_id"], first_id)
+
+        response = self.client.post("/grading/batch", json={"operations": [
+            {"submission_id": 999999, "question_id": self.q1.question_id, "points": 1},
+        ]})
+        self.assertEqual(response.status_code, 404)
+
+        db.session.expire_all()
+        self.assertEqual(db.session.get(SubmissionAnswers, (first_id, self.q1.question_id)).final_points, 0)
+        self.assertEqual(db.session.get(Submissions, first_id).total_score, 4)
+        self.assertEqual(db.session.get(Submissions, first_id).version, 1)
+
+    # U4-TC4: Grading by question groups identical answers and applies one grade to the whole group
+    def test_grade_by_question(self):
+        now = datetime.utcnow()
+        students = [self.student] + [
+            Students(roll_number=n, name=f"Student {n}", email=f"s{n}@idsoftware.com", password_hash="x") for n in (2, 3)
+        ]
+        db.session.add_all(students[1:])
+        submissions = [
+            Submissions(exam_id=self.exam.exam_id, roll_number=student.roll_number, started_at=now, status="IN_PROGRESS")
+            for student in students
+        ]
+        db.session.add_all(submissions)
+        db.session.commit()
+        # The same options in a different order are the same answer
+        selections = [
+            [self.q2_op1.option_id, self.q2_op2.option_id],
+            [self.q2_op2.option_id, self.q2_op1.option_id],
+            [self.q2_op3.option_id],
+        ]
+        for submission, selected in zip(submissions, selections):
+            self.add_answers(submission, {str(self.q2.question_id): selected})
+        bulk_close_submissions(self.exam.exam_id)
+
+        url = f"/grading/exams/{self.exam.exam_id}/questions/{self.q2.question_id}/answers"
+        first_page = self.client.get(url, query_string={"limit": 1}).get_json()
+        self.assertEqual(len(first_page["groups"]), 1)
+        group = first_page["groups"][0]
+        self.assertEqual(group["answer_count"], 2)
+        self.assertEqual({m["submission_id"] for m in group["members"]}, {submissions[0].submission_id, submissions[1].submission_id})
+        self.assertEqual(group["answer_text"], f"{self.q2_op1.option_text}, {self.q2_op2.option_text}")
+
+        second_page = self.client.get(url, query_string={"limit": 1, "cursor": first_page["next_cursor"]}).get_json()
+        self.assertEqual([g["answer_count"] for g in second_page["groups"]], [1])
+        self.assertIsNone(second_page["next_cursor"])
+
+        # One grade for the whole group
+        response = self.client.post(url + "/apply", json={"groups": [
+            {"answer_key": group["answer_key"], "points": 5, "feedback": "Only half right"},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["groups"], [{"answer_key": group["answer_key"], "answer_count": 2}])
+
+        db.session.expire_all()
+        for submission in submissions[:2]:
+            answer = db.session.get(SubmissionAnswers, (submission.submission_id, self.q2.question_id))
+            self.assertEqual((answer.final_points, answer.feedback), (5, "Only half right"))
+        self.assertIsNone(db.session.get(SubmissionAnswers, (submissions[2].submission_id, self.q2.question_id)).manual_points)
+
+        response = self.client.get(url).get_json()
+        self.assertEqual([(g["answer_count"], g["graded_count"]) for g in response["groups"]], [(2, 2), (1, 0)])
+
+        response = self.client.post(url + "/apply", json={"groups": [{"answer_key": group["answer_key"], "points": 11}]})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(f"/grading/exams/{self.exam.exam_id}/questions/999999/answers")
+        self.assertEqual(response.status_code, 404)
+
+    # U4-TC5: Equivalent text answers are clustered, and grading the cluster grades all of them
+    def test_answer_clusters(self):
+        now = datetime.utcnow()
+        students = [self.student] + [
+            Students(roll_number=n, name=f"Student {n}", email=f"s{n}@idsoftware.com", password_hash="x") for n in (2, 3, 4)
+        ]
+        db.session.add_all(students[1:])
+        submissions = [
+            Submissions(exam_id=self.exam.exam_id, roll_number=student.roll_number, started_at=now, status="IN_PROGRESS")
+            for student in students
+        ]
+        db.session.add_all(submissions)
+        db.session.commit()
+        for submission in submissions:
+            self.add_answers(submission, {str(self.q1.question_id): None})
+        bulk_close_submissions(self.exam.exam_id)
+
+        texts = [
+            "Photosynthesis converts light energy into chemical energy stored in glucose molecules",
+            "photosynthesis converts light energy into chemical energy, stored in  glucose molecules!",
+            "Photosynthesis converts light energy into chemical energy stored in glucose",
+            "Plants eat soil",
+        ]
+        for submission, text in zip(submissions, texts):
+            db.session.get(SubmissionAnswers, (submission.submission_id, self.q1.question_id)).answer_text = text
+        db.session.commit()
+
+        url = f"/grading/exams/{self.exam.exam_id}/questions/{self.q1.question_id}"
+
+        # Same text after normalization
+        response = self.client.post(url + "/clusters", json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c["answer_count"] for c in response.get_json()["clusters"]], [2, 1, 1])
+
+        # Near-duplicates as well
+        response = self.client.post(url + "/clusters", json={"similarity": 0.8})
+        clusters = response.get_json()["clusters"]
+        self.assertEqual([c["answer_count"] for c in clusters], [3, 1])
+        self.assertEqual(clusters[0]["answer_text"], texts[0])
+
+        groups = self.client.get(url + "/answers").get_json()["groups"]
+        self.assertEqual([(g["answer_key"], g["answer_count"], g["variant_count"]) for g in groups],
+                         [(clusters[0]["answer_key"], 3, 3), (clusters[1]["answer_key"], 1, 1)])
+
+        # Grading the cluster grades every answer in it
+        response = self.client.post(url + "/answers/apply", json={"groups": [
+            {"answer_key": clusters[0]["answer_key"], "force_correct": True, "feedback": "Well explained"},
+        ]})
+        self.assertEqual(response.status_code, 200)
+
+        db.session.expire_all()
+        graded = [db.session.get(SubmissionAnswers, (submission.submission_id, self.q1.question_id)) for submission in submissions]
+        self.assertEqual([a.final_points for a in graded[:3]], [self.q1.points] * 3)
+        self.assertEqual(graded[2].feedback, "Well explained")
+        self.assertIsNone(graded[3].manual_points)
+
+        response = self.client.post(url + "/clusters", json={"similarity": 2})
+        self.assertEqual(response.status_code, 400)
+
+        # Option answers are listed as their groups of identical selections
+        for submission, options in zip(submissions, [[self.q2_op3, self.q2_op1], [self.q2_op1, self.q2_op3], [self.q2_op2]]):
+            self.add_answers(submission, {str(self.q2.question_id): [option.option_id for option in options]})
+
+        response = self.client.post(f"/grading/exams/{self.exam.exam_id}/questions/{self.q2.question_id}/clusters", json={})
+        clusters = response.get_json()["clusters"]
+        self.assertEqual([(c["answer_text"], c["answer_count"]) for c in clusters], [("Correct, Correct", 2), ("Wrong", 1)])
+
+    # U4-TC6: Finalizing all reviews of an exam works in chunks and resumes after an interruption
+    def test_finalize_exam_reviews(self):
+        now = datetime.utcnow()
+        students = [self.student] + [
+            Students(roll_number=n, name=f"Student {n}", email=f"s{n}@idsoftware.com", password_hash="x") for n in (2, 3)
+        ]
+        db.session.add_all(students[1:])
+        submissions = [
+            Submissions(exam_id=self.exam.exam_id, roll_number=student.roll_number, started_at=now, status="IN_PROGRESS")
+            for student in students
+        ]
+        db.session.add_all(submissions)
+        db.session.commit()
+        for submission in submissions:
+            self.add_answers(submission, {str(self.q1.question_id): self.q1_op1.option_id, str(self.q2.question_id): [self.q2_op1.option_id]})
+        bulk_close_submissions(self.exam.exam_id)
+        ids = [submission.submission_id for submission in submissions]
+
+        self.client.post(f"/grading/submissions/{ids[1]}/open", json={"instructor_email": self.instructor.email})
+        # Points changed without updating the total, finalizing recalculates it
+        db.session.get(SubmissionAnswers, (ids[2], self.q2.question_id)).final_points = 7
+        db.session.commit()
+
+        # A run that stopped after its first chunk
+        conn = get_db()
+        start_finalize(conn, self.exam.exam_id)
+        self.assertEqual(finalize_chunk(conn, self.exam.exam_id, batch_size=1), 1)
+        conn.close()
+
+        url = f"/grading/exams/{self.exam.exam_id}/finalize"
+        progress = self.client.get(url).get_json()
+        self.assertEqual((progress["status"], progress["total"], progress["done"]), ("RUNNING", 3, 1))
+
+        # Resumes after the checkpoint
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        progress = response.get_json()
+        self.assertEqual((progress["status"], progress["total"], progress["done"]), ("DONE", 3, 3))
+
+        db.session.expire_all()
+        finalized = [db.session.get(Submissions, submission_id) for submission_id in ids]
+        self.assertEqual([s.status for s in finalized], ["REVIEWED"] * 3)
+        self.assertEqual([s.total_score for s in finalized], [self.q1.points, self.q1.points, self.q1.points + 7])
+        # Only the recalculated total is a grading change
+        self.assertEqual([s.version for s in finalized], [0, 0, 1])
+        self.assertEqual(db.session.get(ExamStats, self.exam.exam_id).score_sum, 3 * self.q1.points + 7)
+
+        # Nothing left for a new run
+        progress = self.client.post(url).get_json()
+        self.assertEqual((progress["status"], progress["total"], progress["done"]), ("DONE", 0, 0))
+        self.assertEqual(self.client.get("/grading/exams/999999/finalize").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,356 @@
+import unittest
+import json
+import random
+import time
+from unittest.mock import patch
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app import app, db, bcrypt
+from app.models import Courses, Students, Instructors, Exams, Questions, Options, Submissions, SubmissionAnswers
+from app.scheduler import bulk_close_submissions
+from app.submission_answers import to_option_ids
+from app.exam_cache import reset_exam_caches
+from app.database import get_db
+from app.exam_stats import rebuild_exam_stats
+from app.item_analysis import analyze_exam, load_response_matrix
+
+class TestResultsUseCases(unittest.TestCase):
+    def setUp(self):
+        # Configure test app
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+
+        # Simulate a web browser
+        self.client = app.test_client()
+
+        # Give app context and activate it
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        # Rebuild DB
+        db.drop_all()
+        db.create_all()
+        reset_exam_caches()
+
+        # Sample instructor
+        self.instructor = Instructors(
+            name="John Carmack", email="jcar@idsoftware.com",
+            password_hash=bcrypt.generate_password_hash('doom1993').decode('utf-8')
+        )
+        db.session.add(self.instructor)
+        db.session.commit()
+
+        # Sample student
+        self.student = Students(
+            roll_number=1, name="John Romero", email="jrom@idsoftware.com",
+            password_hash=bcrypt.generate_password_hash('doom1993').decode('utf-8')
+        )
+        db.session.add(self.student)
+        db.session.commit()
+
+        # Sample course
+        self.course = Courses(
+            course_code="CS101", course_name="Example Course",
+            instructor_email="jcar@idsoftware.com"
+        )
+        db.session.add(self.course)
+        db.session.commit()
+
+        now = datetime.utcnow()
+
+        # Sample exam
+        self.exam = Exams(
+            instructor_email=self.instructor.email,
+            title="Sample Exam",
+            course_code="CS101",
+            security_settings={"password": "", "shuffle": False, "single_session": False, "no_tab_switching": False},
+            opens_at=now - timedelta(hours=1),
+            closes_at=now + timedelta(hours=1),
+            created_at=now
+        )
+        db.session.add(self.exam)
+        db.session.commit()
+
+        # Add questions and options for protected exam
+        self.q1 = Questions(exam_id=self.exam.exam_id, question_text="Q1?", is_multiple_correct=False, points=5, order_index=1)
+        self.q2 = Questions(exam_id=self.exam.exam_id, question_text="Q2?", is_multiple_correct=True, points=10, order_index=2)
+        db.session.add_all([self.q1, self.q2])
+        db.session.commit()
+
+        self.q1_op1 = Options(question_id=self.q1.question_id, option_text="Correct", is_correct=True)
+        self.q1_op2 = Options(question_id=self.q1.question_id, option_text="Wrong", is_correct=False)
+        self.q2_op1 = Options(question_id=self.q2.question_id, option_text="Correct", is_correct=True)
+        self.q2_op2 = Options(question_id=self.q2.question_id, option_text="Wrong", is_correct=False)
+        self.q2_op3 = Options(question_id=self.q2.question_id, option_text="Correct", is_correct=True)
+        db.session.add_all([self.q1_op1, self.q1_op2, self.q2_op1, self.q2_op2, self.q2_op3])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+
+    ########## Login Helper ##########
+    def login_student(self):
+        patcher = patch('flask_login.utils._get_user', return_value=self.student)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+
+    ########## Answer Helper ##########
+    def add_answers(self, submission, answers):
+        db.session.add_all(
+            SubmissionAnswers(submission_id=submission.submission_id, question_id=int(qid), selected_option_ids=to_option_ids(answer))
+            for qid, answer in answers.items()
+        )
+        db.session.commit()
+
+
+    ########## Test Cases ##########
+    # Results-TC1: Result and grading lists are paginated with cursors
+    def test_keyset_pagination(self):
+        now = datetime.utcnow()
+        for roll_number in range(2, 7):
+            db.session.add(Students(roll_number=roll_number, name=f"Student {roll_number}", email=f"s{roll_number}@test.com", password_hash="x"))
+            db.session.add(Submissions(
+                exam_id=self.exam.exam_id, roll_number=roll_number, started_at=now, updated_at=now,
+                # Two submissions share a time, so the ID has to break the tie
+                submitted_at=None if roll_number == 6 else now - timedelta(minutes=min(roll_number, 4)), status="SUBMITTED"
+            ))
+        db.session.commit()
+
+        def collect(url, key):
+            seen, cursor, pages = [], None, 0
+            while True:
+                response = self.client.get(url, query_string={"limit": 2, **({"cursor": cursor} if cursor else {})})
+                self.assertEqual(response.status_code, 200)
+                data = response.get_json()
+                self.assertLessEqual(len(data[key]), 2)
+                seen += data[key]
+                pages += 1
+                cursor = data["next_cursor"]
+                if not cursor:
+                    return seen, pages
+
+        submissions, pages = collect(f"/grading/exams/{self.exam.exam_id}/submissions", "submissions")
+        self.assertEqual(pages, 3)
+        self.assertEqual(len({s["submission_id"] for s in submissions}), 5)
+
+        # Same order as an unpaginated query
+        expected = [row.submission_id for row in Submissions.query.order_by(
+            Submissions.submitted_at.asc(), Submissions.submission_id.asc()
+        )]
+        self.assertEqual([s["submission_id"] for s in submissions], expected)
+
+        exams, pages = collect(f"/grading/dashboard/{self.instructor.email}", "exams")
+        self.assertEqual([exam["exam_id"] for exam in exams], [self.exam.exam_id])
+
+        response = self.client.get(f"/grading/exams/{self.exam.exam_id}/submissions", query_string={"cursor": "bad"})
+        self.assertEqual(response.status_code, 400)
+
+    # Results-TC2: Instructors can export the results of an exam as CSV or NDJSON
+    def test_export_results(self):
+        now = datetime.utcnow()
+        graded = Submissions(exam_id=self.exam.exam_id, roll_number=self.student.roll_number, started_at=now, submitted_at=now, status="REVIEWED", total_score=5)
+        db.session.add(graded)
+        self.exam.total_points = 15
+        db.session.commit()
+        db.session.add_all([
+            SubmissionAnswers(submission_id=graded.submission_id, question_id=self.q1.question_id, selected_option_ids=[self.q1_op1.option_id], auto_points=5),
+            SubmissionAnswers(submission_id=graded.submission_id, question_id=self.q2.question_id, selected_option_ids=[], auto_points=0, manual_points=2),
+        ])
+        db.session.commit()
+
+        # Students can't export
+        self.login_student()
+        response = self.client.get("/results/export", query_string={"exam_id": self.exam.exam_id})
+        self.assertEqual(response.status_code, 403)
+
+        with patch('flask_login.utils._get_user', return_value=self.instructor):
+            response = self.client.get("/results/export", query_string={"exam_id": self.exam.exam_id})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_streamed)
+            lines = response.get_data(as_text=True).splitlines()
+            self.assertEqual(lines[0].split(",")[-3:], ["total_points", "Q1", "Q2"])
+            self.assertEqual(lines[1].split(",")[-4:], ["5", "15", "5.0", "2.0"])
+
+            response = self.client.get("/results/export", query_string={"course_code": "CS101", "format": "ndjson"})
+            self.assertEqual(response.mimetype, "application/x-ndjson")
+            rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(rows[0]["questions"], {str(self.q1.question_id): 5.0, str(self.q2.question_id): 2.0})
+
+            response = self.client.get("/results/export", query_string={"exam_id": self.exam.exam_id + 1})
+            self.assertEqual(response.status_code, 404)
+
+    # Results-TC3: Exam statistics are updated on submission and review, and match a full recount
+    def test_exam_stats(self):
+        now = datetime.utcnow()
+        student2 = Students(roll_number=2, name="Adrian Carmack", email="acar@idsoftware.com", password_hash="x")
+        db.session.add(student2)
+        self.exam.total_points = 15
+        first = Submissions(exam_id=self.exam.exam_id, roll_number=self.student.roll_number, started_at=now, status="IN_PROGRESS")
+        second = Submissions(exam_id=self.exam.exam_id, roll_number=student2.roll_number, started_at=now, status="IN_PROGRESS")
+        db.session.add_all([first, second])
+        db.session.commit()
+        self.add_answers(first, {str(self.q1.question_id): self.q1_op1.option_id, str(self.q2.question_id): [self.q2_op1.option_id]})
+        self.add_answers(second, {str(self.q1.question_id): self.q1_op2.option_id, str(self.q2.question_id): [self.q2_op1.option_id, self.q2_op3.option_id]})
+
+        bulk_close_submissions(self.exam.exam_id)
+
+        def stats():
+            with patch('flask_login.utils._get_user', return_value=self.instructor):
+                response = self.client.get(f"/api/exams/{self.exam.exam_id}/stats")
+            self.assertEqual(response.status_code, 200)
+            return response.get_json()
+
+        # Scores 5 and 10
+        data = stats()
+        self.assertEqual(data["submission_count"], 2)
+        self.assertEqual(data["mean"], 7.5)
+        self.assertEqual(data["median"], 7.5)
+        self.assertEqual(data["std_dev"], 2.5)
+        q1, q2 = data["questions"]
+        self.assertEqual((q1["answer_count"], q1["correct_count"], q1["difficulty"]), (2, 1, 0.5))
+        self.assertEqual({o["option_id"]: o["count"] for o in q2["options"]}, {
+            self.q2_op1.option_id: 2, self.q2_op2.option_id: 0, self.q2_op3.option_id: 1
+        })
+
+        # Partial credit on the first submission replaces its earlier contribution when the review is saved
+        self.client.post(
+            f"/grading/submissions/{first.submission_id}/answers/{self.q2.question_id}/manual-points", json={"points": 4}
+        )
+        self.client.post(f"/grading/submissions/{first.submission_id}/save")
+        self.client.post(f"/grading/submissions/{first.submission_id}/save")
+
+        data = stats()
+        self.assertEqual(data["submission_count"], 2)
+        self.assertEqual(data["mean"], 9.5)
+        self.assertEqual(data["histogram"], {"9": 1, "10": 1})
+        self.assertEqual(data["questions"][1]["mean_points"], 7)
+        self.assertEqual(data["questions"][0]["options"][0]["count"], 1)
+
+        # A recount from scratch gives the same numbers
+        conn = get_db()
+        self.assertEqual(rebuild_exam_stats(conn, self.exam.exam_id), 2)
+        conn.commit()
+        conn.close()
+        self.assertEqual(stats(), data)
+
+    # Results-TC4: Item analysis of an exam (p-values, discrimination, distractors, Cronbach's alpha)
+    def test_item_analysis(self):
+        now = datetime.utcnow()
+        # Q1 answers (single) and Q2 answers (multi), strongest students first
+        responses = [
+            (self.q1_op1, [self.q2_op1, self.q2_op3]),
+            (self.q1_op1, [self.q2_op1, self.q2_op3]),
+            (self.q1_op1, [self.q2_op1]),
+            (self.q1_op2, [self.q2_op2]),
+        ]
+        for roll_number, (q1_option, q2_options) in enumerate(responses, start=10):
+            db.session.add(Students(roll_number=roll_number, name=f"Student {roll_number}", email=f"s{roll_number}@test.com", password_hash="x"))
+            submission = Submissions(exam_id=self.exam.exam_id, roll_number=roll_number, started_at=now, submitted_at=now, status="SUBMITTED")
+            db.session.add(submission)
+            db.session.commit()
+            self.add_answers(submission, {
+                str(self.q1.question_id): q1_option.option_id,
+                str(self.q2.question_id): [option.option_id for option in q2_options]
+            })
+
+        with patch('flask_login.utils._get_user', return_value=self.instructor):
+            response = self.client.get(f"/api/exams/{self.exam.exam_id}/item-analysis")
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+
+        self.assertEqual(data["submission_count"], 4)
+        self.assertEqual(data["mean_score"], 8.75)  # 15, 15, 5, 0
+        q1, q2 = data["questions"]
+        self.assertEqual((q1["p_value"], q2["p_value"]), (0.75, 0.5))
+        self.assertGreater(q2["discrimination"], 0)
+
+        # Sample variances: items 6.25 and 33.33, scores 56.25
+        self.assertAlmostEqual(data["cronbach_alpha"], 2 * (1 - (6.25 + 100 / 3) / 56.25), places=3)
+
+        # The wrong option is only chosen by the weakest student
+        wrong = q2["options"][1]
+        self.assertEqual((wrong["selection_rate"], wrong["lower_rate"], wrong["upper_rate"]), (0.25, 1.0, 0.0))
+        self.assertLess(wrong["point_biserial"], 0)
+
+        # Unreadable selections count as none and don't shift the rows of the other students
+        malformed = Submissions(exam_id=self.exam.exam_id, roll_number=10, started_at=now, submitted_at=now, status="SUBMITTED")
+        db.session.add(malformed)
+        db.session.commit()
+        db.session.execute(text(
+            "INSERT INTO submission_answers (submission_id, question_id, selected_option_ids) VALUES (:s, :q1, '[1, '), (:s, :q2, :q2_options)"
+        ), {"s": malformed.submission_id, "q1": self.q1.question_id, "q2": self.q2.question_id,
+            "q2_options": f'["{self.q2_op2.option_id}", null]'})
+        db.session.commit()
+
+        option_ids = [self.q1_op1.option_id, self.q1_op2.option_id, self.q2_op2.option_id]
+        conn = get_db()
+        submission_ids, matrix = load_response_matrix(conn, self.exam.exam_id, option_ids)
+        conn.close()
+        self.assertEqual(submission_ids[-1], malformed.submission_id)
+        self.assertEqual(matrix.tolist(), [
+            [True, False, False], [True, False, False], [True, False, False], [False, True, True], [False, False, True]
+        ])
+
+        self.login_student()
+        response = self.client.get(f"/api/exams/{self.exam.exam_id}/item-analysis")
+        self.assertEqual(response.status_code, 403)
+
+    # Results-TC5: Item analysis of a larger exam stays within its time limit
+    def test_item_analysis_time(self):
+        students, questions = 2000, 50
+        rng = random.Random(5)
+
+        conn = get_db()
+        cur = conn.cursor()
+        option_ids = []
+        for number in range(questions):
+            cur.execute(
+                "INSERT INTO questions (exam_id, question_text, is_multiple_correct, points, order_index) VALUES (?, ?, ?, 1, ?)",
+                (self.exam.exam_id, f"Q{number + 3}?", number % 2, number + 3)
+            )
+            question_id = cur.lastrowid
+            cur.executemany(
+                "INSERT INTO options (question_id, option_text, is_correct) VALUES (?, ?, ?)",
+                [(question_id, f"Option {n}", n == 0) for n in range(4)]
+            )
+            cur.execute("SELECT option_id FROM options WHERE question_id = ?", (question_id,))
+            option_ids.append((question_id, [row[0] for row in cur.fetchall()]))
+
+        cur.executemany(
+            "INSERT INTO students (roll_number, name, email, password_hash) VALUES (?, ?, ?, 'x')",
+            [(n, f"Student {n}", f"s{n}@test.com") for n in range(2, students + 2)]
+        )
+        cur.executemany(
+            "INSERT INTO submissions (exam_id, roll_number, started_at, status) VALUES (?, ?, CURRENT_TIMESTAMP, 'SUBMITTED')",
+            [(self.exam.exam_id, n) for n in range(2, students + 2)]
+        )
+        cur.execute("SELECT submission_id FROM submissions WHERE exam_id = ?", (self.exam.exam_id,))
+        cur.executemany(
+            "INSERT INTO submission_answers (submission_id, question_id, selected_option_ids) VALUES (?, ?, ?)",
+            [
+                (submission_id, question_id, json.dumps(rng.sample(options, rng.choice((1, 2)))))
+                for (submission_id,) in cur.fetchall() for question_id, options in option_ids
+            ]
+        )
+        conn.commit()
+
+        started = time.perf_counter()
+        result = analyze_exam(conn, self.exam.exam_id)
+        elapsed = time.perf_counter() - started
+        conn.close()
+
+        self.assertEqual(result["submission_count"], students)
+        self.assertEqual(len(result["questions"]), questions + 2)
+        # 100k answer rows, a twentieth of 10k submissions x 200 questions (about 0.15s on a development machine)
+        self.assertLess(elapsed, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
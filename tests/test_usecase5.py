@@ -1,11 +1,21 @@
 import unittest
+import json
 from unittest.mock import patch
 import os
+import re
 from datetime import datetime, timedelta
 
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+
 from app import app, db, bcrypt
-from app.models import Courses, Students, Instructors, Exams, Questions, Options, Submissions
-from app.scheduler import close_exam
+from app.models import Courses, Students, Instructors, Exams, Questions, Options, Submissions, SubmissionAnswers, ExamStats
+from app.scheduler import scheduler, close_exam, bulk_close_submissions, schedule_exam_close, catch_up_closed_exams
+from app.grading import grade_many, grade_questions, get_answer_key
+from app.submission_answers import load_selections, to_option_ids
+from app.exam_cache import bump_exam_version, reset_exam_caches
+from app.take_exam.paper import get_exam_paper, order_paper
+from app.take_exam.take_exam import new_order_seed, finalize_submission
 
 ACTIVE_EXAM_CHECK_INTERVAL = int(os.getenv('ACTIVE_EXAM_CHECK_INTERVAL'))
 
@@ -25,6 +35,7 @@ class TestExamTakingUseCase(unittest.TestCase):
         # Rebuild DB
         db.drop_all()
         db.create_all()
+        reset_exam_caches()
 
         # Sample instructor
         self.instructor = Instructors(
@@ -92,6 +103,23 @@ class TestExamTakingUseCase(unittest.TestCase):
         patcher.start()
 
 
+    ########## Answer Helpers ##########
+    def add_answers(self, submission, answers):
+        db.session.add_all(
+            SubmissionAnswers(submission_id=submission.submission_id, question_id=int(qid), selected_option_ids=to_option_ids(answer))
+            for qid, answer in answers.items()
+        )
+        db.session.commit()
+
+    def saved_answers(self, submission):
+        return load_selections([submission.submission_id]).get(submission.submission_id, {})
+
+
+    ########## Response Helper ##########
+    def shown_question_order(self, html):
+        return [int(qid) for qid in re.findall(rb'name="questions-\d+-question_id" type="hidden" value="(\d+)"', html)]
+
+
     ########## Test Cases ##########
     # U5-TC1: Valid exam search
     def test_search_valid_exam(self):
@@ -267,7 +295,7 @@ class TestExamTakingUseCase(unittest.TestCase):
 
         self.assertIsNotNone(submission)
         self.assertEqual(submission.status, "IN_PROGRESS")
-        self.assertIsNotNone(submission.answers)
+        self.assertTrue(self.saved_answers(submission))
         self.assertIn(b"Welcome", response.data)
 
     # U5-TC9: Resume saved exam
@@ -280,17 +308,17 @@ class TestExamTakingUseCase(unittest.TestCase):
             roll_number = self.student.roll_number,
             started_at = now - timedelta(minutes=10),
             updated_at = now - timedelta(minutes=5),
-            status = "IN_PROGRESS",
-            answers = {
-                str(self.q1.question_id): self.q1_op1.option_id,
-                str(self.q2.question_id): [
-                    self.q2_op1.option_id,
-                    self.q2_op3.option_id
-                ]
-            }
+            status = "IN_PROGRESS"
         )
         db.session.add(submission)
         db.session.commit()
+        self.add_answers(submission, {
+            str(self.q1.question_id): self.q1_op1.option_id,
+            str(self.q2.question_id): [
+                self.q2_op1.option_id,
+                self.q2_op3.option_id
+            ]
+        })
 
         with self.client.session_transaction() as sess:
             sess["current_exam_id"] = self.exam.exam_id
@@ -317,8 +345,8 @@ class TestExamTakingUseCase(unittest.TestCase):
         # Make sure the submission is still in progress, and that the selected answers were saved
         self.assertIsNotNone(submission)
         self.assertEqual(submission.status, "IN_PROGRESS")
-        self.assertEqual(submission.answers[str(self.q1.question_id)], self.q1_op1.option_id)
-        self.assertEqual(submission.answers[str(self.q2.question_id)], [
+        self.assertEqual(self.saved_answers(submission)[self.q1.question_id], [self.q1_op1.option_id])
+        self.assertEqual(self.saved_answers(submission)[self.q2.question_id], [
             self.q2_op1.option_id,
             self.q2_op3.option_id
         ])
@@ -390,17 +418,17 @@ class TestExamTakingUseCase(unittest.TestCase):
             updated_at = now - timedelta(minutes=5),
             submitted_at = now - timedelta(minutes=5),
             status = "SUBMITTED",
-            answers = {
-                str(self.q1.question_id): self.q1_op1.option_id,
-                str(self.q2.question_id): [
-                    self.q2_op1.option_id,
-                    self.q2_op3.option_id
-                ]
-            },
             total_score = (self.q1.points + self.q2.points)
         )
         db.session.add(submission)
         db.session.commit()
+        self.add_answers(submission, {
+            str(self.q1.question_id): self.q1_op1.option_id,
+            str(self.q2.question_id): [
+                self.q2_op1.option_id,
+                self.q2_op3.option_id
+            ]
+        })
 
         response = self.client.post(
             "/take_exam",
@@ -435,17 +463,17 @@ class TestExamTakingUseCase(unittest.TestCase):
             roll_number = self.student.roll_number,
             started_at = now - timedelta(minutes=10),
             updated_at = now - timedelta(minutes=5),
-            status = "IN_PROGRESS",
-            answers = {
-                str(self.q1.question_id): self.q1_op1.option_id,
-                str(self.q2.question_id): [
-                    self.q2_op1.option_id,
-                    self.q2_op3.option_id
-                ]
-            }
+            status = "IN_PROGRESS"
         )
         db.session.add(submission)
         db.session.commit()
+        self.add_answers(submission, {
+            str(self.q1.question_id): self.q1_op1.option_id,
+            str(self.q2.question_id): [
+                self.q2_op1.option_id,
+                self.q2_op3.option_id
+            ]
+        })
 
         self.exam.closes_at = datetime.utcnow()
         db.session.commit()
@@ -488,29 +516,34 @@ class TestExamTakingUseCase(unittest.TestCase):
 
         self.assertIn(b"Time Left", response.data)
 
+        submission = Submissions.query.filter_by(
+            exam_id=self.exam.exam_id,
+            roll_number=self.student.roll_number
+        ).first()
+        self.assertIsNotNone(submission.order_seed)
+
+        # The order is derived from the seed stored on the submission, not kept in the session
+        paper = get_exam_paper(self.exam.exam_id)
+        expected_order = [q.question_id for q in order_paper(paper, submission.order_seed)]
+        self.assertEqual(self.shown_question_order(response.data), expected_order)
+
         with self.client.session_transaction() as sess:
-            order = sess.get("shuffled_order")
-
-        # I KNOW IT'S NOT DETERMINISTIC BUT THE CHANCE TO FAIL DUE TO UNLUCKY STREAK IS IMPOSSIBLY LOW
-        original_order = [self.q1.question_id, self.q2.question_id]
-        max_attempts = 30
-        attempt = 0
-        while order == original_order and attempt < max_attempts:
-            attempt += 1
-            with self.client.session_transaction() as sess:
-                    sess.pop("shuffled_order", None)
-
-            response = self.client.get(
-                "/take_exam/start",
-                follow_redirects=True
-            )
-            self.assertIn(b"Time Left", response.data)
+            self.assertNotIn("shuffled_order", sess)
 
-            with self.client.session_transaction() as sess:
-                order = sess.get("shuffled_order")
+        # Reloading the page keeps the same order
+        response = self.client.get("/take_exam/start", follow_redirects=True)
+        self.assertEqual(self.shown_question_order(response.data), expected_order)
 
-        self.assertIn(b"Time Left", response.data)
-        self.assertNotEqual(order, original_order)
+        # Different seeds give different orders
+        original_order = (self.q1.question_id, self.q2.question_id)
+        orders = {tuple(q.question_id for q in order_paper(paper, seed)) for seed in range(32)}
+        self.assertIn(original_order, orders)
+        self.assertIn(original_order[::-1], orders)
+
+        # Every submission gets its own seed, unless the number of variants is capped
+        self.assertEqual(len({new_order_seed() for _ in range(10)}), 10)
+        with patch("app.take_exam.take_exam.SHUFFLE_VARIANTS", 4):
+            self.assertIn(new_order_seed(), range(4))
 
     # U5-TC14: Single session exams
     def test_single_session(self):
@@ -541,5 +574,328 @@ class TestExamTakingUseCase(unittest.TestCase):
         self.assertIn(b"Only a single session per student is allowed", initResponse.data)
         self.assertIn(b"Only a single session per student is allowed", startResponse.data)
 
+    # U5-TC15: Batch grading of several submissions
+    def test_batch_grading(self):
+        now = datetime.utcnow()
+        full, extra, partial, empty = [
+            Submissions(
+                exam_id=self.exam.exam_id, roll_number=self.student.roll_number,
+                started_at=now, updated_at=now, status="SUBMITTED"
+            )
+            for _ in range(4)
+        ]
+        db.session.add_all([full, extra, partial, empty])
+        db.session.commit()
+        self.add_answers(full, {
+            str(self.q1.question_id): self.q1_op1.option_id,
+            str(self.q2.question_id): [self.q2_op1.option_id, self.q2_op3.option_id]
+        })
+        self.add_answers(extra, {
+            str(self.q2.question_id): [self.q2_op1.option_id, self.q2_op2.option_id, self.q2_op3.option_id]
+        })
+        self.add_answers(partial, {
+            str(self.q2.question_id): [self.q2_op1.option_id, self.q2_op2.option_id]
+        })
+
+        points = grade_many([full, extra, partial, empty])
+
+        # Multi-answer questions are correct when all correct options are selected, missing one makes them incorrect
+        self.assertEqual(points[full.submission_id], {self.q1.question_id: self.q1.points, self.q2.question_id: self.q2.points})
+        self.assertEqual(points[extra.submission_id], {self.q2.question_id: self.q2.points})
+        self.assertEqual(points[partial.submission_id], {self.q2.question_id: 0})
+        self.assertEqual(points[empty.submission_id], {})
+
+    # U5-TC16: Cached answer key is rebuilt after the exam is edited
+    def test_answer_key_cache_invalidation(self):
+        answer_key = get_answer_key(self.exam.exam_id)
+        self.assertIs(get_answer_key(self.exam.exam_id), answer_key)
+        self.assertEqual(answer_key[self.q1.question_id].correct_ids, {self.q1_op1.option_id})
+
+        self.q1_op1.is_correct = False
+        self.q1_op2.is_correct = True
+        db.session.commit()
+        bump_exam_version(self.exam.exam_id)
+
+        answer_key = get_answer_key(self.exam.exam_id)
+        self.assertEqual(answer_key[self.q1.question_id].correct_ids, {self.q1_op2.option_id})
+
+    # U5-TC26: The exam paper is loaded with one query and cached until the exam is edited
+    def test_exam_paper_single_query(self):
+        exam_id = self.exam.exam_id
+        question_ids = [self.q1.question_id, self.q2.question_id]
+        q2_choices = ((self.q2_op1.option_id, "Correct"), (self.q2_op2.option_id, "Wrong"), (self.q2_op3.option_id, "Correct"))
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", count)
+
+        paper = get_exam_paper(exam_id)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual([q.question_id for q in paper], question_ids)
+        self.assertEqual(paper[1].choices, q2_choices)
+        self.assertTrue(paper[1].is_multiple_correct)
+
+        # Cached, and immutable so requests can't change it for each other
+        self.assertIs(get_exam_paper(exam_id), paper)
+        self.assertEqual(len(statements), 1)
+        with self.assertRaises(AttributeError):
+            paper[0].points = 0
+
+        # Editing the exam reloads it
+        db.session.add(Options(question_id=question_ids[0], option_text="Also wrong", is_correct=False))
+        db.session.commit()
+        bump_exam_version(exam_id)
+        statements.clear()
+
+        self.assertEqual(len(get_exam_paper(exam_id)[0].choices), 3)
+        self.assertEqual(len(statements), 1)
+
+    # U5-TC17: Saved answers are shown on the cached exam paper
+    def test_resume_shows_saved_answers(self):
+        self.login_student()
+
+        now = datetime.utcnow()
+        submission = Submissions(
+            exam_id=self.exam.exam_id, roll_number=self.student.roll_number,
+            started_at=now, updated_at=now - timedelta(minutes=5), status="IN_PROGRESS"
+        )
+        db.session.add(submission)
+        db.session.commit()
+        self.add_answers(submission, {str(self.q1.question_id): self.q1_op2.option_id})
+
+        with self.client.session_transaction() as sess:
+            sess["current_submission_id"] = submission.submission_id
+            sess["current_exam_id"] = self.exam.exam_id
+
+        # First load renders the paper, the second one reuses it with other answers
+        self.client.get("/take_exam/start")
+        db.session.get(SubmissionAnswers, (submission.submission_id, self.q1.question_id)).selected_option_ids = [self.q1_op1.option_id]
+        db.session.commit()
+        response = self.client.get("/take_exam/start")
+
+        self.assertIn(f'value="{self.q1_op1.option_id}" data-option="{self.q1_op1.option_id}" checked'.encode(), response.data)
+        self.assertNotIn(f'data-option="{self.q1_op2.option_id}" checked'.encode(), response.data)
+
+    # U5-TC18: Delta autosave with answer patches
+    def test_autosave_patch(self):
+        self.login_student()
+
+        now = datetime.utcnow()
+        submission = Submissions(
+            exam_id=self.exam.exam_id, roll_number=self.student.roll_number,
+            started_at=now, updated_at=now, status="IN_PROGRESS"
+        )
+        db.session.add(submission)
+        db.session.commit()
+        self.add_answers(submission, {str(self.q1.question_id): self.q1_op2.option_id})
+
+        with self.client.session_transaction() as sess:
+            sess["current_submission_id"] = submission.submission_id
+
+        # Only the patched question changes
+        response = self.client.post("/take_exam/autosave/v2", json={
+            "seq": 1, "answers": {str(self.q2.question_id): [self.q2_op1.option_id]}
+        })
+        self.assertEqual(response.get_json()["status"], "saved")
+
+        self.assertEqual(self.saved_answers(submission), {
+            self.q1.question_id: [self.q1_op2.option_id],
+            self.q2.question_id: [self.q2_op1.option_id]
+        })
+
+        # Stale sequence numbers are ignored
+        response = self.client.post("/take_exam/autosave/v2", json={
+            "seq": 1, "answers": {str(self.q1.question_id): self.q1_op1.option_id}
+        })
+        self.assertEqual(response.get_json()["status"], "stale")
+        self.assertEqual(self.saved_answers(submission)[self.q1.question_id], [self.q1_op2.option_id])
+
+        # Even requests that don't write answers count as activity, stored on the submission
+        db.session.expire_all()
+        submission = Submissions.query.get(submission.submission_id)
+        self.assertIsNotNone(submission.last_seen_at)
+        self.assertGreaterEqual(submission.last_seen_at, now)
+
+        # Options of another question are rejected
+        response = self.client.post("/take_exam/autosave/v2", json={
+            "seq": 2, "answers": {str(self.q1.question_id): self.q2_op1.option_id}
+        })
+        self.assertEqual(response.status_code, 400)
+
+    # U5-TC19: Write-behind autosaves are flushed before the exam is closed
+    def test_autosave_write_behind(self):
+        self.login_student()
+        patcher = patch('app.take_exam.take_exam.AUTOSAVE_WRITE_BEHIND', True)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        now = datetime.utcnow()
+        submission = Submissions(
+            exam_id=self.exam.exam_id, roll_number=self.student.roll_number,
+            started_at=now, updated_at=now, status="IN_PROGRESS"
+        )
+        db.session.add(submission)
+        db.session.commit()
+
+        with self.client.session_transaction() as sess:
+            sess["current_submission_id"] = submission.submission_id
+
+        self.client.post("/take_exam/autosave/v2", json={
+            "seq": 1, "answers": {str(self.q1.question_id): self.q1_op1.option_id}
+        })
+        self.client.post("/take_exam/autosave/v2", json={
+            "seq": 2, "answers": {str(self.q2.question_id): [self.q2_op1.option_id, self.q2_op3.option_id]}
+        })
+
+        # Nothing is written until the buffer is flushed
+        db.session.expire_all()
+        self.assertEqual(self.saved_answers(submission), {})
+
+        close_exam(self.exam.exam_id)
+
+        db.session.expire_all()
+        submission = Submissions.query.get(submission.submission_id)
+        self.assertEqual(submission.autosave_seq, 2)
+        self.assertEqual(submission.status, "SUBMITTED")
+        self.assertEqual(submission.total_score, (self.q1.points + self.q2.points))
+
+    # U5-TC20: Closing an exam grades all submissions in chunked batches
+    def test_bulk_close_in_batches(self):
+        now = datetime.utcnow()
+        submissions = []
+        for roll_number in range(2, 7):
+            db.session.add(Students(roll_number=roll_number, name=f"Student {roll_number}", email=f"s{roll_number}@test.com", password_hash="x"))
+            submissions.append(Submissions(
+                exam_id=self.exam.exam_id, roll_number=roll_number,
+                started_at=now, updated_at=now, status="IN_PROGRESS"
+            ))
+        db.session.add_all(submissions)
+        db.session.commit()
+        for submission in submissions:
+            self.add_answers(submission, {
+                str(self.q1.question_id): self.q1_op1.option_id if submission.roll_number % 2 else self.q1_op2.option_id
+            })
+
+        closed = bulk_close_submissions(self.exam.exam_id, batch_size=2)
+        db.session.expire_all()
+
+        self.assertEqual(closed, 5)
+        for submission in submissions:
+            self.assertEqual(submission.status, "SUBMITTED")
+            self.assertIsNotNone(submission.submitted_at)
+            self.assertEqual(submission.total_score, self.q1.points if submission.roll_number % 2 else 0)
+
+    # U5-TC25: A submission handed in while the exam is being closed keeps its own points and is counted once
+    def test_bulk_close_skips_submitted_in_between(self):
+        now = datetime.utcnow()
+        db.session.add(Students(roll_number=2, name="Student 2", email="s2@test.com", password_hash="x"))
+        submission = Submissions(
+            exam_id=self.exam.exam_id, roll_number=self.student.roll_number,
+            started_at=now, updated_at=now, status="IN_PROGRESS"
+        )
+        other = Submissions(exam_id=self.exam.exam_id, roll_number=2, started_at=now, updated_at=now, status="IN_PROGRESS")
+        db.session.add_all([submission, other])
+        db.session.commit()
+        self.add_answers(submission, {str(self.q1.question_id): self.q1_op2.option_id})
+        self.add_answers(other, {str(self.q1.question_id): self.q1_op1.option_id})
+
+        # The student corrects their answer and submits after the answers were loaded and graded for closing
+        def grade_then_submit(answer_key, selections):
+            points = grade_questions(answer_key, selections)
+            if submission.status == "IN_PROGRESS":
+                db.session.get(SubmissionAnswers, (submission.submission_id, self.q1.question_id)).selected_option_ids = [self.q1_op1.option_id]
+                finalize_submission(submission)
+                db.session.commit()
+            return points
+
+        with patch('app.scheduler.grade_questions', side_effect=grade_then_submit):
+            closed = bulk_close_submissions(self.exam.exam_id)
+        db.session.expire_all()
+
+        self.assertEqual(closed, 1)
+        self.assertEqual(submission.total_score, self.q1.points)
+        self.assertEqual(db.session.get(SubmissionAnswers, (submission.submission_id, self.q1.question_id)).auto_points, self.q1.points)
+        self.assertEqual(other.status, "SUBMITTED")
+        self.assertEqual(db.session.get(ExamStats, self.exam.exam_id).submission_count, 2)
+
+    # U5-TC21: Closing timers follow the exam's closing time
+    def test_schedule_exam_close(self):
+        job_id = f"close_{self.exam.exam_id}"
+        self.addCleanup(lambda: scheduler.get_job(job_id) and scheduler.remove_job(job_id))
+
+        self.assertTrue(schedule_exam_close(self.exam.exam_id, self.exam.closes_at))
+        self.assertIsNotNone(scheduler.get_job(job_id))
+
+        # Moving the closing time replaces the timer instead of adding another one
+        self.assertTrue(schedule_exam_close(self.exam.exam_id, self.exam.closes_at + timedelta(hours=1)))
+        self.assertEqual(len([job for job in scheduler.get_jobs() if job.id == job_id]), 1)
+
+        # Closing times in the past remove the timer
+        self.assertFalse(schedule_exam_close(self.exam.exam_id, datetime.utcnow() - timedelta(minutes=1)))
+        self.assertIsNone(scheduler.get_job(job_id))
+
+    # U5-TC22: Exams that closed while the app was down are auto-submitted on startup
+    def test_catch_up_closed_exams(self):
+        now = datetime.utcnow()
+        submission = Submissions(
+            exam_id=self.exam.exam_id, roll_number=self.student.roll_number,
+            started_at=now - timedelta(hours=2), updated_at=now - timedelta(hours=1), status="IN_PROGRESS"
+        )
+        db.session.add(submission)
+        self.exam.closes_at = now - timedelta(minutes=30)
+        db.session.commit()
+        self.add_answers(submission, {str(self.q1.question_id): self.q1_op1.option_id})
+
+        self.assertEqual(catch_up_closed_exams(), 1)
+
+        db.session.expire_all()
+        submission = Submissions.query.get(submission.submission_id)
+        self.assertEqual(submission.status, "SUBMITTED")
+        self.assertEqual(submission.total_score, self.q1.points)
+
+        # Nothing is left to catch up afterwards
+        self.assertEqual(catch_up_closed_exams(), 0)
+
+    # U5-TC23: The hot-path lookups are served by indexes instead of table scans
+    def test_hot_path_queries_use_indexes(self):
+        queries = {
+            "ix_submissions_roll_number_status": "SELECT * FROM submissions WHERE roll_number = 1 AND status = 'IN_PROGRESS'",
+            "ix_submissions_exam_id_status": "SELECT * FROM submissions WHERE exam_id = 1 AND status = 'IN_PROGRESS'",
+            "ix_questions_exam_id_order_index": "SELECT * FROM questions WHERE exam_id = 1 ORDER BY order_index",
+            "ix_options_question_id": "SELECT * FROM options WHERE question_id = 1",
+        }
+
+        for index, query in queries.items():
+            plan = " ".join(row[-1] for row in db.session.execute(db.text(f"EXPLAIN QUERY PLAN {query}")))
+            self.assertIn(index, plan, query)
+            self.assertNotIn("TEMP B-TREE", plan, query)
+
+    # U5-TC24: Accepting the conditions twice reuses the in-progress submission
+    def test_single_in_progress_submission(self):
+        self.login_student()
+
+        with self.client.session_transaction() as sess:
+            sess["current_exam_id"] = self.exam.exam_id
+
+        for _ in range(2):
+            self.client.post("/take_exam/initialization", data={"accept": True})
+
+        submissions = Submissions.query.filter_by(roll_number=self.student.roll_number).all()
+        self.assertEqual(len(submissions), 1)
+
+        # The database itself rejects a second in-progress row
+        now = datetime.utcnow()
+        db.session.add(Submissions(
+            exam_id=self.exam.exam_id, roll_number=self.student.roll_number,
+            started_at=now, updated_at=now, status="IN_PROGRESS"
+        ))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
 if __name__ == "__main__":
     unittest.main()